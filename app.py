@@ -14,7 +14,6 @@ eventlet.monkey_patch()
 import ast
 import hashlib
 import inspect
-import joblib
 import os
 try:
     os.getcwd()
@@ -31,18 +30,17 @@ from flask import (Flask, current_app, flash, jsonify, redirect,
                    render_template, render_template_string, request,
                    session, url_for)
 from flask_socketio import SocketIO
-from imap_tools import AND, MailBox, MailMessageFlags
-from sklearn.naive_bayes import MultinomialNB
 from urllib.parse import unquote, unquote_plus
 
 from core.auth import get_accounts_for_user, verify_user
-from core.config import (ERROR_LOG_FILE, LOG_BASE, LOG_FILE, MODEL_BASE,
-                        MODEL_PATH, SPAM_LOG_FILE, SYSTEM_LOG_FILE,
-                        VECTORIZER_PATH, get_user_log_path)
+from core.config import (ERROR_LOG_FILE, HUB_WATCHDOG, LOG_BASE, LOG_FILE,
+                        SPAM_LOG_FILE, SYSTEM_LOG_FILE, get_user_log_path)
 from core.crypto import decrypt, encrypt
 from core.database import get_db_connection
-from core.logger import (get_error_logger, setup_main_logger,
-                         write_error_log, write_train_log)
+from core.feedback import LABEL_HAM, LABEL_SPAM, enqueue_feedback
+from core.logger import get_error_logger, setup_main_logger, write_error_log
+from core.model_store import mail_text
+from core.offload import HubWatchdog, run_blocking
 
 
 ##################################
@@ -197,27 +195,30 @@ def edit_account(cursor, conn, user_id, account_id):
             'trash_folder': request.form["trash_folder"].strip(),
             'junk_folder': request.form["junk_folder"].strip(),
             'x_spam_level': int(request.form["x_spam_level"].strip()),
-            'spam_filter_active': 1 if request.form.get("spam_filter_active") else 0
+            'spam_filter_active': 1 if request.form.get("spam_filter_active") else 0,
+            'train_weight': max(float(request.form.get("train_weight") or 1.0), 0.0)
         }
         
         if password := request.form["password"].strip():
-            updates['password_enc'] = encrypt(password)
+            updates['password_enc'] = run_blocking(encrypt, password)
             query = """
                 UPDATE accounts 
-                SET username = ?, server = ?, password_enc = ?, junk_folder = ?, trash_folder = ?, x_spam_level = ?, spam_filter_active = ?
+                SET username = ?, server = ?, password_enc = ?, junk_folder = ?, trash_folder = ?, x_spam_level = ?, spam_filter_active = ?,
+                    train_weight = ?, config_version = COALESCE(config_version, 0) + 1
                 WHERE id = ? AND user_id = ?
             """
             params = (
-                updates['username'], updates['server'], updates['password_enc'], updates['junk_folder'], updates['trash_folder'], updates['x_spam_level'], updates['spam_filter_active'], account_id, user_id
+                updates['username'], updates['server'], updates['password_enc'], updates['junk_folder'], updates['trash_folder'], updates['x_spam_level'], updates['spam_filter_active'], updates['train_weight'], account_id, user_id
             )
         else:
             query = """
                 UPDATE accounts 
-                SET username = ?, server = ?, junk_folder = ?, trash_folder = ?, x_spam_level = ?, spam_filter_active = ?
+                SET username = ?, server = ?, junk_folder = ?, trash_folder = ?, x_spam_level = ?, spam_filter_active = ?,
+                    train_weight = ?, config_version = COALESCE(config_version, 0) + 1
                 WHERE id = ? AND user_id = ?
             """
             params = (
-                updates['username'], updates['server'], updates['junk_folder'], updates['trash_folder'], updates['x_spam_level'], updates['spam_filter_active'], account_id, user_id
+                updates['username'], updates['server'], updates['junk_folder'], updates['trash_folder'], updates['x_spam_level'], updates['spam_filter_active'], updates['train_weight'], account_id, user_id
             )
         
         cursor.execute(query, params)
@@ -241,7 +242,7 @@ def accounts():
         junk_folder = request.form["junk_folder"].strip()
         trash_folder = request.form["trash_folder"].strip()
         spam_filter_active = 1 if request.form.get("spam_filter_active") == "on" else 0
-        encrypted_pw = encrypt(password)
+        encrypted_pw = run_blocking(encrypt, password)
 
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -606,7 +607,7 @@ def mark_ham():
         return redirect(url_for("inbox"))
 
     try:
-        password = decrypt(acc["password_enc"])
+        password = run_blocking(decrypt, acc["password_enc"])
     except Exception:
         flash("Fehler beim Entschlüsseln des Passworts", "error")
         return redirect(url_for("index", account=account_id))
@@ -622,25 +623,20 @@ def mark_ham():
                 flash("Mail nicht gefunden", "error")
                 return redirect(url_for("index", account=account_id))
 
-            mail = {
-                "uid": msg.uid,
-                "from_": msg.from_,
-                "subject": msg.subject or "",
-                "text": msg.text or "",
-                "raw": msg.obj.as_string()
-            }
+            # MIME-Teile dekodieren kostet CPU – im Thread-Pool
+            mail = run_blocking(imap_mail_dict, msg)
 
     except Exception as e:
         flash(f"Verbindungsfehler: {e}", "error")
         return redirect(url_for("index", account=account_id))
 
-    # Modell trainieren mit Label "ham"
+    # Mail zum Training mit Label "ham" vormerken
     train_model(account_id, mail, label="ham")
 
     # Whitelist-Eintrag in SQLite
     add_to_whitelist_sqlite(user_id, account_id, mail["from_"])
 
-    flash("Als kein Spam markiert, trainiert und Whitelist aktualisiert.", "success")
+    flash("Als kein Spam markiert, zum Training vorgemerkt und Whitelist aktualisiert.", "success")
     return redirect(url_for("index", account=account_id))
 
 @app.route("/mark_read", methods=["POST"])
@@ -662,10 +658,12 @@ def mark_read():
         return redirect(url_for("index"))
 
     try:
-        password = decrypt(acc["password_enc"])
+        password = run_blocking(decrypt, acc["password_enc"])
     except Exception:
         return "Fehler beim Entschlüsseln des Passworts", 500
 
+    from imap_tools import MailBox
+
     try:
         with MailBox(acc["server"]).login(acc["username"], password) as mailbox:
             mailbox.folder.set("INBOX")
@@ -851,11 +849,10 @@ def api_delete_mail(cursor, conn, user_id):
 @db_handler
 def api_mark_ham(cursor, conn, user_id):
     """
-    Markiert eine Mail als 'Ham', trainiert optional und fügt EINE Whitelist-Regel hinzu:
+    Markiert eine Mail als 'Ham', merkt sie zum Training vor und fügt EINE Whitelist-Regel hinzu:
     - scope='address'  -> exact: user@example.com
     - scope='domain'   -> wildcard: *@example.com
     """
-    username = session.get("username")
     data = request.get_json() or {}
     mail_id = data.get("id")
     scope   = (data.get("scope") or "address").strip().lower()  # 'address' | 'domain'
@@ -865,7 +862,7 @@ def api_mark_ham(cursor, conn, user_id):
 
     # Mail-Daten
     cursor.execute("""
-        SELECT id, subject, body, raw, account_id, sender
+        SELECT id, uid, subject, body, html_raw, account_id, sender
         FROM mails
         WHERE user_id = ? AND id = ?
     """, (user_id, mail_id))
@@ -874,7 +871,6 @@ def api_mark_ham(cursor, conn, user_id):
         return jsonify({"status": "not found", "message": "Mail nicht gefunden"}), 404
 
     subject = row["subject"] or ""
-    body    = row["body"] or row["raw"] or ""
 
     from email.utils import parseaddr
     _, email_addr = parseaddr(row["sender"] or "")
@@ -890,16 +886,11 @@ def api_mark_ham(cursor, conn, user_id):
         # default: address
         whitelist_value = email_addr
 
-    # Optionales Training (best effort)
+    # Training vormerken (best effort) – feedback_trainer.py trainiert im Hintergrund
     try:
-        model_path      = os.path.join(MODEL_BASE, username, "spam_model.pkl")
-        vectorizer_path = os.path.join(MODEL_BASE, username, "spam_vectorizer.pkl")
-        if os.path.exists(vectorizer_path):
-            vectorizer = joblib.load(vectorizer_path)
-            X = vectorizer.transform([subject + "\n" + body])
-            model = joblib.load(model_path) if os.path.exists(model_path) else MultinomialNB()
-            model.partial_fit(X, [0], classes=[0, 1])  # 0 = ham
-            joblib.dump(model, model_path)
+        text = run_blocking(mail_text, subject, row["body"], row["html_raw"])
+        enqueue_feedback(user_id, row["account_id"], text, LABEL_HAM,
+                         "api_mark_ham", subject, conn=conn, uid=row["uid"], sender=row["sender"])
     except Exception as e:
         error_logger.warning(f"⚠️ Training übersprungen in api_mark_ham(): {e}")
 
@@ -944,7 +935,7 @@ def api_mark_read(cursor, conn, user_id):
             return jsonify({"status": "not found", "message": "Mail nicht gefunden"}), 404
 
         # 2) Sofort auf IMAP als gelesen markieren
-        password = decrypt(mail_data["password_enc"])
+        password = run_blocking(decrypt, mail_data["password_enc"])
         from imap_tools import MailBox
         with MailBox(mail_data["server"]).login(mail_data["username"], password) as mailbox:
             mailbox.folder.set("INBOX")
@@ -1175,11 +1166,20 @@ def extract_domain(addr):
 def extract_features(mail):
     """
     Extrahiert Textfeatures aus einer Mail, geeignet für den Vektorizer.
-    Erwartet: mail["subject"], mail["text"] (alternativ raw oder leer)
+    Erwartet: mail["subject"], mail["text"] (alternativ mail["html"])
     """
-    subject = mail.get("subject", "")
-    body = mail.get("text", "") or mail.get("raw", "")
-    return subject + "\n" + body
+    return mail_text(mail.get("subject", ""), mail.get("text", ""), mail.get("html", ""))
+
+def imap_mail_dict(msg):
+    """Felder einer imap_tools-Nachricht für Training und Whitelist."""
+    return {
+        "uid": msg.uid,
+        "from_": msg.from_,
+        "subject": msg.subject or "",
+        "text": msg.text or "",
+        "html": msg.html or "",
+        "raw": msg.obj.as_string()
+    }
 
 def format_log_lines(lines):
     html = ""
@@ -1209,19 +1209,6 @@ def is_whitelisted(sender, entries):
             return True
     return False
 
-def load_model(model_path):
-    """Lädt das Modell, wenn es existiert. Sonst None."""
-    if os.path.exists(model_path):
-        return joblib.load(model_path)
-    else:
-        return None
-
-def load_vectorizer(vectorizer_path):
-    if os.path.exists(vectorizer_path):
-        return joblib.load(vectorizer_path)
-    else:
-        return None
-
 def parse_log_file(path, logtype):
     entries = []
     try:
@@ -1285,49 +1272,11 @@ def read(path):
     except Exception as e:
         return [f"[Fehler beim Lesen: {e}]"]
 
-def save_model(model, model_path):
-    """Speichert das Modell an gegebener Stelle"""
-    joblib.dump(model, model_path)
-
 def train_model(account_id, mail, label="ham"):
-    user_dir = os.path.join(MODEL_BASE, session["username"])
-    os.makedirs(user_dir, exist_ok=True)
-
-    model_path = os.path.join(user_dir, "spam_model.pkl")
-    vectorizer_path = os.path.join(user_dir, "spam_vectorizer.pkl")
-
-    text = extract_features(mail)
-    y_label = 0 if label == "ham" else 1  # 0 = kein Spam, 1 = Spam
-
-    # Vektorizer laden oder abbrechen
-    if not os.path.exists(vectorizer_path):
-        write_train_log(session["user_id"], account_id, "❌ Kein Vektorizer vorhanden – Training abgebrochen.")
-        return
-
-    vectorizer = joblib.load(vectorizer_path)
-    X = vectorizer.transform([text])
-
-    # Modell laden oder initialisieren
-    if os.path.exists(model_path):
-        model = joblib.load(model_path)
-    else:
-        model = MultinomialNB()
-
-    # Vorherige Counts sichern
-    prev_counts = list(model.class_count_) if hasattr(model, "class_count_") else [0, 0]
-
-    # Training
-    model.partial_fit(X, [y_label], classes=[0, 1])
-    new_counts = list(model.class_count_)
-
-    joblib.dump(model, model_path)
-
-    log_line = (
-        f"✅ Training ({label}): Betreff={mail.get('subject', '')} – "
-        f"Klassen: {model.classes_.tolist()}, "
-        f"Counts vorher: {prev_counts}, nachher: {new_counts}"
-    )
-    write_train_log(session["user_id"], account_id, log_line)
+    """Merkt die Mail zum Training vor; feedback_trainer.py wendet sie gebündelt an."""
+    y_label = LABEL_HAM if label == "ham" else LABEL_SPAM
+    enqueue_feedback(session["user_id"], account_id, run_blocking(extract_features, mail), y_label,
+                     f"mark_{label}", mail.get("subject", ""), uid=mail.get("uid"), sender=mail.get("from_"))
 
 ##################################
 #         Template Filters       #
@@ -1346,4 +1295,8 @@ def decode_header_filter(text):
 #          Main Execution        #
 ##################################
 if __name__ == '__main__':
+    # Meldet Requests, die den eventlet-Hub (und damit alle Socket.IO-Clients) anhalten –
+    # nur im Serverbetrieb, nicht schon beim Import (Tests, Werkzeuge, dev/import_budget.py)
+    if HUB_WATCHDOG:
+        HubWatchdog().start()
     socketio.run(app, host='0.0.0.0', port=80, debug=False)
\ No newline at end of file
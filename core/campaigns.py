@@ -0,0 +1,115 @@
+# core/campaigns.py
+# Erkennung von Spam-Wellen über SimHash-Fingerabdrücke.
+#
+# Jede vom Modell bewertete Mail hinterlässt einen 64-Bit-SimHash ihres aufbereiteten
+# Textes (Betreff + Body, siehe core/text_extract.py) samt Urteil. Trifft innerhalb von
+# CAMPAIGN_WINDOW Sekunden eine Mail ein, deren Fingerabdruck höchstens
+# CAMPAIGN_MAX_DISTANCE Bits abweicht, übernimmt der Watcher das Urteil direkt –
+# ohne Vektorisierung und Modell. Gesucht wird über vier 16-Bit-Bänder: Bei bis zu
+# drei abweichenden Bits stimmt mindestens ein Band exakt überein.
+#
+# Der Index lebt im Speicher des Watcher-Prozesses. Mit CAMPAIGN_SCOPE = "user" gelten
+# Urteile nur für die Konten desselben Benutzers; mit "global" werden Spam-Urteile über
+# alle Benutzer geteilt (Ham bleibt immer benutzerbezogen).
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from core import metrics
+from core.config import (CAMPAIGN_MAX_DISTANCE, CAMPAIGN_MAX_ENTRIES, CAMPAIGN_MIN_TOKENS,
+                         CAMPAIGN_SCOPE, CAMPAIGN_WINDOW)
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+_TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(text, min_tokens=CAMPAIGN_MIN_TOKENS):
+    """64-Bit-SimHash über die Wörter eines Textes (gewichtet nach Häufigkeit) oder None bei zu wenig Text."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) < min_tokens:
+        return None
+    unique, counts = np.unique(np.array(tokens, dtype=object), return_counts=True)
+    hashes = np.fromiter((_token_hash(token) for token in unique), dtype=np.uint64, count=len(unique))
+    bits = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).astype(np.int8)
+    votes = counts @ (2 * bits - 1).astype(np.int64)
+    return int(np.dot((votes > 0).astype(np.uint64), np.uint64(1) << _BIT_SHIFTS))
+
+
+def _bands(fingerprint):
+    mask = (1 << BAND_BITS) - 1
+    return [(i, (fingerprint >> (i * BAND_BITS)) & mask) for i in range(BANDS)]
+
+
+class CampaignIndex:
+    """Fingerabdrücke der letzten Zeit mit Urteil; threadsicher, nach Zeit und Anzahl begrenzt."""
+
+    def __init__(self, window=CAMPAIGN_WINDOW, max_entries=CAMPAIGN_MAX_ENTRIES,
+                 max_distance=CAMPAIGN_MAX_DISTANCE, scope=CAMPAIGN_SCOPE):
+        self.window = window
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.scope = scope
+        self._entries = OrderedDict()  # id -> (zeit, fingerabdruck, user_id, ist_spam)
+        self._bands = {}               # (band, wert) -> set(ids)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, entry_id):
+        _, fingerprint, _, _ = self._entries.pop(entry_id)
+        for key in _bands(fingerprint):
+            ids = self._bands.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._bands[key]
+
+    def _expire(self, now):
+        while self._entries:
+            entry_id, (added, _, _, _) = next(iter(self._entries.items()))
+            if now - added <= self.window and len(self._entries) <= self.max_entries:
+                break
+            self._remove(entry_id)
+
+    def lookup(self, fingerprint, user_id):
+        """Urteil (True = Spam, False = Ham) einer ähnlichen Mail aus dem Zeitfenster oder None."""
+        if fingerprint is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            best = None
+            for key in _bands(fingerprint):
+                for entry_id in self._bands.get(key, ()):
+                    _, other, other_user, is_spam = self._entries[entry_id]
+                    if other_user != user_id and not (self.scope == "global" and is_spam):
+                        continue
+                    distance = (fingerprint ^ other).bit_count()
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, is_spam)
+        metrics.incr("campaign_hits" if best else "campaign_misses")
+        return best[1] if best else None
+
+    def add(self, fingerprint, user_id, is_spam):
+        if fingerprint is None:
+            return
+        now = time.time()
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (now, fingerprint, user_id, bool(is_spam))
+            for key in _bands(fingerprint):
+                self._bands.setdefault(key, set()).add(entry_id)
+            self._expire(now)
+            size = len(self._entries)
+        metrics.set_gauge("campaign_entries", size)
@@ -12,6 +12,121 @@ ERROR_LOG_FILE = f"{LOG_BASE}/mailfilter.error.log"
 SPAM_LOG_FILE = f"{LOG_BASE}/spam_filter.log"
 SYSTEM_LOG_FILE = f"{LOG_BASE}/system.log"
 
+# Featurizer für neu trainierte Modelle: "tfidf" (Vokabular je Nutzer) oder
+# "hashing" (HashingVectorizer, kein Vokabular – partial_fit lernt auch neue Wörter)
+FEATURIZER_MODE = "tfidf"
+# Größe des Hash-Raums: Modell und IDF halten je Merkmal dichte Arrays (2**16 ≈ 2,5 MB je
+# Benutzer auf der Platte, 2**18 ≈ 10 MB); bereits trainierte Modelle behalten ihre Größe
+HASHING_N_FEATURES = 2 ** 16
+# Online-IDF für den Hashing-Modus (Dokumenthäufigkeiten werden mittrainiert)
+HASHING_ONLINE_IDF = True
+TFIDF_STOP_WORDS = "english"
+# Ab dieser Spam-Wahrscheinlichkeit (predict_proba) gilt eine Mail als Spam
+SPAM_THRESHOLD = 0.5
+# Anzahl der aufbewahrten Modellversionen je Benutzer (MODEL_BASE/<user>/versions)
+MODEL_KEEP_VERSIONS = 3
+# Modelle zur Klassifikation schreibgeschützt per mmap laden (geteilter Page-Cache)
+MODEL_MMAP = True
+# Modell-Layout: "user" = eigener Featurizer und eigenes Modell je Benutzer, "shared" = ein
+# gemeinsames Basis-Vokabular samt IDF und Basis-Modell aus dem Korpus aller Benutzer
+# (spam_model_trainer.py --base), je Benutzer nur dessen Klassenzählungen als Delta darauf
+MODEL_LAYOUT = "user"
+# Basis-Vokabular: nur Wörter aus mindestens so vielen Mails des gemeinsamen Korpus
+SHARED_BASE_MIN_DF = 3
+# Gewicht des Basis-Modells in Mails: so viel zählt es neben den eigenen Beispielen eines Benutzers
+SHARED_BASE_PRIOR = 200
+# Textaufbereitung vor der Klassifikation (core/text_extract.py): Obergrenzen je Mail.
+# CLASSIFY_MAX_RAW_CHARS begrenzt den Rohtext vor der HTML-/URL-Bereinigung,
+# CLASSIFY_MAX_TOKENS die Anzahl Wörter (0 = nur Zeichengrenze)
+CLASSIFY_MAX_CHARS = 20000
+CLASSIFY_MAX_TOKENS = 0
+CLASSIFY_MAX_RAW_CHARS = 200000
+# Gemeinsamer Inferenz-Dienst (inference_server.py): Watcher-Prozesse klassifizieren über
+# diesen Unix-Socket, statt jedes Modell selbst zu laden. Leer = lokal klassifizieren.
+INFERENCE_SOCKET = ""
+# Zeitlimit je Anfrage (Sekunden); danach klassifiziert der Client lokal
+INFERENCE_TIMEOUT = 10
+# Sammelfenster des Dienstes: gleichzeitige Anfragen werden je Benutzer zusammengefasst (ms)
+INFERENCE_COALESCE_MS = 5
+# Benutzer, die der Dienst gleichzeitig klassifiziert (je Benutzer höchstens ein Batch zur Zeit)
+INFERENCE_WORKERS = 4
+
+# Web-App unter eventlet (core/offload.py): CPU-Arbeit läuft im nativen Thread-Pool
+# (0 = eventlet-Standard von 20 Threads); der Watchdog loggt jede Blockade des Hubs ab
+# HUB_BLOCK_THRESHOLD_MS samt Stack nach LOG_BASE/hub.log
+TPOOL_THREADS = 0
+HUB_WATCHDOG = True
+HUB_BLOCK_THRESHOLD_MS = 200
+HUB_WATCHDOG_INTERVAL_MS = 50
+
+# Spam-Wellen (core/campaigns.py): nahezu gleiche Mails übernehmen das Urteil einer
+# kürzlich bewerteten Mail. Abstand in Bits des 64-Bit-SimHash (bis 3 garantiert gefunden),
+# Zeitfenster in Sekunden, "user" = nur Konten desselben Benutzers, "global" = Spam-Urteile
+# über alle Benutzer teilen
+CAMPAIGN_DETECTION = True
+CAMPAIGN_MAX_DISTANCE = 3
+CAMPAIGN_WINDOW = 3600
+CAMPAIGN_MAX_ENTRIES = 50000
+CAMPAIGN_MIN_TOKENS = 20
+CAMPAIGN_SCOPE = "user"
+
+# Urteils-Cache für Mehrfachzustellungen (core/verdict_cache.py): dieselbe Mail (Message-ID
+# und Body) auf mehreren Konten eines Benutzers wird nur einmal aufbereitet und klassifiziert.
+# Gültigkeit in Sekunden, höchstens so viele Einträge bzw. Zeichen aufbereiteter Text
+VERDICT_CACHE = True
+VERDICT_CACHE_TTL = 3600
+VERDICT_CACHE_MAX_ENTRIES = 20000
+VERDICT_CACHE_MAX_CHARS = 50000000
+
+# Absender-Reputation (core/reputation.py): Absender mit eindeutiger Vorgeschichte ohne Modell
+# entscheiden. Gewichte halbieren sich alle REPUTATION_HALF_LIFE_DAYS Tage; entschieden wird ab
+# REPUTATION_MIN_EVIDENCE (Adresse) bzw. REPUTATION_DOMAIN_MIN_EVIDENCE (Domain) gewichteten
+# Ereignissen, wenn der Spam-Anteil ≥ REPUTATION_SPAM_RATIO bzw. ≤ REPUTATION_HAM_RATIO ist.
+# Ham entscheidet die Reputation nur, wenn das oberste Authentication-Results die From-Domain
+# per DMARC, DKIM oder SPF bestätigt – sonst bewertet das Modell.
+REPUTATION_FAST_PATH = True
+REPUTATION_HALF_LIFE_DAYS = 30
+REPUTATION_MIN_EVIDENCE = 5
+REPUTATION_DOMAIN_MIN_EVIDENCE = 20
+REPUTATION_SPAM_RATIO = 0.95
+REPUTATION_HAM_RATIO = 0.05
+# Benutzer-Feedback zählt so viel wie mehrere Modellurteile
+REPUTATION_FEEDBACK_WEIGHT = 5
+# Sekunden, nach denen der Watcher die Reputation eines Benutzers neu aus der DB lädt
+REPUTATION_REFRESH = 300
+
+# Header-Regeln vor dem Modell (core/header_rules.py): die erste passende Regel entscheidet.
+# Leere Liste = abgeschaltet. Aufbau der Einträge siehe core/header_rules.py.
+# Ham-Regeln nur für Header, die der eigene Mailserver sicher oben hinzufügt – jeder Absender
+# kann beliebige Header mitschicken. Sie prüfen stets nur das oberste Vorkommen.
+HEADER_RULES = [
+    {"name": "x-spam-flag", "header": "X-Spam-Flag", "regex": r"^\s*yes\b", "verdict": "spam"},
+    {"name": "x-spam-status", "header": "X-Spam-Status", "regex": r"^\s*yes\b", "verdict": "spam"},
+    {"name": "x-spam-score-hoch", "header": "X-Spam-Score", "min": 8.0, "verdict": "spam"},
+    {"name": "dmarc-fail", "header": "Authentication-Results", "regex": r"\bdmarc=fail\b",
+     "first": True, "verdict": "spam"},
+    {"name": "spf-dkim-fail", "header": "Authentication-Results",
+     "regex": r"(?=.*\bspf=(?:fail|softfail)\b)(?=.*\bdkim=fail\b)", "first": True, "verdict": "spam"},
+    # Beispiel (nur aktivieren, wenn der eigene Server X-Spam-Score setzt):
+    # {"name": "x-spam-score-niedrig", "header": "X-Spam-Score", "max": -5.0, "first": True, "verdict": "ham"},
+]
+
+# Hintergrund-Training aus der Feedback-Queue (feedback_trainer.py):
+# ein Benutzer wird trainiert, sobald FEEDBACK_BATCH_SIZE Ereignisse anstehen
+# oder das älteste länger als FEEDBACK_MAX_DELAY Sekunden wartet
+FEEDBACK_BATCH_SIZE = 20
+FEEDBACK_MAX_DELAY = 60
+FEEDBACK_POLL_INTERVAL = 5
+# Verarbeitete Einträge nach so vielen Tagen löschen
+FEEDBACK_RETENTION_DAYS = 7
+FEEDBACK_LOCK_FILE = "/opt/mailfilter-data/feedback_trainer.lock"
+# Scheitert das Modell-Update (Lock, I/O), bleiben die Einträge offen und werden nach
+# FEEDBACK_RETRY_DELAY × Versuchsnummer Sekunden erneut trainiert – höchstens FEEDBACK_MAX_ATTEMPTS Mal
+FEEDBACK_MAX_ATTEMPTS = 5
+FEEDBACK_RETRY_DELAY = 60
+# Feature-Cache (mail_features): Wortzählungen aus der Klassifikation so viele Tage behalten
+FEATURE_CACHE_DAYS = 30
+
 MODEL_PATH = f"{MODEL_BASE}/spam_model.pkl"
 VECTORIZER_PATH = f"{MODEL_BASE}/spam_vectorizer.pkl"
 
@@ -20,6 +135,49 @@ SPAM_MAIL_LIMIT = 200
 # Maximale Anzahl an E-Mails aus dem Posteingang (INBOX) für das Ham-Training
 HAM_MAIL_LIMIT = 500
 
+# Lokaler Trainingskorpus (Tabelle training_corpus): Texte werden normalisiert und
+# auf CORPUS_MAX_CHARS Zeichen gekürzt; je Benutzer bleiben höchstens so viele
+# Beispiele pro Klasse erhalten (die ältesten fallen zuerst heraus)
+CORPUS_MAX_CHARS = 20000
+CORPUS_MAX_SPAM = 2000
+CORPUS_MAX_HAM = 5000
+
+# Paralleles Training (spam_model_trainer.py): Anzahl Prozesse (0 = alle CPU-Kerne).
+# Gestartet wird nur, solange der geschätzte Speicherbedarf der laufenden Jobs in das
+# Budget passt (0 = 80 % von MemAvailable); die größten Korpora beginnen zuerst.
+TRAIN_WORKERS = 0
+TRAIN_MEMORY_BUDGET_MB = 0
+# Schätzung je Job: Grundbedarf eines Prozesses + Bedarf je Trainingsbeispiel
+TRAIN_JOB_BASE_MB = 150
+TRAIN_MB_PER_SAMPLE = 0.05
+
+# Supervisor für den IDLE-Watcher (mehrere Worker-Prozesse)
+WATCHER_WORKERS = 4
+# Sekunden zwischen zwei Abgleichen der Kontenliste
+WATCHER_REBALANCE_INTERVAL = 60
+# Sekunden zwischen zwei Statusmeldungen eines Workers
+WATCHER_HEARTBEAT_INTERVAL = 15
+# Ohne Statusmeldung seit so vielen Intervallen gilt ein Worker als hängend und wird neu gestartet
+WATCHER_HANG_INTERVALS = 4
+WATCHER_STATUS_FILE = f"{LOG_BASE}/watcher_status.json"
+# Sekunden zwischen zwei Prüfungen auf neue/geänderte/gelöschte Konten
+ACCOUNT_REFRESH_INTERVAL = 15
+# Maximale Wartezeit, bis ein IDLE-Thread auf ein Stopp-Signal reagiert
+IDLE_STOP_CHECK_INTERVAL = 5
+
+# Header-Triage: erst Header (BODY.PEEK[HEADER]) laden, Bodies nur bei Bedarf
+HEADER_TRIAGE = True
+# Anzahl UIDs pro FETCH-Kommando
+FETCH_BATCH_SIZE = 50
+# Einfache Filterregeln (contains auf subject/sender/to) per UID SEARCH auf dem Server ausführen
+SERVER_SIDE_FILTERS = True
+
+# Gestaffelter Start: gleichzeitige Logins insgesamt / pro IMAP-Host
+STARTUP_MAX_CONCURRENCY = 8
+STARTUP_PER_HOST_CONCURRENCY = 2
+# Mindestabstand in Sekunden zwischen zwei Logins am selben Host
+STARTUP_HOST_MIN_INTERVAL = 0.5
+
 def get_user_log_path(user_id, account_name=None, logtype="log"):
     """
     Liefert den vollständigen Pfad zur Logdatei eines Nutzers/Kontos.
@@ -0,0 +1,165 @@
+# core/corpus.py
+# Lokaler Trainingskorpus (Tabelle training_corpus).
+#
+# Watcher (eigene Urteile), Feedback (Ham/Spam-Markierungen) und der erste
+# IMAP-Import füllen den Korpus fortlaufend; spam_model_trainer.py trainiert
+# anschließend ohne Netzwerkzugriff daraus. Gespeichert wird der normalisierte
+# Text zlib-komprimiert, dazu Label und Herkunft (Quelle, Konto, Ordner, UID).
+# Die Wasserstände (Tabelle train_watermarks) merken sich je Konto und Ordner die
+# zuletzt übernommene UID samt UIDVALIDITY für das inkrementelle Training.
+
+import hashlib
+import re
+import zlib
+
+from core.config import CORPUS_MAX_CHARS, CORPUS_MAX_HAM, CORPUS_MAX_SPAM, HAM_MAIL_LIMIT, SPAM_MAIL_LIMIT
+from core.database import get_db_connection
+
+_WS_RE = re.compile(r"\s+")
+
+# Verlässlichkeit der Quellen: Benutzer-Feedback vor dem Ordner auf dem Server (IMAP-Import)
+# vor dem eigenen Urteil des Watchers. Eine höherrangige Quelle ersetzt das Label einer niedrigeren.
+SOURCE_RANK = {"watcher": 0, "imap": 1, "feedback": 2}
+
+
+def _rank_sql(column):
+    cases = " ".join(f"WHEN '{source}' THEN {rank}" for source, rank in SOURCE_RANK.items())
+    return f"(CASE {column} {cases} ELSE 0 END)"
+
+
+def normalize_text(text, max_chars=CORPUS_MAX_CHARS):
+    """Whitespace zusammenfassen und auf max_chars kürzen."""
+    return _WS_RE.sub(" ", text or "").strip()[:max_chars]
+
+
+def pack_text(text):
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def unpack_text(blob):
+    return zlib.decompress(blob).decode("utf-8")
+
+
+def add_samples(user_id, samples, source, overwrite=False, conn=None):
+    """
+    Übernimmt Beispiele in den Korpus. samples: Dicts mit text, label und optional
+    account_id, folder, uid, msg_id. Gleicher Text wird nur einmal gespeichert; Label und
+    Herkunft eines vorhandenen Eintrags ersetzt nur eine höherrangige Quelle (SOURCE_RANK),
+    mit overwrite=True auch eine gleichrangige (neueres Benutzer-Feedback).
+    Mit conn übernimmt der Aufrufer den Commit. Liefert die Anzahl geschriebener Zeilen.
+    """
+    rows = []
+    for sample in samples:
+        text = normalize_text(sample.get("text"))
+        if not text:
+            continue
+        rows.append((
+            user_id, sample.get("account_id"), int(sample["label"]), pack_text(text),
+            hashlib.sha1(text.encode("utf-8")).hexdigest(), source,
+            sample.get("folder"), sample.get("uid"), sample.get("msg_id"),
+        ))
+    if not rows:
+        return 0
+
+    sql = f"""
+        INSERT INTO training_corpus
+            (user_id, account_id, label, text_z, text_hash, source, folder, uid, msg_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, text_hash) DO UPDATE SET
+            label = excluded.label, source = excluded.source, account_id = excluded.account_id,
+            folder = excluded.folder, uid = excluded.uid, msg_id = excluded.msg_id,
+            created_at = CURRENT_TIMESTAMP
+        WHERE {_rank_sql("excluded.source")} {">=" if overwrite else ">"} {_rank_sql("training_corpus.source")}
+    """
+    if conn is not None:
+        before = conn.total_changes
+        conn.executemany(sql, rows)
+        return conn.total_changes - before
+    with get_db_connection() as own_conn:
+        before = own_conn.total_changes
+        own_conn.executemany(sql, rows)
+        own_conn.commit()
+        return own_conn.total_changes - before
+
+
+def _account_clause(account_ids):
+    if not account_ids:
+        return "", []
+    return f" AND account_id IN ({','.join('?' * len(account_ids))})", list(account_ids)
+
+
+def corpus_counts(user_id, account_ids=None):
+    """{0: anzahl_ham, 1: anzahl_spam} im Korpus eines Benutzers (optional nur bestimmte Konten)."""
+    clause, params = _account_clause(account_ids)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT label, COUNT(*) AS n FROM training_corpus
+            WHERE user_id = ?{clause}
+            GROUP BY label
+        """, [user_id] + params)
+        counts = {0: 0, 1: 0}
+        counts.update({row["label"]: row["n"] for row in cursor.fetchall()})
+        return counts
+
+
+def load_corpus(user_id, account_ids=None, spam_limit=SPAM_MAIL_LIMIT, ham_limit=HAM_MAIL_LIMIT):
+    """Die neuesten Beispiele je Klasse als (texte, labels)."""
+    clause, params = _account_clause(account_ids)
+    texts, labels = [], []
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for label, limit in ((1, spam_limit), (0, ham_limit)):
+            cursor.execute(f"""
+                SELECT text_z FROM training_corpus
+                WHERE user_id = ? AND label = ?{clause}
+                ORDER BY id DESC
+                LIMIT ?
+            """, [user_id, label] + params + [limit])
+            for row in cursor.fetchall():
+                texts.append(unpack_text(row["text_z"]))
+                labels.append(label)
+    return texts, labels
+
+
+def prune_corpus(user_id, max_spam=CORPUS_MAX_SPAM, max_ham=CORPUS_MAX_HAM):
+    """Begrenzt den Korpus eines Benutzers je Klasse auf die neuesten Einträge."""
+    with get_db_connection() as conn:
+        for label, keep in ((1, max_spam), (0, max_ham)):
+            conn.execute("""
+                DELETE FROM training_corpus
+                WHERE user_id = ? AND label = ? AND id NOT IN (
+                    SELECT id FROM training_corpus
+                    WHERE user_id = ? AND label = ?
+                    ORDER BY id DESC LIMIT ?
+                )
+            """, (user_id, label, user_id, label, keep))
+        conn.commit()
+
+
+# -------------------------------------------------------
+# Wasserstände für das inkrementelle Training
+# -------------------------------------------------------
+def load_watermark(account_id, folder):
+    """(uid_validity, last_uid) oder None."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT uid_validity, last_uid FROM train_watermarks
+            WHERE account_id = ? AND folder = ?
+        """, (account_id, folder))
+        row = cursor.fetchone()
+        return (row["uid_validity"], row["last_uid"]) if row else None
+
+
+def save_watermark(account_id, folder, uid_validity, last_uid):
+    with get_db_connection() as conn:
+        conn.execute("""
+            INSERT INTO train_watermarks (account_id, folder, uid_validity, last_uid)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(account_id, folder) DO UPDATE SET
+                uid_validity = excluded.uid_validity,
+                last_uid = excluded.last_uid,
+                updated_at = CURRENT_TIMESTAMP
+        """, (account_id, folder, uid_validity, last_uid))
+        conn.commit()
@@ -41,6 +41,8 @@ CREATE TABLE IF NOT EXISTS accounts (
   spam_filter_active INTEGER DEFAULT 1,
   uid_validity INTEGER DEFAULT NULL,
   last_seen_uid INTEGER DEFAULT NULL,
+  config_version INTEGER DEFAULT 0, -- wird bei jeder Änderung erhöht (Watcher lädt das Konto neu)
+  train_weight REAL DEFAULT 1.0,    -- Gewicht der Mails dieses Kontos im Benutzermodell (0 = nicht trainieren)
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -100,6 +102,89 @@ CREATE TABLE IF NOT EXISTS whitelist (
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
+-- =========================
+-- FEEDBACK-QUEUE (Ham/Spam-Markierungen für das Hintergrund-Training)
+-- =========================
+CREATE TABLE IF NOT EXISTS feedback_queue (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  account_id INTEGER,
+  label INTEGER NOT NULL,           -- 1 = Spam, 0 = Ham
+  text TEXT NOT NULL,
+  subject TEXT,
+  source TEXT,                      -- z.B. 'api_mark_ham', 'mark_ham', 'flagged_spam'
+  uid TEXT,                         -- INBOX-UID der Mail (Feature-Cache)
+  sender TEXT,                      -- Absender (Reputation)
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  processed_at TEXT DEFAULT NULL,
+  error TEXT DEFAULT NULL,
+  recorded_at TEXT DEFAULT NULL,    -- Korpus und Reputation fortgeschrieben
+  attempts INTEGER DEFAULT 0,       -- fehlgeschlagene Modell-Updates
+  next_attempt_at TEXT DEFAULT NULL,
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+  FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE SET NULL
+);
+
+-- =========================
+-- TRAININGSKORPUS (lokale Kopie der Trainingsdaten, kein IMAP-Download beim Retraining)
+-- =========================
+CREATE TABLE IF NOT EXISTS training_corpus (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  account_id INTEGER,
+  label INTEGER NOT NULL,           -- 1 = Spam, 0 = Ham
+  text_z BLOB NOT NULL,             -- normalisierter Text, zlib-komprimiert
+  text_hash TEXT NOT NULL,          -- SHA-1 des normalisierten Texts (Duplikate)
+  source TEXT NOT NULL,             -- 'imap', 'watcher', 'feedback'
+  folder TEXT,
+  uid INTEGER,
+  msg_id TEXT,
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE(user_id, text_hash),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+  FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE SET NULL
+);
+
+-- =========================
+-- TRAININGS-WASSERSTÄNDE (zuletzt übernommene UID je Konto und Ordner)
+-- =========================
+CREATE TABLE IF NOT EXISTS train_watermarks (
+  account_id INTEGER NOT NULL,
+  folder TEXT NOT NULL,
+  uid_validity INTEGER NOT NULL,
+  last_uid INTEGER NOT NULL,
+  updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (account_id, folder),
+  FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE
+);
+
+-- =========================
+-- FEATURE-CACHE (Wortzählungen aus der Klassifikation, für Feedback-Training)
+-- =========================
+CREATE TABLE IF NOT EXISTS mail_features (
+  account_id INTEGER NOT NULL,
+  uid TEXT NOT NULL,
+  feature_space TEXT NOT NULL,      -- Kennung von Vokabular/Hash-Raum (inference.json)
+  indices BLOB NOT NULL,            -- int32, aufsteigend
+  counts BLOB NOT NULL,             -- uint16
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (account_id, uid),
+  FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE
+);
+
+-- =========================
+-- ABSENDER-REPUTATION (Spam/Ham-Gewichte je Adresse und Domain, siehe core/reputation.py)
+-- =========================
+CREATE TABLE IF NOT EXISTS sender_reputation (
+  user_id INTEGER NOT NULL,
+  key TEXT NOT NULL,                -- 'addr:<adresse>' oder 'domain:<domain>'
+  spam REAL NOT NULL DEFAULT 0,     -- zeitlich skalierte Summen (forward decay)
+  ham REAL NOT NULL DEFAULT 0,
+  updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (user_id, key),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
 -- =========================
 -- INDIZES
 -- =========================
@@ -124,9 +209,32 @@ CREATE INDEX IF NOT EXISTS idx_mails_created_at ON mails(created_at);
 -- WHITELIST
 CREATE INDEX IF NOT EXISTS idx_whitelist_user   ON whitelist(user_id);
 CREATE INDEX IF NOT EXISTS idx_whitelist_sender ON whitelist(sender_address);
+
+-- FEEDBACK-QUEUE
+CREATE INDEX IF NOT EXISTS idx_feedback_pending ON feedback_queue(processed_at, user_id);
+
+-- TRAININGSKORPUS
+CREATE INDEX IF NOT EXISTS idx_corpus_user_label ON training_corpus(user_id, label, id);
+CREATE INDEX IF NOT EXISTS idx_corpus_account ON training_corpus(account_id, label);
+
+-- FEATURE-CACHE
+CREATE INDEX IF NOT EXISTS idx_features_created ON mail_features(created_at);
 """
 
 
+# Spalten, die nachträglich zu bestehenden Tabellen hinzugekommen sind.
+# CREATE TABLE IF NOT EXISTS ergänzt keine Spalten – daher per ALTER TABLE nachziehen.
+COLUMN_MIGRATIONS = [
+    ("accounts", "config_version", "INTEGER DEFAULT 0"),
+    ("accounts", "train_weight", "REAL DEFAULT 1.0"),
+    ("feedback_queue", "uid", "TEXT"),
+    ("feedback_queue", "sender", "TEXT"),
+    ("feedback_queue", "recorded_at", "TEXT DEFAULT NULL"),
+    ("feedback_queue", "attempts", "INTEGER DEFAULT 0"),
+    ("feedback_queue", "next_attempt_at", "TEXT DEFAULT NULL"),
+]
+
+
 def get_connection(db_path: str) -> sqlite3.Connection:
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(db_path)
@@ -136,9 +244,17 @@ def get_connection(db_path: str) -> sqlite3.Connection:
 
 def create_schema(conn: sqlite3.Connection) -> None:
     conn.executescript(SCHEMA_SQL)
+    migrate_columns(conn)
     conn.commit()
 
 
+def migrate_columns(conn: sqlite3.Connection) -> None:
+    for table, column, decl in COLUMN_MIGRATIONS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
 def ensure_database(db_path: Optional[str] = None) -> str:
     path = db_path or DEFAULT_DB_PATH
     with get_connection(path) as conn:
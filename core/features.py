@@ -0,0 +1,83 @@
+# core/features.py
+# Feature-Cache (Tabelle mail_features).
+#
+# Der Watcher speichert beim Klassifizieren die Wortzählungen jeder behaltenen Mail
+# (Spaltenindizes und Häufigkeiten vor IDF und Normierung) unter Konto und UID.
+# Markiert der Benutzer die Mail später als Ham oder Spam, verwendet das
+# Feedback-Training diese Zählungen, statt den Text erneut zu tokenisieren.
+# feature_space kennzeichnet Vokabular bzw. Hash-Raum des Modells, mit dem gezählt
+# wurde; nach einem vollständigen Training mit neuem Vokabular passt der Eintrag
+# nicht mehr und wird ignoriert. Verlässt eine Mail die INBOX oder ändert sich die
+# UIDVALIDITY (UIDs werden neu vergeben), löscht der Watcher die Einträge mit (delete_features).
+
+import numpy as np
+
+from core.database import get_db_connection
+
+_COUNT_MAX = np.iinfo(np.uint16).max
+
+
+def pack_features(indices, counts):
+    order = np.argsort(indices)
+    return (np.asarray(indices, dtype=np.int32)[order].tobytes(),
+            np.minimum(np.asarray(counts)[order], _COUNT_MAX).astype(np.uint16).tobytes())
+
+
+def unpack_features(indices_blob, counts_blob):
+    return np.frombuffer(indices_blob, dtype=np.int32), np.frombuffer(counts_blob, dtype=np.uint16)
+
+
+def save_features(account_id, entries, conn=None):
+    """entries: [(uid, feature_space, indices, counts), ...]. Mit conn übernimmt der Aufrufer den Commit."""
+    rows = [(account_id, str(uid), space, *pack_features(indices, counts))
+            for uid, space, indices, counts in entries]
+    if not rows:
+        return 0
+    sql = """
+        INSERT OR REPLACE INTO mail_features (account_id, uid, feature_space, indices, counts)
+        VALUES (?, ?, ?, ?, ?)
+    """
+    if conn is not None:
+        conn.executemany(sql, rows)
+        return len(rows)
+    with get_db_connection() as own_conn:
+        own_conn.executemany(sql, rows)
+        own_conn.commit()
+    return len(rows)
+
+
+def load_features(keys):
+    """{(account_id, uid): (feature_space, indices, counts)} für die vorhandenen Einträge."""
+    keys = [(account_id, str(uid)) for account_id, uid in keys if account_id is not None and uid]
+    if not keys:
+        return {}
+    result = {}
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for account_id, uid in keys:
+            cursor.execute("""
+                SELECT feature_space, indices, counts FROM mail_features
+                WHERE account_id = ? AND uid = ?
+            """, (account_id, uid))
+            row = cursor.fetchone()
+            if row:
+                result[(account_id, uid)] = (row["feature_space"], *unpack_features(row["indices"], row["counts"]))
+    return result
+
+
+def delete_features(conn, account_id, uids=None):
+    """Einträge eines Kontos löschen – nur die angegebenen UIDs oder (uids=None) alle. Commit beim Aufrufer."""
+    if uids is None:
+        conn.execute("DELETE FROM mail_features WHERE account_id = ?", (account_id,))
+        # Offenes Feedback darf nicht die Zählungen einer neuen Mail mit wiederverwendeter UID laden
+        conn.execute("UPDATE feedback_queue SET uid = NULL WHERE account_id = ? AND processed_at IS NULL",
+                     (account_id,))
+    else:
+        conn.executemany("DELETE FROM mail_features WHERE account_id = ? AND uid = ?",
+                         [(account_id, str(uid)) for uid in uids])
+
+
+def purge_features(days):
+    with get_db_connection() as conn:
+        conn.execute("DELETE FROM mail_features WHERE created_at < datetime('now', ?)", (f"-{int(days)} days",))
+        conn.commit()
@@ -0,0 +1,120 @@
+# core/feedback.py
+# Feedback-Queue: Ham/Spam-Markierungen werden nur eingetragen, das Training
+# übernimmt feedback_trainer.py im Hintergrund (gebündelt je Benutzer).
+# Scheitert ein Modell-Update, bleiben die Einträge offen (attempts, next_attempt_at).
+
+from core.config import FEEDBACK_MAX_ATTEMPTS, FEEDBACK_RETRY_DELAY
+from core.database import get_db_connection
+
+# Offene Einträge, deren nächster Versuch fällig ist
+_DUE = "processed_at IS NULL AND (next_attempt_at IS NULL OR next_attempt_at <= datetime('now'))"
+
+LABEL_HAM = 0
+LABEL_SPAM = 1
+
+
+def enqueue_feedback(user_id, account_id, text, label, source, subject=None, conn=None, uid=None,
+                     sender=None):
+    """
+    Trägt ein Trainingsbeispiel in die Queue ein. Mit conn wird die bestehende
+    Verbindung verwendet (Commit übernimmt dann der Aufrufer). uid (INBOX) erlaubt
+    dem Trainer, die Wortzählungen aus dem Feature-Cache zu übernehmen; sender fließt
+    in die Absender-Reputation ein.
+    """
+    params = (user_id, account_id, int(label), text or "", subject, source, str(uid) if uid else None,
+              sender or None)
+    sql = """
+        INSERT INTO feedback_queue (user_id, account_id, label, text, subject, source, uid, sender)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    if conn is not None:
+        conn.execute(sql, params)
+        return
+    with get_db_connection() as own_conn:
+        own_conn.execute(sql, params)
+        own_conn.commit()
+
+
+def pending_by_user():
+    """{user_id: (anzahl, alter_des_ältesten_in_sekunden)} für fällige unverarbeitete Einträge."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT user_id, COUNT(*) AS n,
+                   (julianday('now') - julianday(MIN(created_at))) * 86400 AS age
+            FROM feedback_queue
+            WHERE {_DUE}
+            GROUP BY user_id
+        """)
+        return {row["user_id"]: (row["n"], row["age"] or 0) for row in cursor.fetchall()}
+
+
+def load_pending(user_id, limit=None):
+    """Fällige unverarbeitete Einträge eines Benutzers in Eingangsreihenfolge."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT q.id, q.account_id, q.label, q.text, q.subject, q.source, q.uid, q.sender,
+                   q.recorded_at, q.attempts, a.username AS account_username
+            FROM feedback_queue q
+            LEFT JOIN accounts a ON a.id = q.account_id
+            WHERE q.user_id = ? AND {_DUE}
+            ORDER BY q.id ASC
+            {"LIMIT ?" if limit else ""}
+        """, (user_id, limit) if limit else (user_id,))
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def mark_processed(ids, error=None):
+    if not ids:
+        return
+    with get_db_connection() as conn:
+        conn.executemany("""
+            UPDATE feedback_queue
+               SET processed_at = CURRENT_TIMESTAMP, error = ?
+             WHERE id = ?
+        """, [(error, i) for i in ids])
+        conn.commit()
+
+
+def mark_recorded(ids, conn):
+    """Korpus und Reputation sind für diese Einträge geschrieben (Commit übernimmt der Aufrufer)."""
+    conn.executemany("UPDATE feedback_queue SET recorded_at = CURRENT_TIMESTAMP WHERE id = ?",
+                     [(i,) for i in ids])
+
+
+def mark_failed(ids, error, max_attempts=FEEDBACK_MAX_ATTEMPTS, retry_delay=FEEDBACK_RETRY_DELAY):
+    """
+    Zählt einen fehlgeschlagenen Versuch: Die Einträge bleiben offen und sind nach
+    retry_delay × Versuchsnummer Sekunden wieder fällig; nach max_attempts Versuchen
+    gelten sie mit Fehler als verarbeitet. Liefert die Anzahl aufgegebener Einträge.
+    """
+    if not ids:
+        return 0
+    with get_db_connection() as conn:
+        conn.executemany("""
+            UPDATE feedback_queue
+               SET attempts = COALESCE(attempts, 0) + 1,
+                   error = ?,
+                   next_attempt_at = datetime('now', '+' || (? * (COALESCE(attempts, 0) + 1)) || ' seconds')
+             WHERE id = ?
+        """, [(error, int(retry_delay), i) for i in ids])
+        before = conn.total_changes
+        conn.executemany("""
+            UPDATE feedback_queue
+               SET processed_at = CURRENT_TIMESTAMP
+             WHERE id = ? AND attempts >= ?
+        """, [(i, max_attempts) for i in ids])
+        given_up = conn.total_changes - before
+        conn.commit()
+        return given_up
+
+
+def purge_processed(days):
+    with get_db_connection() as conn:
+        conn.execute("""
+            DELETE FROM feedback_queue
+            WHERE processed_at IS NOT NULL
+              AND processed_at < datetime('now', ?)
+        """, (f"-{int(days)} days",))
+        conn.commit()
@@ -0,0 +1,198 @@
+# core/filters.py
+# Auswertung der Filterregeln (Tabelle filters) – lokal und serverseitig per UID SEARCH.
+
+import re
+from email import message_from_bytes
+from email.utils import parseaddr
+from urllib.parse import unquote
+
+from core.database import get_db_connection
+from core.utils import safe_decode_header
+
+DEBUG = False
+
+# Rückgabewert, wenn eine Regel den (noch nicht geladenen) Body braucht
+NEEDS_BODY = object()
+
+# Regelfelder, die sich direkt auf IMAP-SEARCH-Schlüssel abbilden lassen
+SERVER_SEARCH_KEYS = {
+    "subject": "SUBJECT",
+    "sender": "FROM",
+    "from": "FROM",
+    "to": "TO",
+}
+
+
+def load_active_filters(account):
+    """Aktive Regeln eines Kontos – Reihenfolge stabil (ältere Regeln zuerst)."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, field, mode, value, target_folder, is_read
+            FROM filters
+            WHERE account_id = ? AND user_id = ? AND active = 1
+            ORDER BY created_at ASC, id ASC
+        """, (account["id"], account["user_id"]))
+        return [dict(row) for row in cur.fetchall()]
+
+
+def filter_target(f):
+    return {
+        "target_folder": unquote(f["target_folder"] or "") or "INBOX",
+        "is_read": bool(f["is_read"]),
+    }
+
+
+def count_usage(filter_id, hits=1):
+    """Trefferstatistik einer Regel fortschreiben."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("""
+                UPDATE filters
+                   SET usage_count = COALESCE(usage_count, 0) + ?,
+                       last_used   = CURRENT_TIMESTAMP
+                 WHERE id = ?
+            """, (hits, filter_id))
+            conn.commit()
+    except Exception as stat_err:
+        if DEBUG: print(f"[!] Konnte usage_count nicht erhöhen (Filter {filter_id}): {stat_err}")
+
+
+def match_filter(f, msg):
+    """Prüft eine Regel lokal. Liefert True/False oder NEEDS_BODY."""
+    field, mode, value = f["field"], f["mode"], f["value"]
+
+    # Kandidaten-Text bestimmen
+    if field == "subject":
+        haystack = msg.subject or ""
+    elif field in ("sender", "from"):
+        _, haystack = parseaddr(msg.from_ or "")
+    elif field == "to":
+        _, haystack = parseaddr(msg.headers.get("To", "") or "")
+    elif field == "body":
+        if not getattr(msg, "body_loaded", True):
+            return NEEDS_BODY
+        haystack = msg.text or ""
+    elif field == "headers":
+        haystack = str(msg.headers)
+    else:
+        return False  # unbekanntes Feld
+
+    if mode == "regex":
+        try:
+            return bool(re.search(value, haystack or "", flags=re.IGNORECASE))
+        except re.error:
+            return False  # kaputtes Regex ignorieren
+
+    needle = (value or "").lower()
+    hay = (haystack or "").lower()
+    if mode == "contains":
+        return needle in hay
+    if mode == "startswith":
+        return hay.startswith(needle)
+    if mode == "endswith":
+        return hay.endswith(needle)
+    if mode == "exact":
+        return hay == needle
+    return False
+
+
+# -------------------------------------------------------
+# Serverseitige Ausführung
+# -------------------------------------------------------
+def is_server_rule(f):
+    return f["mode"] == "contains" and f["field"] in SERVER_SEARCH_KEYS and bool((f["value"] or "").strip())
+
+
+def split_server_rules(filters):
+    """
+    Teilt die Regeln in (server, lokal). Serverseitig laufen nur die führenden
+    'contains'-Regeln auf subject/sender/to: Da die erste passende Regel gewinnt,
+    darf keine lokal ausgewertete Regel vor einer Serverregel stehen.
+    """
+    split = 0
+    while split < len(filters) and is_server_rule(filters[split]):
+        split += 1
+    return filters[:split], filters[split:]
+
+
+def server_criteria(f):
+    """Übersetzt eine Regel in UID-SEARCH-Kriterien: (kriterien, charset)."""
+    value = f["value"].strip()
+    charset = None if value.isascii() else "UTF-8"
+    return ["UNSEEN", SERVER_SEARCH_KEYS[f["field"]], value], charset
+
+
+def move_uids(client, uids, folder, mark_read=False):
+    """Verschiebt mehrere Mails mit einem Kommando (MOVE, sonst COPY + Löschen)."""
+    if not uids:
+        return
+    if mark_read:
+        client.add_flags(uids, [r"\Seen"])
+    else:
+        client.remove_flags(uids, [r"\Seen"])
+    if client.has_capability("MOVE"):
+        client.move(uids, folder)
+    else:
+        client.copy(uids, folder)
+        client.delete_messages(uids)
+        if client.has_capability("UIDPLUS"):
+            client.expunge(uids)
+        else:
+            client.expunge()
+
+
+class _HeaderView:
+    """Mindestansicht einer Mail (Betreff, Absender, To) für match_filter()."""
+
+    def __init__(self, raw):
+        mime_msg = message_from_bytes(raw)
+        self.subject = safe_decode_header(mime_msg.get("Subject", ""))
+        self.from_ = safe_decode_header(mime_msg.get("From", ""))
+        self.headers = {"To": safe_decode_header(mime_msg.get("To", ""))}
+        self.body_loaded = False
+
+
+def verify_hits(client, f, uids):
+    """
+    Prüft Server-Treffer lokal nach: Der Server sucht in FROM/TO im gesamten Header
+    (inkl. Anzeigename), match_filter() vergleicht nur die Adresse. Liefert die UIDs,
+    auf die die Regel auch lokal zutrifft.
+    """
+    confirmed = []
+    for uid, data in client.fetch(uids, ["BODY.PEEK[HEADER.FIELDS (SUBJECT FROM TO)]"]).items():
+        raw = next((value for key, value in data.items() if key.startswith(b"BODY[")), None)
+        if raw is not None and match_filter(f, _HeaderView(raw)) is True:
+            confirmed.append(uid)
+    return sorted(confirmed)
+
+
+def run_server_filters(client, rules):
+    """
+    Führt die Regeln per UID SEARCH auf der gewählten INBOX aus, prüft die Treffer
+    lokal nach (verify_hits) und verschiebt sie je Regel gesammelt.
+    Scheitert eine Suche (z. B. BADCHARSET bei UTF-8-Kriterien), bleiben diese und alle
+    folgenden Regeln für die lokale Auswertung übrig – die Reihenfolge der Regeln gilt weiter.
+    Liefert ({filter_id: [uids]}, nicht ausgeführte Regeln).
+    """
+    claimed = set()
+    result = {}
+    for pos, f in enumerate(rules):
+        criteria, charset = server_criteria(f)
+        try:
+            uids = [uid for uid in client.search(criteria, charset=charset) if uid not in claimed]
+            if uids:
+                uids = verify_hits(client, f, uids)
+        except Exception as e:
+            if DEBUG: print(f"[!] SEARCH für Filter {f['id']} fehlgeschlagen – lokal weiter: {e}")
+            return result, rules[pos:]
+        if not uids:
+            continue
+        target = filter_target(f)
+        move_uids(client, uids, target["target_folder"], target["is_read"])
+        claimed.update(uids)
+        count_usage(f["id"], len(uids))
+        result[f["id"]] = uids
+        if DEBUG:
+            print(f"[DEBUG] Serverfilter {f['field']} contains {f['value']} → {len(uids)} Mails → {target['target_folder']}")
+    return result, []
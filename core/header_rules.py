@@ -0,0 +1,129 @@
+# core/header_rules.py
+# Header-Regeln vor dem Modell (HEADER_RULES in core/config.py).
+#
+# Eindeutige Urteile, die der Mailserver schon in die Header geschrieben hat
+# (X-Spam-Flag, X-Spam-Status, X-Spam-Score, Authentication-Results …), entscheiden
+# eine Mail direkt – nur unklare Fälle gehen an das Modell. Die Regeln werden einmal
+# beim Import kompiliert; geprüft wird ausschließlich auf Headern, der Body wird dafür
+# nicht geladen. Die erste passende Regel gewinnt.
+#
+# Aufbau einer Regel:
+#   name     Bezeichnung für Statistik und Log
+#   header   Headername (Groß-/Kleinschreibung egal)
+#   verdict  "spam" oder "ham"
+#   regex    Treffer, wenn der Ausdruck im Headerwert vorkommt (ohne Groß-/Kleinschreibung), oder
+#   min/max  Treffer, wenn die Zahl im Headerwert ≥ min bzw. ≤ max ist; number gibt optional
+#            den Ausdruck vor, dessen erste Gruppe die Zahl liefert (Standard: erste Zahl)
+#   first    nur das oberste Vorkommen prüfen (vom eigenen Server hinzugefügt)
+#
+# Ham-Regeln prüfen immer nur das oberste Vorkommen: Weiter unten stehende Header kann der
+# Absender selbst gesetzt haben (z. B. "X-Spam-Score: -10"), und ein Ham-Urteil schickt die
+# Mail am Modell vorbei und fließt in die Reputation ein. Sie taugen daher nur für Header,
+# die der eigene Mailserver zuverlässig hinzufügt.
+#
+# sender_authenticated() prüft nach derselben Regel (oberstes Authentication-Results), ob die
+# From-Domain per DMARC, DKIM oder SPF bestätigt ist – Voraussetzung für Ham aus der Reputation.
+
+import re
+from email.utils import parseaddr
+
+from core import metrics
+from core.config import HEADER_RULES
+
+_NUMBER_RE = re.compile(r"(-?\d+(?:\.\d+)?)")
+# Bestandene Prüfung samt geprüfter Domain: dmarc → header.from, dkim → header.d/header.i, spf → smtp.mailfrom
+_AUTH_PASS_RE = re.compile(r"^\s*(dmarc|dkim|spf)\s*=\s*pass\b", re.I)
+_AUTH_DOMAIN_RE = {
+    "dmarc": re.compile(r"\bheader\.from\s*=\s*([^\s;()]+)", re.I),
+    "dkim": re.compile(r"\bheader\.[di]\s*=\s*([^\s;()]+)", re.I),
+    "spf": re.compile(r"\bsmtp\.mailfrom\s*=\s*([^\s;()]+)", re.I),
+}
+VERDICTS = {"spam": True, "ham": False}
+
+
+class HeaderRule:
+    """Eine kompilierte Regel."""
+
+    def __init__(self, spec):
+        self.name = spec.get("name") or spec.get("header")
+        if not spec.get("header"):
+            raise ValueError(f"Header-Regel {self.name!r}: 'header' fehlt")
+        if spec.get("verdict") not in VERDICTS:
+            raise ValueError(f"Header-Regel {self.name!r}: 'verdict' muss 'spam' oder 'ham' sein")
+        self.header = spec["header"]
+        self.is_spam = VERDICTS[spec["verdict"]]
+        self.first = bool(spec.get("first")) or not self.is_spam
+        self.regex = re.compile(spec["regex"], re.I | re.S) if spec.get("regex") else None
+        self.min = spec.get("min")
+        self.max = spec.get("max")
+        self.number = re.compile(spec["number"], re.I) if spec.get("number") else _NUMBER_RE
+        if self.regex is None and self.min is None and self.max is None:
+            raise ValueError(f"Header-Regel {self.name!r}: 'regex' oder 'min'/'max' angeben")
+
+    def matches(self, value):
+        if self.regex is not None:
+            return self.regex.search(value) is not None
+        found = self.number.search(value)
+        if not found:
+            return False
+        try:
+            number = float(found.group(1))
+        except (IndexError, ValueError):
+            return False
+        return (self.min is None or number >= self.min) and (self.max is None or number <= self.max)
+
+
+def header_values(msg, name):
+    """Alle Werte eines Headers in Reihenfolge (oberster zuerst)."""
+    obj = getattr(msg, "obj", None)
+    if obj is not None:
+        return [str(value) for value in (obj.get_all(name) or [])]
+    lowered = name.lower()
+    return [str(value) for key, value in (msg.headers or {}).items() if key.lower() == lowered]
+
+
+def _aligned(domain, checked):
+    # wie DMARC "relaxed": gleiche Domain oder Sub-/Oberdomain voneinander
+    return domain == checked or domain.endswith("." + checked) or checked.endswith("." + domain)
+
+
+def sender_authenticated(msg, sender):
+    """True, wenn das oberste Authentication-Results DMARC, DKIM oder SPF für die From-Domain bestätigt."""
+    address = parseaddr(sender or "")[1].strip().lower()
+    if "@" not in address:
+        return False
+    domain = address.rsplit("@", 1)[1]
+    values = header_values(msg, "Authentication-Results")
+    if not values:
+        return False
+    for part in values[0].split(";")[1:]:  # vor dem ersten ";" steht der prüfende Server
+        passed = _AUTH_PASS_RE.match(part)
+        if not passed:
+            continue
+        found = _AUTH_DOMAIN_RE[passed.group(1).lower()].search(part)
+        if found and _aligned(domain, found.group(1).lower().rsplit("@", 1)[-1].strip('"<>.')):
+            return True
+    return False
+
+
+class HeaderRules:
+    """Alle Regeln; evaluate() liefert die erste passende Regel oder None, count() zählt den Treffer."""
+
+    def __init__(self, specs=HEADER_RULES):
+        self.rules = [HeaderRule(spec) for spec in specs]
+
+    def evaluate(self, msg):
+        values = {}
+        for rule in self.rules:
+            key = rule.header.lower()
+            if key not in values:
+                values[key] = header_values(msg, rule.header)
+            candidates = values[key][:1] if rule.first else values[key]
+            if any(rule.matches(value) for value in candidates):
+                return rule
+        return None
+
+    @staticmethod
+    def count(rule):
+        """Treffer einer Regel in den Metriken zählen (erst, wenn sie tatsächlich entschieden hat)."""
+        metrics.incr(f"header_rule:{rule.name}")
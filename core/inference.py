@@ -0,0 +1,74 @@
+# core/inference.py
+# Client des gemeinsamen Inferenz-Dienstes (inference_server.py).
+#
+# Ist INFERENCE_SOCKET gesetzt, schickt classify_with_features() die Texte als eine
+# JSON-Zeile über den Unix-Socket und bekommt Spam-Wahrscheinlichkeiten und
+# Wortzählungen zurück; die Modelle liegen dann nur einmal im Dienst im Speicher.
+# Ist der Dienst nicht erreichbar, wird wie bisher lokal über core/scorer.py klassifiziert.
+
+import json
+import socket
+
+import numpy as np
+
+from core import metrics, scorer
+from core.config import INFERENCE_SOCKET, INFERENCE_TIMEOUT, SPAM_THRESHOLD
+from core.logger import get_logger
+
+# Ausfall des Dienstes nur beim Wechsel protokollieren, nicht bei jeder Anfrage
+_remote_ok = True
+
+
+class InferenceError(RuntimeError):
+    """Der Dienst hat die Anfrage angenommen, aber nicht beantworten können."""
+
+
+def request(payload, path=INFERENCE_SOCKET, timeout=INFERENCE_TIMEOUT):
+    """Sendet eine Anfrage an den Dienst und liefert die Antwort (dict)."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("Verbindung ohne Antwort geschlossen")
+    response = json.loads(line)
+    if response.get("busy"):
+        # Dienst hängt (z. B. beim Laden eines Modells) – wie ein Timeout behandeln: lokal weiter
+        raise TimeoutError(response.get("error") or "Inferenz-Dienst ausgelastet")
+    if not response.get("ok"):
+        raise InferenceError(response.get("error") or "unbekannter Fehler")
+    return response
+
+
+def decode_features(entry):
+    if entry is None:
+        return None
+    space, indices, counts = entry
+    return space, np.asarray(indices, dtype=np.int64), np.asarray(counts, dtype=np.float32)
+
+
+def classify_with_features(username, texts, threshold=SPAM_THRESHOLD):
+    """Wie core.scorer.classify_with_features – über den Dienst, falls konfiguriert und erreichbar."""
+    global _remote_ok
+    if not texts:
+        return [], []
+    if INFERENCE_SOCKET:
+        try:
+            response = request({"op": "score", "user": username, "texts": list(texts), "features": True})
+            metrics.incr("inference_remote")
+            _remote_ok = True
+            return ([(score, score >= threshold) for score in response["scores"]],
+                    [decode_features(entry) for entry in response["features"]])
+        except (OSError, ValueError, KeyError) as e:
+            metrics.incr("inference_fallback")
+            if _remote_ok:
+                get_logger("inference").warning(f"Inferenz-Dienst nicht erreichbar, klassifiziere lokal: {e}")
+            _remote_ok = False
+    return scorer.classify_with_features(username, texts, threshold)
+
+
+def classify_batch(username, texts, threshold=SPAM_THRESHOLD):
+    """Wie core.scorer.classify_batch – über den Dienst, falls konfiguriert und erreichbar."""
+    return classify_with_features(username, texts, threshold)[0]
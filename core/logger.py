@@ -2,7 +2,7 @@
 import os
 import logging
 from datetime import datetime
-from core.config import LOG_BASE, ERROR_LOG_FILE
+from core.config import LOG_BASE, ERROR_LOG_FILE, SPAM_LOG_FILE, SYSTEM_LOG_FILE
 
 # Zentralen Logger einrichten (wird einmalig im Hauptprogramm aufgerufen)
 def setup_main_logger():
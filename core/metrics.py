@@ -0,0 +1,39 @@
+# core/metrics.py
+# Einfache, threadsichere Zähler pro Prozess (Watcher, Worker, Dienste).
+
+import threading
+import time
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_started = time.time()
+
+
+def incr(name, value=1):
+    """Erhöht einen Zähler um value."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """Setzt einen Momentanwert (z. B. Anzahl aktiver Konten)."""
+    with _lock:
+        _gauges[name] = value
+
+
+def get(name, default=0):
+    with _lock:
+        if name in _counters:
+            return _counters[name]
+        return _gauges.get(name, default)
+
+
+def snapshot():
+    """Liefert eine Kopie aller Zähler und Momentanwerte."""
+    with _lock:
+        return {
+            "uptime": round(time.time() - _started, 1),
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+        }
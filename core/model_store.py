@@ -0,0 +1,82 @@
+# core/model_store.py
+# Ablage der Spam-Modelle (Registry) – Pfade und Dateinamen ohne sklearn-Abhängigkeit,
+# damit Watcher und Scorer (core/scorer.py) die aktive Version finden, ohne
+# model_utils und damit scikit-learn zu importieren.
+#
+#   MODEL_BASE/<user>/versions/<version>/   vollständiger Modellstand, wird nie verändert
+#   MODEL_BASE/<user>/current               Name der aktiven Version
+# Ohne "current" gilt das alte flache Layout direkt in MODEL_BASE/<user>/.
+#
+# Mit MODEL_LAYOUT = "shared" liegt unter MODEL_BASE/.shared/ ein gemeinsames Basis-Modell
+# (gleiches Versions-Layout); Benutzerversionen enthalten dann nur ihre Klassenzählungen
+# (user_counts.npz) und die Basis-Version, auf der sie beruhen.
+
+import os
+
+from core.config import MODEL_BASE, MODEL_LAYOUT
+from core.text_extract import extract_text
+
+# sklearn-Objekte (model_utils)
+MODEL_FILE = "spam_model.pkl"
+VECTORIZER_FILE = "spam_vectorizer.pkl"
+FEATURIZER_FILE = "featurizer.json"
+IDF_FILE = "spam_idf.pkl"
+
+# Inferenz-Artefakt für den NumPy-Scorer (core/scorer.py)
+INFERENCE_FILE = "inference.json"
+NB_DELTA_FILE = "nb_delta.npy"
+INFERENCE_IDF_FILE = "inference_idf.npy"
+TOKENS_FILE = "tokens.json"
+# Geteiltes Layout: Zählungen des Basis-Modells (nur Basis) und Delta je Benutzer
+NB_COUNTS_FILE = "nb_counts.npy"
+USER_COUNTS_FILE = "user_counts.npz"
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "current"
+# Name des Basis-Modells im geteilten Layout (Punkt: kann kein Benutzername sein)
+SHARED_MODEL_NAME = ".shared"
+
+
+def model_dir_for(username):
+    """Basisverzeichnis eines Benutzers (enthält versions/ und current)."""
+    return os.path.join(MODEL_BASE, username)
+
+
+def current_version(username):
+    """Name der aktiven Version oder None (noch nichts veröffentlicht / altes Layout)."""
+    try:
+        with open(os.path.join(model_dir_for(username), CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_model_dir(username):
+    """Verzeichnis des aktiven Modellstands."""
+    version = current_version(username)
+    if version:
+        return os.path.join(model_dir_for(username), VERSIONS_DIR, version)
+    return model_dir_for(username)
+
+
+def shared_base_dir(version=None):
+    """Verzeichnis einer Basis-Version (Standard: aktive) oder None, wenn es keine gibt."""
+    version = version or current_version(SHARED_MODEL_NAME)
+    if not version:
+        return None
+    path = os.path.join(model_dir_for(SHARED_MODEL_NAME), VERSIONS_DIR, version)
+    return path if os.path.isdir(path) else None
+
+
+def uses_shared_base(username):
+    """True, wenn der Benutzer auf dem Basis-Modell aufsetzt (Delta-Version oder noch kein eigenes Modell)."""
+    if current_version(username) is None:
+        legacy = any(os.path.exists(os.path.join(model_dir_for(username), name))
+                     for name in (FEATURIZER_FILE, VECTORIZER_FILE))
+        return MODEL_LAYOUT == "shared" and not legacy and shared_base_dir() is not None
+    return os.path.exists(os.path.join(current_model_dir(username), USER_COUNTS_FILE))
+
+
+def mail_text(subject, body, html_body=None):
+    """Text einer Mail, wie ihn Modell, Korpus und Scorer sehen (siehe core/text_extract.py)."""
+    return extract_text(subject, body, html_body)
@@ -0,0 +1,83 @@
+# core/offload.py
+# Blockierende Arbeit aus dem eventlet-Hub der Web-App auslagern (nur app.py).
+#
+# app.py läuft unter eventlet.monkey_patch(): Alle Requests und Socket.IO-Verbindungen
+# teilen sich einen OS-Thread. Netzwerk-I/O (IMAP, HTTP) ist durch das Patchen kooperativ,
+# CPU-Arbeit und native Aufrufe (Fernet, MIME-Parsing, Textaufbereitung, joblib/sklearn)
+# halten den Hub dagegen an, bis sie fertig sind. run_blocking() führt solche Aufrufe im
+# nativen Thread-Pool von eventlet (tpool) aus. Darin keine grünen Sockets benutzen
+# (IMAP-Sitzungen, requests) – die bleiben im Hub.
+#
+# HubWatchdog meldet, wenn der Hub länger als HUB_BLOCK_THRESHOLD_MS nicht zum Zug kommt:
+# Ein grüner Herzschlag misst die Verzögerung, ein echter OS-Thread hält während der
+# Blockade den Stack des blockierenden Codes fest. Geloggt wird erst, wenn der Hub wieder
+# läuft (hub.log) – Logger und Metriken nutzen grüne Locks und gehören nicht in den OS-Thread.
+
+import sys
+import time
+import traceback
+
+import eventlet
+from eventlet import patcher, tpool
+
+from core import metrics
+from core.config import HUB_BLOCK_THRESHOLD_MS, HUB_WATCHDOG_INTERVAL_MS, TPOOL_THREADS
+from core.logger import get_logger
+
+logger = get_logger("hub")
+
+# Ungepatchte Module für den Watchdog-Thread
+_threading = patcher.original("threading")
+_time = patcher.original("time")
+
+if TPOOL_THREADS:
+    tpool.set_num_threads(TPOOL_THREADS)
+
+
+def run_blocking(func, *args, **kwargs):
+    """func(*args, **kwargs) im nativen Thread-Pool ausführen – ohne monkey_patch() direkt."""
+    if not patcher.is_monkey_patched("thread"):
+        return func(*args, **kwargs)
+    metrics.incr("offloaded")
+    return tpool.execute(func, *args, **kwargs)
+
+
+class HubWatchdog:
+    """Erkennt Blockaden des eventlet-Hubs und loggt Dauer und Stack des Verursachers."""
+
+    def __init__(self, threshold_ms=HUB_BLOCK_THRESHOLD_MS, interval_ms=HUB_WATCHDOG_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self._beat_at = time.monotonic()
+        self._stack = None
+        self._hub_thread = None
+
+    def start(self):
+        """Aus dem Hub-Thread aufrufen (beim Start von app.py)."""
+        self._hub_thread = _threading.get_ident()
+        eventlet.spawn(self._beat)
+        _threading.Thread(target=self._watch, name="hub-watchdog", daemon=True).start()
+        return self
+
+    def _beat(self):
+        while True:
+            before = time.monotonic()
+            eventlet.sleep(self.interval)
+            now = time.monotonic()
+            self._beat_at = now
+            delay = now - before - self.interval
+            stack, self._stack = self._stack, None
+            if delay < self.threshold:
+                continue
+            metrics.incr("hub_blocks")
+            metrics.incr("hub_blocked_ms", int(delay * 1000))
+            message = f"Hub {delay * 1000:.0f} ms blockiert"
+            logger.warning(f"{message}, blockierender Code:\n{stack}" if stack else message)
+
+    def _watch(self):
+        while True:
+            _time.sleep(self.interval)
+            beat_at = self._beat_at
+            if self._stack is None and time.monotonic() - beat_at >= self.threshold + self.interval:
+                frame = sys._current_frames().get(self._hub_thread)
+                self._stack = "".join(traceback.format_stack(frame)) if frame is not None else None
@@ -0,0 +1,144 @@
+# core/reputation.py
+# Absender- und Domain-Reputation je Benutzer (Tabelle sender_reputation).
+#
+# Urteile des Watchers (Modell, Spam-Welle, X-Spam-Level) und Benutzer-Feedback werden
+# je Absenderadresse und Domain aufsummiert. Ältere Ereignisse verlieren mit der
+# Halbwertszeit REPUTATION_HALF_LIFE_DAYS an Gewicht. Damit das Fortschreiben eine
+# reine Addition bleibt (ein UPSERT, kein Lesen-Ändern-Schreiben zwischen Prozessen),
+# wird jedes Ereignis mit 2^((t − EPOCH) / Halbwertszeit) skaliert gespeichert
+# ("forward decay"); der aktuelle Wert ist die Summe geteilt durch den Faktor von jetzt.
+# Der Faktor bleibt rund 1000 Halbwertszeiten nach EPOCH als float darstellbar
+# (bei 30 Tagen bis etwa 2100).
+#
+# Der Watcher fragt die Reputation vor dem Modell ab (ReputationCache, ein Dict-Zugriff
+# je Schlüssel). Eindeutig bewertete Absender werden ohne Modell entschieden. Die Domain
+# entscheidet nur auf Spam: Ein Ham-Urteil für gmail.com o. ä. würde jeden neuen (auch
+# gefälschten) Absender dieser Domain am Modell vorbeischicken.
+
+import threading
+import time
+from email.utils import parseaddr
+
+from core.config import (REPUTATION_DOMAIN_MIN_EVIDENCE, REPUTATION_HALF_LIFE_DAYS, REPUTATION_HAM_RATIO,
+                         REPUTATION_MIN_EVIDENCE, REPUTATION_REFRESH, REPUTATION_SPAM_RATIO)
+from core.database import get_db_connection
+
+# Bezugszeitpunkt der Skalierung (2024-01-01 UTC)
+EPOCH = 1704067200
+
+
+def decay_scale(now=None):
+    """Skalierungsfaktor eines Ereignisses zum Zeitpunkt now."""
+    now = time.time() if now is None else now
+    return 2.0 ** ((now - EPOCH) / (REPUTATION_HALF_LIFE_DAYS * 86400))
+
+
+def sender_keys(sender):
+    """Schlüssel für Adresse und Domain eines Absenders (leer, wenn keine Adresse erkennbar)."""
+    address = parseaddr(sender or "")[1].strip().lower()
+    if "@" not in address:
+        return []
+    return [f"addr:{address}", f"domain:{address.rsplit('@', 1)[1]}"]
+
+
+def record(user_id, events, conn=None):
+    """
+    Schreibt Ereignisse fort: events = [(absender, ist_spam, gewicht), ...].
+    Mit conn übernimmt der Aufrufer den Commit. Liefert die geschriebenen Schlüssel mit Werten.
+    """
+    scale = decay_scale()
+    totals = {}
+    for sender, is_spam, weight in events:
+        for key in sender_keys(sender):
+            spam, ham = totals.get(key, (0.0, 0.0))
+            totals[key] = (spam + weight * scale, ham) if is_spam else (spam, ham + weight * scale)
+    if not totals:
+        return {}
+    sql = """
+        INSERT INTO sender_reputation (user_id, key, spam, ham) VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id, key) DO UPDATE SET
+            spam = spam + excluded.spam,
+            ham = ham + excluded.ham,
+            updated_at = CURRENT_TIMESTAMP
+    """
+    rows = [(user_id, key, spam, ham) for key, (spam, ham) in totals.items()]
+    if conn is not None:
+        conn.executemany(sql, rows)
+    else:
+        with get_db_connection() as own_conn:
+            own_conn.executemany(sql, rows)
+            own_conn.commit()
+    return totals
+
+
+def verdict(spam, ham, min_evidence, scale):
+    """True = Spam, False = Ham, None = nicht eindeutig oder zu wenig Ereignisse."""
+    total = spam + ham
+    if total <= 0 or total / scale < min_evidence:
+        return None
+    ratio = spam / total
+    if ratio >= REPUTATION_SPAM_RATIO:
+        return True
+    if ratio <= REPUTATION_HAM_RATIO:
+        return False
+    return None
+
+
+def purge_reputation(min_evidence=0.1):
+    """Löscht Einträge, deren Gewicht durch den Zerfall praktisch verschwunden ist."""
+    with get_db_connection() as conn:
+        conn.execute("DELETE FROM sender_reputation WHERE spam + ham < ?", (min_evidence * decay_scale(),))
+        conn.commit()
+
+
+class ReputationCache:
+    """Reputation je Benutzer im Speicher; wird alle REPUTATION_REFRESH Sekunden neu geladen."""
+
+    def __init__(self, refresh=REPUTATION_REFRESH):
+        self.refresh = refresh
+        self._users = {}  # user_id -> (geladen_um, {key: [spam, ham]})
+        self._lock = threading.Lock()
+
+    def _table(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached and now - cached[0] < self.refresh:
+                return cached[1]
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT key, spam, ham FROM sender_reputation WHERE user_id = ?", (user_id,))
+            table = {row["key"]: [row["spam"], row["ham"]] for row in cursor.fetchall()}
+        with self._lock:
+            self._users[user_id] = (now, table)
+        return table
+
+    def lookup(self, user_id, sender):
+        """Urteil aus der Reputation der Adresse, ersatzweise der Domain (nur Spam) – oder None."""
+        keys = sender_keys(sender)
+        if not keys:
+            return None
+        table = self._table(user_id)
+        scale = decay_scale()
+        address, domain = keys
+        entry = table.get(address)
+        if entry:
+            result = verdict(entry[0], entry[1], REPUTATION_MIN_EVIDENCE, scale)
+            if result is not None:
+                return result
+        entry = table.get(domain)
+        if entry and verdict(entry[0], entry[1], REPUTATION_DOMAIN_MIN_EVIDENCE, scale):
+            return True
+        return None
+
+    def record(self, user_id, events):
+        """Schreibt Ereignisse in die Datenbank und sofort in den Speicherstand des Benutzers."""
+        totals = record(user_id, events)
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached:
+                for key, (spam, ham) in totals.items():
+                    entry = cached[1].setdefault(key, [0.0, 0.0])
+                    entry[0] += spam
+                    entry[1] += ham
+        return totals
@@ -0,0 +1,283 @@
+# core/scorer.py
+# NumPy-Scorer für MultinomialNB ohne scikit-learn.
+#
+# model_utils.export_inference() schreibt zu jeder Modellversion:
+#   inference.json     Tokenizer-Einstellungen, Modus, Bias (log P(spam) − log P(ham))
+#   nb_delta.npy       je Feature feature_log_prob_[spam] − feature_log_prob_[ham] (float32)
+#   inference_idf.npy  IDF-Gewichte (float32, falls verwendet)
+#   tokens.json        Token je Spaltenindex (nur tfidf; hashing nutzt MurmurHash3 wie sklearn)
+# Für zwei Klassen ist predict_proba(spam) = sigmoid(x · delta + bias) – mehr braucht
+# der Watcher nicht. Die Arrays werden per mmap geladen und zwischen Prozessen geteilt.
+# Ein Batch wird nach der Tokenisierung als eine dünn besetzte Matrix (CSR-Layout: alle
+# Indizes und Werte hintereinander, dazu die Zeile je Eintrag) in einem Schritt bewertet –
+# IDF, L2-Norm und x · delta laufen vektorisiert über alle Mails (np.bincount je Zeile).
+# Fehlt das Artefakt (altes Modell, nicht abbildbarer Featurizer), wird auf
+# model_utils (sklearn) zurückgegriffen; der Import passiert erst dann.
+#
+# Im geteilten Layout (MODEL_LAYOUT = "shared") lädt jeder Prozess das Basis-Artefakt
+# einmal; SharedScorer legt je Benutzer nur eine Korrektur für die Wörter aus dessen
+# eigenen Zählungen darüber (user_counts.npz). Für alle anderen Wörter verschiebt sich
+# das Gewicht der Basis nur um eine Konstante, weil sich die Klassensummen ändern.
+
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from core.config import SPAM_THRESHOLD
+from core.model_store import (INFERENCE_FILE, INFERENCE_IDF_FILE, NB_COUNTS_FILE, NB_DELTA_FILE,
+                              SHARED_MODEL_NAME, TOKENS_FILE, USER_COUNTS_FILE, current_model_dir,
+                              current_version, shared_base_dir, uses_shared_base)
+
+# Obergrenze für den Token→Index-Cache im Hashing-Modus
+HASH_CACHE_SIZE = 200_000
+
+# Geladene Basis-Versionen je Prozess (geteiltes Layout)
+BASE_CACHE_SIZE = 2
+
+# username -> (version, scorer oder None)
+_scorer_cache = {}
+# basis-version -> NbScorer oder None
+_base_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _rotl32(x, r):
+    return ((x << r) | (x >> (32 - r))) & 0xFFFFFFFF
+
+
+def murmurhash3_32(data, seed=0):
+    """MurmurHash3 (x86, 32 Bit) als vorzeichenbehafteter Wert – wie sklearn.utils.murmurhash3_32."""
+    c1, c2 = 0xCC9E2D51, 0x1B873593
+    length = len(data)
+    h = seed & 0xFFFFFFFF
+    end = length - (length & 3)
+    for i in range(0, end, 4):
+        k = int.from_bytes(data[i:i + 4], "little")
+        k = _rotl32((k * c1) & 0xFFFFFFFF, 15)
+        h ^= (k * c2) & 0xFFFFFFFF
+        h = (_rotl32(h, 13) * 5 + 0xE6546B64) & 0xFFFFFFFF
+    tail = length & 3
+    if tail:
+        k = int.from_bytes(data[end:], "little")
+        k = _rotl32((k * c1) & 0xFFFFFFFF, 15)
+        h ^= (k * c2) & 0xFFFFFFFF
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h - 0x100000000 if h & 0x80000000 else h
+
+
+def _sigmoid(logits):
+    # numerisch stabile Sigmoid-Funktion (elementweise)
+    z = np.exp(-np.abs(logits))
+    return np.where(logits >= 0, 1.0 / (1.0 + z), z / (1.0 + z))
+
+
+def _stack(entries):
+    """[(indizes, häufigkeiten) | (None, None), ...] → (indizes, werte, zeilen, anzahl) aller Mails."""
+    lengths = [len(indices) if indices is not None else 0 for indices, _ in entries]
+    present = [(indices, counts) for indices, counts in entries if indices is not None and len(indices)]
+    if not present:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, np.zeros(0, dtype=np.float32), empty, len(entries)
+    indices = np.concatenate([indices for indices, _ in present])
+    values = np.concatenate([np.asarray(counts, dtype=np.float32) for _, counts in present])
+    rows = np.repeat(np.arange(len(entries)), lengths)
+    return indices, values, rows, len(entries)
+
+
+class NbScorer:
+    """Wertet das Inferenz-Artefakt einer Modellversion aus."""
+
+    def __init__(self, model_dir):
+        with open(os.path.join(model_dir, INFERENCE_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.model_dir = model_dir
+        self.mode = meta["mode"]
+        self.feature_space = meta.get("feature_space")
+        self.bias = meta["bias"]
+        self.nb = meta.get("nb")
+        self.lowercase = meta["lowercase"]
+        self.norm = meta["norm"]
+        self.stop_words = frozenset(meta["stop_words"] or ())
+        self.token_re = re.compile(meta["token_pattern"])
+        self.delta = np.load(os.path.join(model_dir, NB_DELTA_FILE), mmap_mode="r")
+        self.idf = (np.load(os.path.join(model_dir, INFERENCE_IDF_FILE), mmap_mode="r")
+                    if meta["idf"] else None)
+        if self.mode == "hashing":
+            self.n_features = meta["n_features"]
+            self.index = {}
+        else:
+            with open(os.path.join(model_dir, TOKENS_FILE), encoding="utf-8") as f:
+                self.index = {token: i for i, token in enumerate(json.load(f))}
+
+    def _hash_index(self, token):
+        index = self.index.get(token)
+        if index is None:
+            h = murmurhash3_32(token.encode("utf-8"))
+            n = self.n_features
+            index = (2147483647 - (n - 1)) % n if h == -2147483648 else abs(h) % n
+            if len(self.index) >= HASH_CACHE_SIZE:
+                self.index.clear()
+            self.index[token] = index
+        return index
+
+    def counts(self, text):
+        """(indizes, häufigkeiten) eines Textes vor IDF und Normierung – oder (None, None)."""
+        if self.lowercase:
+            text = text.lower()
+        counts = Counter(token for token in self.token_re.findall(text) if token not in self.stop_words)
+        if self.mode == "hashing":
+            pairs = Counter()
+            for token, n in counts.items():
+                pairs[self._hash_index(token)] += n
+        else:
+            pairs = {self.index[token]: n for token, n in counts.items() if token in self.index}
+        if not pairs:
+            return None, None
+        return (np.fromiter(pairs.keys(), dtype=np.int64, count=len(pairs)),
+                np.fromiter(pairs.values(), dtype=np.float32, count=len(pairs)))
+
+    def weights(self, indices, values, rows, n):
+        """Modelleingabe aus den gestapelten Wortzählungen eines Batches: IDF und L2-Norm je Zeile."""
+        if self.idf is not None:
+            values = values * self.idf[indices]
+        if self.norm == "l2" and len(values):
+            lengths = np.sqrt(np.bincount(rows, weights=values * values, minlength=n))
+            values = values / np.where(lengths > 0, lengths, 1.0)[rows]
+        return values
+
+    def score_many(self, entries):
+        """Spam-Wahrscheinlichkeiten für [(indizes, häufigkeiten), ...] in einem Schritt."""
+        indices, values, rows, n = _stack(entries)
+        values = self.weights(indices, values, rows, n)
+        logits = self.bias + np.bincount(rows, weights=values * self.delta[indices], minlength=n)
+        return _sigmoid(logits)
+
+    def score(self, text):
+        """Spam-Wahrscheinlichkeit eines Textes."""
+        return float(self.score_many([self.counts(text or "")])[0])
+
+
+class SharedScorer:
+    """Basis-Modell des geteilten Layouts plus die eigenen Zählungen eines Benutzers."""
+
+    def __init__(self, base, model_dir):
+        self.base = base
+        self.feature_space = base.feature_space
+        with np.load(os.path.join(model_dir, USER_COUNTS_FILE)) as data:
+            indices = data["indices"].astype(np.int64)
+            counts = data["counts"].astype(np.float64)
+            class_count = data["class_count"]
+        alpha, n = base.nb["alpha"], len(base.delta)
+        base_sums = np.asarray(base.nb["feature_sums"])
+        sums = base_sums + counts.sum(axis=1)
+        # delta_i = log(n1_i + α) − log(n0_i + α) + log(Σ0 + α·n) − log(Σ1 + α·n)
+        shift = np.log(sums[0] + alpha * n) - np.log(sums[1] + alpha * n)
+        self.shift = float(shift - (np.log(base_sums[0] + alpha * n) - np.log(base_sums[1] + alpha * n)))
+        classes = np.asarray(base.nb["class_count"]) + class_count
+        self.bias = float(np.log(classes[1]) - np.log(classes[0]))
+        base_counts = np.load(os.path.join(base.model_dir, NB_COUNTS_FILE), mmap_mode="r")[:, indices]
+        own = np.log(base_counts[1] + counts[1] + alpha) - np.log(base_counts[0] + counts[0] + alpha) + shift
+        self.indices = indices
+        self.correction = (own - base.delta[indices] - self.shift).astype(np.float32)
+
+    def counts(self, text):
+        return self.base.counts(text)
+
+    def score_many(self, entries):
+        indices, values, rows, n = _stack(entries)
+        values = self.base.weights(indices, values, rows, n)
+        logits = self.bias + np.bincount(rows, weights=values * (self.base.delta[indices] + self.shift), minlength=n)
+        if len(self.indices) and len(indices):
+            pos = np.minimum(np.searchsorted(self.indices, indices), len(self.indices) - 1)
+            own = self.indices[pos] == indices
+            logits += np.bincount(rows[own], weights=values[own] * self.correction[pos[own]], minlength=n)
+        return _sigmoid(logits)
+
+    def score(self, text):
+        return float(self.score_many([self.counts(text or "")])[0])
+
+
+def _base_scorer(version):
+    """NbScorer einer Basis-Version (einmal je Prozess) oder None."""
+    with _cache_lock:
+        if version in _base_cache:
+            return _base_cache[version]
+    base_dir = shared_base_dir(version)
+    scorer = (NbScorer(base_dir) if base_dir and os.path.exists(os.path.join(base_dir, INFERENCE_FILE))
+              else None)
+    if scorer is not None and not (scorer.nb and os.path.exists(os.path.join(base_dir, NB_COUNTS_FILE))):
+        scorer = None
+    with _cache_lock:
+        _base_cache[version] = scorer
+        while len(_base_cache) > BASE_CACHE_SIZE:
+            del _base_cache[next(iter(_base_cache))]
+    return scorer
+
+
+def _new_scorer(model_dir):
+    path = os.path.join(model_dir, INFERENCE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("layout") != "shared":
+        return NbScorer(model_dir)
+    base = _base_scorer(meta["base"])
+    return SharedScorer(base, model_dir) if base is not None else None
+
+
+def load_scorer(username):
+    """Scorer der aktiven Version (bzw. der Basis im geteilten Layout) oder None ohne Inferenz-Artefakt."""
+    version = current_version(username)
+    shared = version is None and uses_shared_base(username)
+    key = ("shared", current_version(SHARED_MODEL_NAME)) if shared else version
+    with _cache_lock:
+        cached = _scorer_cache.get(username)
+        if cached and key and cached[0] == key:
+            return cached[1]
+    if shared:
+        scorer = _base_scorer(key[1])
+    else:
+        scorer = _new_scorer(current_model_dir(username)) if version else None
+    with _cache_lock:
+        _scorer_cache[username] = (key, scorer)
+    return scorer
+
+
+def classify_batch(username, texts, threshold=SPAM_THRESHOLD):
+    """Wie model_utils.classify_batch – bevorzugt über das Inferenz-Artefakt ohne sklearn."""
+    if not texts:
+        return []
+    scorer = load_scorer(username)
+    if scorer is None:
+        import model_utils
+        return model_utils.classify_batch(username, texts, threshold)
+    scores = scorer.score_many([scorer.counts(text or "") for text in texts])
+    return [(float(score), bool(score >= threshold)) for score in scores]
+
+
+def classify_with_features(username, texts, threshold=SPAM_THRESHOLD):
+    """
+    Wie classify_batch, liefert zusätzlich je Text (feature_space, indizes, häufigkeiten)
+    für den Feature-Cache (core/features.py) – bzw. None ohne Inferenz-Artefakt.
+    """
+    if not texts:
+        return [], []
+    scorer = load_scorer(username)
+    if scorer is None or not scorer.feature_space:
+        return classify_batch(username, texts, threshold), [None] * len(texts)
+    entries = [scorer.counts(text or "") for text in texts]
+    scores = scorer.score_many(entries)
+    results = [(float(score), bool(score >= threshold)) for score in scores]
+    features = [(scorer.feature_space, indices, counts) if indices is not None else None
+                for indices, counts in entries]
+    return results, features
@@ -0,0 +1,37 @@
+# core/sharding.py
+# Konsistentes Hashing: verteilt Konten stabil auf eine feste Menge von Workern.
+# Kommt ein Konto hinzu oder fällt weg, ändert sich nur die Zuordnung dieses Kontos.
+
+import bisect
+import hashlib
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Hash-Ring mit virtuellen Knoten für eine gleichmäßige Verteilung."""
+
+    def __init__(self, nodes, replicas=64):
+        self.replicas = replicas
+        self._ring = []
+        for node in nodes:
+            for i in range(replicas):
+                self._ring.append((_hash(f"{node}#{i}"), node))
+        self._ring.sort()
+        self._keys = [h for h, _ in self._ring]
+
+    def owner(self, key):
+        """Liefert den Knoten, dem der Schlüssel zugeordnet ist."""
+        if not self._ring:
+            return None
+        idx = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._ring[idx][1]
+
+    def assign(self, keys):
+        """Ordnet alle Schlüssel zu: {knoten: [schluessel, ...]}."""
+        result = {node: [] for _, node in self._ring}
+        for key in keys:
+            result[self.owner(key)].append(key)
+        return result
@@ -0,0 +1,128 @@
+# core/startup_scheduler.py
+# Gestaffelter Verbindungsaufbau beim Start des Watchers.
+# Begrenzt die gleichzeitigen Logins global und pro IMAP-Host, hält einen
+# Mindestabstand zwischen zwei Logins am selben Host ein und arbeitet die
+# Konten in Prioritätsreihenfolge ab.
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from core import metrics
+from core.config import (STARTUP_HOST_MIN_INTERVAL, STARTUP_MAX_CONCURRENCY,
+                         STARTUP_PER_HOST_CONCURRENCY)
+from core.database import get_db_connection
+from core.logger import write_system_log
+
+
+def warmup_priorities(accounts):
+    """
+    Liefert {account_id: prioritaet} – kleinere Werte zuerst.
+    Konten mit viel Verkehr in den letzten 24 Stunden kommen zuerst online,
+    danach gilt die Sortierung aus der Web-Oberfläche.
+    """
+    traffic = {}
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT account_id, COUNT(*) AS n
+                FROM mails
+                WHERE created_at >= datetime('now', '-1 day')
+                GROUP BY account_id
+            """)
+            traffic = {row["account_id"]: row["n"] for row in cursor.fetchall()}
+    except Exception:
+        pass
+    return {
+        acc["id"]: (-traffic.get(acc["id"], 0), acc.get("sort_order") or 0, acc["id"])
+        for acc in accounts
+    }
+
+
+class StartupScheduler:
+    def __init__(self, max_concurrency=STARTUP_MAX_CONCURRENCY,
+                 per_host=STARTUP_PER_HOST_CONCURRENCY,
+                 min_interval=STARTUP_HOST_MIN_INTERVAL):
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self.cond = threading.Condition()
+        self.seq = itertools.count()
+        self.waiting = []
+        self.active = 0
+        self.host_active = {}
+        self.host_next = {}
+        self.batch = None
+
+    # -------------------------------------------------------
+    # Slots
+    # -------------------------------------------------------
+    def _host_free(self, host, now):
+        return (self.host_active.get(host, 0) < self.per_host
+                and now >= self.host_next.get(host, 0.0))
+
+    def _eligible(self, ticket, now):
+        if self.active >= self.max_concurrency or not self._host_free(ticket[2], now):
+            return False
+        # Kein höher priorisiertes Konto überholen, das ebenfalls starten könnte
+        return not any(t < ticket and self._host_free(t[2], now) for t in self.waiting)
+
+    def _wait_time(self, now):
+        pending = [self.host_next.get(t[2], 0.0) - now for t in self.waiting]
+        pending = [p for p in pending if p > 0]
+        return min(pending) if pending else None
+
+    @contextmanager
+    def slot(self, host, priority=(0,)):
+        """Reserviert einen Login-Slot für host (blockiert bis frei)."""
+        ticket = (priority, next(self.seq), host)
+        with self.cond:
+            self.waiting.append(ticket)
+            while not self._eligible(ticket, time.monotonic()):
+                self.cond.wait(timeout=self._wait_time(time.monotonic()))
+            self.waiting.remove(ticket)
+            self.active += 1
+            self.host_active[host] = self.host_active.get(host, 0) + 1
+            self.host_next[host] = time.monotonic() + self.min_interval
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.host_active[host] -= 1
+                self.cond.notify_all()
+
+    # -------------------------------------------------------
+    # Fortschritt ("alle Konten online")
+    # -------------------------------------------------------
+    def begin_batch(self, account_ids):
+        """
+        Beginnt einen Start-Durchgang – oder ergänzt den noch laufenden um die neuen Konten,
+        damit Änderungen während eines langen Starts die Meldung "alle Konten online" nicht verlieren.
+        """
+        with self.cond:
+            if self.batch is None:
+                self.batch = {"started": time.monotonic(), "pending": set(), "total": 0, "failed": 0}
+            new_ids = set(account_ids) - self.batch["pending"]
+            self.batch["pending"] |= new_ids
+            self.batch["total"] += len(new_ids)
+
+    def mark_done(self, account_id, ok=True):
+        """Meldet den ersten Verbindungsversuch eines Kontos als abgeschlossen."""
+        with self.cond:
+            batch = self.batch
+            if not batch or account_id not in batch["pending"]:
+                return
+            batch["pending"].discard(account_id)
+            if not ok:
+                batch["failed"] += 1
+            if batch["pending"]:
+                return
+            elapsed = time.monotonic() - batch["started"]
+            online = batch["total"] - batch["failed"]
+            self.batch = None
+
+        metrics.set_gauge("startup_seconds", round(elapsed, 2))
+        write_system_log(f"[Watcher] {online}/{batch['total']} Konten online nach {elapsed:.1f}s")
@@ -0,0 +1,89 @@
+# core/text_extract.py
+# Textaufbereitung vor der Klassifikation – für Training, Korpus, Feedback und Watcher gleich.
+#
+#   1. Rohtext auf CLASSIFY_MAX_RAW_CHARS kürzen (begrenzt die Kosten der folgenden Regex-Schritte)
+#   2. ohne text/plain-Teil: HTML per Regex in Text umwandeln (kein Parser, kein DOM);
+#      unsichtbare Blöcke werden linear gesucht (öffnendes Tag, dann str.find nach dem
+#      schließenden) – fehlt es, entfällt der Rest, statt ihn erneut abzusuchen
+#   3. URLs auf ihren Host reduzieren – Pfade und Tracking-Parameter blähen nur das Vokabular auf
+#   4. Whitespace zusammenfassen, auf CLASSIFY_MAX_TOKENS Wörter und CLASSIFY_MAX_CHARS Zeichen kürzen
+# Damit hat die Klassifikation pro Mail eine feste Obergrenze, und reine HTML-Mails
+# werden tatsächlich bewertet.
+
+import html
+import re
+
+from core.config import CLASSIFY_MAX_CHARS, CLASSIFY_MAX_RAW_CHARS, CLASSIFY_MAX_TOKENS
+
+_INVISIBLE_OPEN_RE = re.compile(r"<(script|style|head|title)\b|<!--", re.I)
+_CLOSE_END_RE = re.compile(r"\s*>")
+# [^<>] statt [^>]: ein "<" ohne ">" darf nicht bis zum Textende vorausschauen (quadratisch)
+_BREAK_RE = re.compile(r"<(?:br|/?p|/?div|/?tr|/?li|/?h[1-6]|/?td|/?table)\b[^<>]*>", re.I)
+_TAG_RE = re.compile(r"<[^<>]*>")
+_URL_RE = re.compile(r"\b(?:https?://|www\.)([^\s/?#<>\"']+)[^\s<>\"']*", re.I)
+_WS_RE = re.compile(r"\s+")
+
+
+def _strip_invisible(text):
+    """Entfernt <script>, <style>, <head>, <title> und Kommentare samt Inhalt – in linearer Zeit."""
+    lower = text.lower()
+    parts, pos = [], 0
+    while True:
+        match = _INVISIBLE_OPEN_RE.search(text, pos)
+        if not match:
+            parts.append(text[pos:])
+            break
+        parts.append(text[pos:match.start()])
+        if match.group(1):
+            closing = "</" + match.group(1).lower()
+            end = lower.find(closing, match.end())
+            while end >= 0:
+                tail = _CLOSE_END_RE.match(text, end + len(closing))
+                if tail:
+                    end = tail.end()
+                    break
+                end = lower.find(closing, end + len(closing))
+        else:
+            end = text.find("-->", match.end())
+            if end >= 0:
+                end += 3
+        if end < 0:
+            break  # nicht geschlossen: der Rest ist unsichtbar
+        parts.append(" ")
+        pos = end
+    return "".join(parts)
+
+
+def html_to_text(raw_html):
+    """Sichtbarer Text eines HTML-Teils (Skripte, Styles und Kommentare entfallen)."""
+    if not raw_html:
+        return ""
+    text = _strip_invisible(raw_html[:CLASSIFY_MAX_RAW_CHARS])
+    text = _BREAK_RE.sub("\n", text)
+    return html.unescape(_TAG_RE.sub(" ", text))
+
+
+def _url_host(match):
+    host = match.group(1).lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    return f" {host[4:] if host.startswith('www.') else host} "
+
+
+def normalize_text(text, max_chars=CLASSIFY_MAX_CHARS, max_tokens=CLASSIFY_MAX_TOKENS):
+    """URLs → Host, Whitespace zusammenfassen, auf max_tokens Wörter und max_chars Zeichen kürzen."""
+    if not text:
+        return ""
+    text = _URL_RE.sub(_url_host, text[:CLASSIFY_MAX_RAW_CHARS])
+    text = _WS_RE.sub(" ", text).strip()
+    if max_tokens:
+        words = text.split(" ", max_tokens)
+        if len(words) > max_tokens:
+            text = " ".join(words[:max_tokens])
+    return text[:max_chars]
+
+
+def extract_text(subject, text, html_body=None):
+    """Text einer Mail für Modell, Korpus und Scorer: Betreff + Textteil (ersatzweise HTML)."""
+    body = text or ""
+    if html_body and not body.strip():
+        body = html_to_text(html_body)
+    return normalize_text(subject, max_chars=1000) + "\n" + normalize_text(body)
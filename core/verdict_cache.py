@@ -0,0 +1,103 @@
+# core/verdict_cache.py
+# Urteils-Cache für Mehrfachzustellungen (Aliase, Weiterleitungen, Verteiler).
+#
+# Erreicht dieselbe Nachricht mehrere Konten eines Benutzers, hat jede Zustellung eigene
+# Header (Received, Delivered-To …), aber denselben Body und dieselbe Message-ID. Der
+# Schlüssel ist daher (Benutzer, Message-ID, Hash des Bodys ab der ersten Leerzeile).
+# Gespeichert werden die aufbereiteten Textteile (parse_mail_body, ohne erneutes
+# HTML-Parsen) und das Modellurteil samt Wortzählungen – die zweite Zustellung braucht
+# weder Parser noch Modell. Einträge gelten VERDICT_CACHE_TTL Sekunden; der Cache ist
+# nach Anzahl und Textgröße begrenzt, die ältesten Einträge fallen zuerst heraus.
+#
+# Der Cache lebt im Speicher des Watcher-Prozesses (alle IDLE-Threads teilen ihn).
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from core import metrics
+from core.config import VERDICT_CACHE_MAX_CHARS, VERDICT_CACHE_MAX_ENTRIES, VERDICT_CACHE_TTL
+
+
+def body_digest(raw):
+    """Hash des Bodys einer Rohnachricht (alles nach der ersten Leerzeile) oder None ohne Body."""
+    ends = [i for i in (raw.find(b"\r\n\r\n"), raw.find(b"\n\n")) if i >= 0]
+    if not ends:
+        return None
+    return hashlib.blake2b(raw[min(ends):].lstrip(b"\r\n"), digest_size=16).hexdigest()
+
+
+def content_key(message_id, raw):
+    """Schlüssel (Message-ID, Body-Hash) oder None, wenn eines von beiden fehlt."""
+    message_id = (message_id or "").strip()
+    digest = body_digest(raw) if message_id else None
+    return (message_id, digest) if digest else None
+
+
+class VerdictCache:
+    """Aufbereitete Mail und Modellurteil je (Benutzer, Message-ID, Body-Hash); threadsicher."""
+
+    def __init__(self, ttl=VERDICT_CACHE_TTL, max_entries=VERDICT_CACHE_MAX_ENTRIES,
+                 max_chars=VERDICT_CACHE_MAX_CHARS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries = OrderedDict()  # (user_id, message_id, hash) -> {"added", "parsed", "verdict", "chars"}
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if (now - entry["added"] <= self.ttl and len(self._entries) <= self.max_entries
+                    and self._chars <= self.max_chars):
+                break
+            del self._entries[key]
+            self._chars -= entry["chars"]
+
+    def _get(self, user_id, key, field):
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get((user_id, *key))
+            return entry.get(field) if entry else None
+
+    def _put(self, user_id, key, field, value, chars=0):
+        if key is None:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((user_id, *key))
+            if entry is None:
+                entry = self._entries[(user_id, *key)] = {"added": now, "parsed": None, "verdict": None, "chars": 0}
+            if entry[field] is None:
+                entry["chars"] += chars
+                self._chars += chars
+            entry[field] = value
+            self._expire(now)
+            size = len(self._entries)
+        metrics.set_gauge("verdict_cache_entries", size)
+
+    def parsed(self, user_id, key):
+        """Aufbereitete Textteile (text, html_body, html_raw) einer früheren Zustellung oder None."""
+        parsed = self._get(user_id, key, "parsed")
+        if parsed is not None:
+            metrics.incr("parse_cache_hits")
+        return parsed
+
+    def add_parsed(self, user_id, key, parsed):
+        self._put(user_id, key, "parsed", parsed, chars=sum(len(part) for part in parsed))
+
+    def verdict(self, user_id, key):
+        """Modellurteil einer früheren Zustellung: (score, ist_spam, features) oder None."""
+        if key is None:
+            return None
+        verdict = self._get(user_id, key, "verdict")
+        metrics.incr("verdict_cache_hits" if verdict else "verdict_cache_misses")
+        return verdict
+
+    def add_verdict(self, user_id, key, score, is_spam, features=None):
+        self._put(user_id, key, "verdict", (score, bool(is_spam), features))
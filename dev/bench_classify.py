@@ -0,0 +1,85 @@
+# bench_classify.py
+# Misst die Klassifikationskosten pro Mail im Produktionspfad (core.scorer):
+# Einzelaufrufe vs. classify_batch().
+#
+# Aufruf (aus dem Projektverzeichnis):
+#   python3 -m dev.bench_classify [--mode tfidf|hashing] [--repeat 3]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_utils
+from core import model_store, scorer
+from sklearn.naive_bayes import MultinomialNB
+
+BATCH_SIZES = (1, 32, 512)
+
+HAM_WORDS = ("rechnung termin projekt besprechung bericht anhang angebot morgen team "
+             "kunde lieferung vertrag danke gruss woche protokoll meeting update").split()
+SPAM_WORDS = ("gewinn gratis casino bonus kredit sofort klicken angebot viagra rabatt "
+              "lotterie million bitcoin exklusiv jetzt free winner prize").split()
+
+
+def synthetic_mail(rng, spam):
+    words = SPAM_WORDS if spam else HAM_WORDS
+    mixed = [rng.choice(words) if rng.random() < 0.7 else rng.choice(HAM_WORDS + SPAM_WORDS)
+             for _ in range(rng.randint(40, 400))]
+    subject = " ".join(rng.choice(words) for _ in range(5))
+    return model_utils.mail_text(subject, " ".join(mixed))
+
+
+def synthetic_corpus(n, seed=42):
+    rng = random.Random(seed)
+    labels = [rng.random() < 0.3 for _ in range(n)]
+    return [synthetic_mail(rng, spam) for spam in labels], [int(spam) for spam in labels]
+
+
+def measure(username, texts, batch_size, repeat):
+    """Liefert (einzeln, batch) in Mikrosekunden pro Mail."""
+    sample = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    best_single = best_batch = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in sample:
+            scorer.classify_batch(username, [text])
+        best_single = min(best_single, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        scorer.classify_batch(username, sample)
+        best_batch = min(best_batch, time.perf_counter() - start)
+    return best_single / batch_size * 1e6, best_batch / batch_size * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark der Spam-Klassifikation")
+    parser.add_argument("--mode", default="tfidf", choices=["tfidf", "hashing"])
+    parser.add_argument("--train", type=int, default=700, help="Anzahl Trainingsmails")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    model_store.MODEL_BASE = tempfile.mkdtemp(prefix="cozymail-bench-")
+    username = "bench"
+
+    texts, labels = synthetic_corpus(args.train)
+    featurizer = model_utils.new_featurizer(args.mode)
+    model = MultinomialNB().fit(featurizer.fit_transform(texts), labels)
+    model_utils.save_model(username, model, featurizer)
+
+    test_texts, _ = synthetic_corpus(512, seed=7)
+    scorer.classify_batch(username, test_texts[:1])  # Cache aufwärmen
+
+    print(f"Featurizer: {args.mode}, Training: {args.train} Mails")
+    print(f"{'Batch':>6} | {'einzeln µs/Mail':>16} | {'Batch µs/Mail':>14} | {'Faktor':>6}")
+    for batch_size in BATCH_SIZES:
+        single, batch = measure(username, test_texts, batch_size, args.repeat)
+        print(f"{batch_size:>6} | {single:>16.1f} | {batch:>14.1f} | {single / batch:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# check_text_extract.py
+# Regressionsprüfung für core/text_extract: bösartiges HTML (nicht geschlossene Tags in
+# Massen) muss in linearer Zeit verarbeitet werden, normales HTML den erwarteten Text liefern.
+#
+# Aufruf (aus dem Projektverzeichnis):
+#   python3 -m dev.check_text_extract [--budget-ms 500]
+# Endet mit Exitcode 1, sobald eine Eingabe länger als --budget-ms braucht oder ein
+# erwarteter Text nicht stimmt.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.text_extract import extract_text
+
+# Eingaben, die mit nicht-gierigen Regex (.*? bis zum schließenden Tag) quadratisch laufen
+HOSTILE = {
+    "<script> × 25000": "<script>" * 25000,
+    "<style x> × 20000": "<style x>" * 20000,
+    "<!-- × 50000": "<!--" * 50000,
+    "< × 200000": "<" * 200000,
+    "<br × 60000": "<br" * 60000,
+    "</script ohne > × 20000": "<script>" + "</script" * 20000,
+}
+
+EXPECTED = [
+    ("<html><head><title>T</title><style>a{}</style></head><body><p>Hallo <b>Welt</b>"
+     "<!-- c --><script>var a = '</div>'</SCRIPT >ende<br/>x &amp; y</body></html>",
+     "Hallo Welt ende x & y"),
+    ("a<script>b</scriptx>c</script>d", "a d"),
+    ("sichtbar<script>nie geschlossen", "sichtbar"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Laufzeit und Ergebnis der HTML-Textextraktion")
+    parser.add_argument("--budget-ms", type=float, default=500, help="höchstens so viele Millisekunden je Eingabe")
+    args = parser.parse_args()
+
+    failed = []
+    for name, raw in HOSTILE.items():
+        start = time.perf_counter()
+        extract_text("x", "", raw)
+        elapsed = (time.perf_counter() - start) * 1000
+        flag = f"  > {args.budget_ms:.0f} ms" if elapsed > args.budget_ms else ""
+        print(f"{name:<26} {elapsed:>8.1f} ms{flag}")
+        if flag:
+            failed.append(name)
+
+    for raw, expected in EXPECTED:
+        body = extract_text("", "", raw).split("\n", 1)[1]
+        if body != expected:
+            print(f"Falscher Text: {body!r} statt {expected!r} für {raw[:40]!r}…")
+            failed.append(raw[:40])
+
+    if failed:
+        print(f"\nFehlgeschlagen: {len(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
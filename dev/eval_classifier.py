@@ -0,0 +1,332 @@
+# eval_classifier.py
+# Offline-Auswertung des Spam-Modells: Qualität (k-fach Kreuzvalidierung), Trainingszeit,
+# Latenz pro Mail bei verschiedenen Batchgrößen sowie Modellgröße auf Platte und im Speicher.
+# Mehrere Featurizer-Varianten (u. a. Stoppwörter englisch/deutsch/keine) lassen sich
+# direkt vergleichen; die Ergebnisse werden als JSON gespeichert.
+#
+# Datenquellen (genau eine):
+#   --corpus DIR     DIR/spam/ und DIR/ham/ mit .eml-Dateien oder Klartext (rekursiv)
+#   --user ID        Trainingskorpus eines Benutzers aus der Datenbank (training_corpus)
+#   --synthetic N    N erzeugte Mails (Standard, wie dev/bench_classify.py)
+#
+# Aufruf (aus dem Projektverzeichnis):
+#   python3 -m dev.eval_classifier --corpus ~/mails --folds 5 --output eval.json
+#   python3 -m dev.eval_classifier --variants tfidf-none,tfidf-english,tfidf-german
+#   python3 -m dev.eval_classifier --compare alt.json neu.json
+
+import argparse
+import email
+import json
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from email import policy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import (accuracy_score, f1_score, precision_score, recall_score,
+                             roc_auc_score)
+from sklearn.model_selection import StratifiedKFold
+from sklearn.naive_bayes import MultinomialNB
+
+import model_utils
+from core import model_store, scorer
+from dev.bench_classify import synthetic_corpus
+
+BATCH_SIZES = (1, 8, 32, 128, 512)
+
+# Kurze deutsche Stoppwortliste (häufigste Funktionswörter) für den Vergleich mit "english"
+GERMAN_STOP_WORDS = sorted(set("""
+aber alle allem allen aller alles als also am an ander andere anderem anderen anderer anderes
+auch auf aus bei bin bis bist da damit dann das dass dasselbe dazu dein deine deinem deinen
+deiner dem den denn der des dessen deshalb die dies diese diesem diesen dieser dieses doch dort
+du durch ein eine einem einen einer eines einig einige er es etwas euch euer eure für gegen
+gewesen hab habe haben hat hatte hatten hier hin hinter ich ihm ihn ihnen ihr ihre ihrem ihren
+ihrer im in indem ins ist jede jedem jeden jeder jedes jene jetzt kann kein keine keinem keinen
+man manche mein meine meinem meinen meiner mit muss musste nach nicht nichts noch nun nur ob
+oder ohne sehr sein seine seinem seinen seiner seit sich sie sind so solche soll sollte sondern
+sonst über um und uns unser unsere unter viel vom von vor während war waren warst was weil
+welche welchem welchen welcher welches wenn werde werden wie wieder will wir wird wo wollen
+würde würden zu zum zur zwar zwischen
+""".split()))
+
+VARIANTS = {
+    "tfidf-english": lambda: TfidfVectorizer(stop_words="english", lowercase=True),
+    "tfidf-german": lambda: TfidfVectorizer(stop_words=GERMAN_STOP_WORDS, lowercase=True),
+    "tfidf-none": lambda: TfidfVectorizer(stop_words=None, lowercase=True),
+    # Hashing wie im Betrieb (Stoppwörter aus TFIDF_STOP_WORDS, Hash-Raum aus HASHING_N_FEATURES)
+    "hashing-idf": lambda: model_utils.HashingFeaturizer(online_idf=True),
+    "hashing": lambda: model_utils.HashingFeaturizer(online_idf=False),
+}
+DEFAULT_VARIANTS = "tfidf-english,tfidf-german,tfidf-none,hashing-idf"
+
+# Kennzahlen, die --compare gegenüberstellt
+COMPARE_KEYS = ("accuracy", "precision", "recall", "f1", "fpr", "roc_auc", "train_seconds")
+
+# -------------------------------------------------------
+# Daten
+# -------------------------------------------------------
+def _part_text(part):
+    if part is None:
+        return ""
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeError):
+        return part.get_payload(decode=True).decode("utf-8", errors="replace")
+
+
+def read_mail_file(path):
+    """
+    Text einer Datei wie ihn das Modell im Betrieb sieht: model_store.mail_text() aus Betreff,
+    Textteil und – ohne Textteil – dem Original-HTML (core/text_extract.py).
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if not path.lower().endswith((".eml", ".msg")):
+        return model_store.mail_text("", raw.decode("utf-8", errors="replace"))
+    msg = email.message_from_bytes(raw, policy=policy.default)
+    text = _part_text(msg.get_body(preferencelist=("plain",)))
+    html_raw = _part_text(msg.get_body(preferencelist=("html",)))
+    return model_store.mail_text(str(msg.get("subject", "")), text, html_raw)
+
+
+def load_corpus_dir(path):
+    texts, labels = [], []
+    for label, sub in ((1, "spam"), (0, "ham")):
+        root = os.path.join(path, sub)
+        if not os.path.isdir(root):
+            raise SystemExit(f"Verzeichnis fehlt: {root}")
+        for dirpath, _, filenames in os.walk(root):
+            for name in sorted(filenames):
+                texts.append(read_mail_file(os.path.join(dirpath, name)))
+                labels.append(label)
+    return texts, labels
+
+
+def load_data(args):
+    if args.corpus:
+        return f"corpus:{os.path.abspath(args.corpus)}", load_corpus_dir(args.corpus)
+    if args.user is not None:
+        from core.corpus import load_corpus
+        return f"user:{args.user}", load_corpus(args.user, spam_limit=args.limit, ham_limit=args.limit)
+    return f"synthetic:{args.synthetic}", synthetic_corpus(args.synthetic, seed=args.seed)
+
+
+# -------------------------------------------------------
+# Messungen
+# -------------------------------------------------------
+def summarize(values):
+    return {"mean": statistics.fmean(values), "std": statistics.pstdev(values)}
+
+
+def cross_validate(make_featurizer, texts, labels, folds, seed):
+    """Kennzahlen je Fold und gemittelt."""
+    texts = np.array(texts, dtype=object)
+    labels = np.array(labels)
+    per_fold = []
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    for train_idx, test_idx in splitter.split(texts, labels):
+        featurizer = make_featurizer()
+        start = time.perf_counter()
+        model = MultinomialNB().fit(featurizer.fit_transform(list(texts[train_idx])), labels[train_idx])
+        train_seconds = time.perf_counter() - start
+
+        y_true = labels[test_idx]
+        scores = model.predict_proba(featurizer.transform(list(texts[test_idx])))[:, list(model.classes_).index(1)]
+        y_pred = (scores >= model_utils.SPAM_THRESHOLD).astype(int)
+        ham = y_true == 0
+        per_fold.append({
+            "accuracy": accuracy_score(y_true, y_pred),
+            "precision": precision_score(y_true, y_pred, zero_division=0),
+            "recall": recall_score(y_true, y_pred, zero_division=0),
+            "f1": f1_score(y_true, y_pred, zero_division=0),
+            # Anteil fälschlich als Spam verschobener Ham-Mails – der teure Fehler
+            "fpr": float(y_pred[ham].mean()) if ham.any() else 0.0,
+            "roc_auc": roc_auc_score(y_true, scores) if len(set(y_true)) == 2 else None,
+            "train_seconds": train_seconds,
+        })
+    summary = {key: summarize([fold[key] for fold in per_fold if fold[key] is not None] or [0.0])
+               for key in per_fold[0]}
+    return summary, per_fold
+
+
+def measure_latency(classify, username, texts, repeat):
+    """µs pro Mail je Batchgröße (bester Lauf)."""
+    result = {}
+    for batch_size in BATCH_SIZES:
+        sample = (texts * (batch_size // len(texts) + 1))[:batch_size]
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            classify(username, sample)
+            best = min(best, time.perf_counter() - start)
+        result[str(batch_size)] = best / batch_size * 1e6
+    return result
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+               if os.path.isfile(os.path.join(path, name)))
+
+
+def measure_memory(username):
+    """Geladene Größe in Bytes: sklearn-Objekte (ohne mmap) und NumPy-Scorer (Arrays voll gezählt)."""
+    tracemalloc.start()
+    model, featurizer = model_utils.load_model(username, mmap=False)
+    sklearn_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del model, featurizer
+
+    artifact = os.path.exists(os.path.join(model_store.current_model_dir(username), model_store.INFERENCE_FILE))
+    scorer_bytes = None
+    if artifact:
+        tracemalloc.start()
+        nb = scorer.NbScorer(model_store.current_model_dir(username))
+        scorer_bytes = tracemalloc.get_traced_memory()[0] + nb.delta.nbytes
+        if nb.idf is not None:
+            scorer_bytes += nb.idf.nbytes
+        tracemalloc.stop()
+    return sklearn_bytes, scorer_bytes
+
+
+def evaluate_variant(name, texts, labels, args):
+    make_featurizer = VARIANTS[name]
+    summary, per_fold = cross_validate(make_featurizer, texts, labels, args.folds, args.seed)
+
+    # Vollständiges Modell für Latenz und Größe
+    username = f"eval-{name}"
+    featurizer = make_featurizer()
+    start = time.perf_counter()
+    model = MultinomialNB().fit(featurizer.fit_transform(texts), labels)
+    full_train_seconds = time.perf_counter() - start
+    model_utils.save_model(username, model, featurizer)
+    pickled_bytes = len(pickle.dumps((model, featurizer)))
+    del model, featurizer
+
+    model_dir = model_store.current_model_dir(username)
+    sklearn_bytes, scorer_bytes = measure_memory(username)
+    sample = texts[:512]
+    model_utils.classify_batch(username, sample[:1])  # Caches aufwärmen
+    scorer.classify_batch(username, sample[:1])
+    latency = {"sklearn": measure_latency(model_utils.classify_batch, username, sample, args.repeat)}
+    if scorer_bytes is not None:
+        latency["scorer"] = measure_latency(scorer.classify_batch, username, sample, args.repeat)
+
+    return {
+        "quality": summary,
+        "folds": per_fold,
+        "full_train_seconds": full_train_seconds,
+        "latency_us_per_mail": latency,
+        "size": {
+            "disk_bytes": dir_size(model_dir),
+            "pickled_bytes": pickled_bytes,
+            "memory_sklearn_bytes": sklearn_bytes,
+            "memory_scorer_bytes": scorer_bytes,
+        },
+    }
+
+
+# -------------------------------------------------------
+# Ausgabe
+# -------------------------------------------------------
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results):
+    print(f"Daten: {results['data']} – {results['samples']['spam']} Spam, {results['samples']['ham']} Ham, "
+          f"{results['folds']} Folds")
+    print(f"{'Variante':<14} | {'Acc':>6} | {'Prec':>6} | {'Recall':>6} | {'F1':>6} | {'FPR':>6} | "
+          f"{'Train s':>7} | {'µs/Mail@1':>9} | {'µs/Mail@512':>11} | {'Platte KB':>9}")
+    for name, variant in results["variants"].items():
+        q = variant["quality"]
+        latency = variant["latency_us_per_mail"].get("scorer") or variant["latency_us_per_mail"]["sklearn"]
+        print(f"{name:<14} | {q['accuracy']['mean']:>6.3f} | {q['precision']['mean']:>6.3f} | "
+              f"{q['recall']['mean']:>6.3f} | {q['f1']['mean']:>6.3f} | {q['fpr']['mean']:>6.3f} | "
+              f"{variant['full_train_seconds']:>7.2f} | {latency['1']:>9.1f} | {latency['512']:>11.1f} | "
+              f"{variant['size']['disk_bytes'] / 1024:>9.0f}")
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old_path} ({old.get('revision')}) → {new_path} ({new.get('revision')})")
+    for name in sorted(set(old["variants"]) & set(new["variants"])):
+        print(f"\n{name}")
+        for key in COMPARE_KEYS:
+            a = old["variants"][name]["quality"][key]["mean"]
+            b = new["variants"][name]["quality"][key]["mean"]
+            print(f"  {key:<14} {a:>9.4f} → {b:>9.4f} ({b - a:+.4f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline-Auswertung der Spam-Klassifikation")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--corpus", help="Verzeichnis mit spam/ und ham/")
+    source.add_argument("--user", type=int, help="Trainingskorpus dieses Benutzers (user_id)")
+    source.add_argument("--synthetic", type=int, default=2000, help="Anzahl erzeugter Mails")
+    parser.add_argument("--limit", type=int, default=5000, help="max. Beispiele je Klasse bei --user")
+    parser.add_argument("--variants", default=DEFAULT_VARIANTS,
+                        help=f"kommagetrennt aus: {', '.join(VARIANTS)}")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="Wiederholungen der Latenzmessung")
+    parser.add_argument("--output", help="Ergebnisse als JSON speichern")
+    parser.add_argument("--compare", nargs=2, metavar=("ALT", "NEU"), help="zwei JSON-Ergebnisse vergleichen")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    names = [name.strip() for name in args.variants.split(",") if name.strip()]
+    unknown = [name for name in names if name not in VARIANTS]
+    if unknown:
+        parser.error(f"unbekannte Variante(n): {', '.join(unknown)}")
+
+    data, (texts, labels) = load_data(args)
+    if len(set(labels)) < 2 or min(labels.count(0), labels.count(1)) < args.folds:
+        raise SystemExit(f"Zu wenige Beispiele je Klasse für {args.folds} Folds.")
+
+    model_store.MODEL_BASE = tempfile.mkdtemp(prefix="cozymail-eval-")
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "sklearn": sklearn.__version__,
+        "data": data,
+        "samples": {"spam": labels.count(1), "ham": labels.count(0)},
+        "folds": args.folds,
+        "seed": args.seed,
+        "threshold": model_utils.SPAM_THRESHOLD,
+        "variants": {},
+    }
+    for name in names:
+        print(f"[i] Werte {name} aus …", file=sys.stderr)
+        results["variants"][name] = evaluate_variant(name, texts, labels, args)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Ergebnisse gespeichert: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
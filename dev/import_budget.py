@@ -0,0 +1,106 @@
+# import_budget.py
+# Startkosten der Einstiegspunkte: Importzeit und RSS nach dem Import, jeweils in einem
+# frischen Interpreter gemessen, dazu die teuersten Pakete laut "python -X importtime".
+#
+# Aufruf (aus dem Projektverzeichnis):
+#   python3 -m dev.import_budget [--top 5] [--budget-ms 1000] [--budget-mb 150] [modul ...]
+# Mit --budget-ms/--budget-mb endet das Skript mit Exitcode 1, sobald ein Einstiegspunkt
+# darüber liegt (oder sich nicht importieren lässt).
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ("app", "idle_mail_watcher", "watcher_supervisor", "spam_filter",
+                "feedback_trainer", "inference_server", "spam_model_trainer")
+
+# Läuft im Kindprozess: importiert das Modul (leer = nichts) und meldet Zeit und RSS
+PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+if sys.argv[1]:
+    importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+print(json.dumps({"ms": elapsed * 1000, "rss_mb": rss_kb / 1024}))
+"""
+
+
+def heaviest_packages(importtime_log, skip, top):
+    """Pakete mit der größten kumulierten Importzeit (ms) aus der Ausgabe von -X importtime."""
+    packages = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative = int(cumulative)
+        except ValueError:
+            continue
+        name = name.strip()
+        root = name.split(".")[0]
+        if root != name or root == skip:
+            continue
+        packages[root] = max(packages.get(root, 0), cumulative / 1000)
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def measure(module, top):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE, module],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        return {"module": module, "error": errors[-1] if errors else f"Exitcode {result.returncode}"}
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["module"] = module
+    report["packages"] = heaviest_packages(result.stderr, module, top)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importzeit und Grund-RSS der Einstiegspunkte")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--top", type=int, default=5, help="so viele teuerste Pakete je Einstiegspunkt")
+    parser.add_argument("--budget-ms", type=float, help="höchstens so viele Millisekunden Importzeit")
+    parser.add_argument("--budget-mb", type=float, help="höchstens so viel RSS (MB) nach dem Import")
+    args = parser.parse_args()
+
+    baseline = measure("", 0)
+    print(f"Interpreter ohne Import: {baseline['rss_mb']:.1f} MB RSS\n")
+    print(f"{'Einstiegspunkt':<22} {'Import ms':>10} {'RSS MB':>8} {'+RSS MB':>8}")
+
+    over = []
+    for module in args.modules:
+        report = measure(module, args.top)
+        if "error" in report:
+            print(f"{module:<22} Fehler: {report['error']}")
+            over.append(module)
+            continue
+        flags = []
+        if args.budget_ms is not None and report["ms"] > args.budget_ms:
+            flags.append(f"> {args.budget_ms:.0f} ms")
+        if args.budget_mb is not None and report["rss_mb"] > args.budget_mb:
+            flags.append(f"> {args.budget_mb:.0f} MB")
+        if flags:
+            over.append(module)
+        print(f"{module:<22} {report['ms']:>10.0f} {report['rss_mb']:>8.1f} "
+              f"{report['rss_mb'] - baseline['rss_mb']:>8.1f}  {'  '.join(flags)}")
+        if report["packages"]:
+            print("    " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in report["packages"]))
+
+    if over and (args.budget_ms is not None or args.budget_mb is not None):
+        print(f"\nÜber Budget: {', '.join(over)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
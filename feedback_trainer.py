@@ -0,0 +1,189 @@
+# feedback_trainer.py
+# Hintergrund-Training aus der Feedback-Queue (Tabelle feedback_queue).
+#
+# Web-App und Watcher tragen Ham/Spam-Markierungen nur noch ein. Dieser Prozess
+# trainiert je Benutzer gebündelt (ein partial_fit, ein Speichern), sobald
+# FEEDBACK_BATCH_SIZE Ereignisse anstehen oder das älteste FEEDBACK_MAX_DELAY
+# Sekunden wartet. Es läuft immer nur eine Instanz (Lock-Datei), dadurch gehen
+# bei gleichzeitigen Klicks keine Updates verloren. Korpus und Reputation werden je
+# Eintrag genau einmal fortgeschrieben; scheitert das Modell-Update, bleibt der Eintrag
+# offen und wird später erneut trainiert (FEEDBACK_MAX_ATTEMPTS).
+#
+# Aufruf:
+#   python3 feedback_trainer.py          # Dauerbetrieb (Systemd-Dienst)
+#   python3 feedback_trainer.py --once   # alles Anstehende sofort verarbeiten (Cron)
+
+import argparse
+import fcntl
+import os
+import sys
+import time
+from collections import defaultdict
+
+from core import metrics
+from core.config import (FEATURE_CACHE_DAYS, FEEDBACK_BATCH_SIZE, FEEDBACK_LOCK_FILE, FEEDBACK_MAX_DELAY,
+                         FEEDBACK_POLL_INTERVAL, FEEDBACK_RETENTION_DAYS, REPUTATION_FEEDBACK_WEIGHT)
+from core.corpus import add_samples
+from core.database import get_db_connection
+from core.features import load_features, purge_features
+from core.feedback import load_pending, mark_failed, mark_processed, mark_recorded, pending_by_user, purge_processed
+from core.logger import get_logger, write_train_log
+from core.reputation import purge_reputation, record
+from model_utils import update_model
+
+logger = get_logger("feedback_trainer")
+
+# Aufräumen verarbeiteter Einträge höchstens einmal pro Stunde
+PURGE_INTERVAL = 3600
+
+
+def load_usernames():
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, username FROM users")
+        return {row["id"]: row["username"] for row in cursor.fetchall()}
+
+
+def log_per_account(user_id, rows, message):
+    accounts = {row["account_username"] for row in rows if row["account_username"]}
+    for account_name in sorted(accounts):
+        write_train_log(user_id, account_name, message)
+
+
+def record_feedback(user_id, username, rows):
+    """
+    Schreibt Korpus und Reputation für noch nicht erfasste Einträge in einer Transaktion
+    fort und merkt sich das (recorded_at) – ein erneuter Trainingsversuch zählt nicht doppelt.
+    """
+    rows = [row for row in rows if not row["recorded_at"]]
+    if not rows:
+        return
+    try:
+        with get_db_connection() as conn:
+            # Benutzer-Feedback überschreibt frühere Urteile des Watchers im Korpus –
+            # auch wenn noch kein Modell existiert, steht es so dem nächsten Training zur Verfügung
+            add_samples(user_id, [{"text": row["text"], "label": row["label"], "account_id": row["account_id"]}
+                                  for row in rows], "feedback", overwrite=True, conn=conn)
+            record(user_id, [(row["sender"], row["label"] == 1, REPUTATION_FEEDBACK_WEIGHT)
+                             for row in rows if row["sender"]], conn=conn)
+            mark_recorded([row["id"] for row in rows], conn)
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Korpus/Reputation konnten nicht fortgeschrieben werden ({username}): {e}")
+
+
+def train_user(user_id, username):
+    """Wendet alle anstehenden Einträge eines Benutzers in einem Mini-Batch an."""
+    rows = load_pending(user_id)
+    if not rows:
+        return 0
+    ids = [row["id"] for row in rows]
+    labels = [row["label"] for row in rows]
+
+    record_feedback(user_id, username, rows)
+
+    # Wortzählungen aus der Klassifikation wiederverwenden (Feature-Cache)
+    try:
+        cached = load_features((row["account_id"], row["uid"]) for row in rows)
+    except Exception as e:
+        logger.error(f"Feature-Cache nicht lesbar ({username}): {e}")
+        cached = {}
+    features = [cached.get((row["account_id"], str(row["uid"]))) for row in rows]
+
+    try:
+        result = update_model(username, [row["text"] for row in rows], labels, features=features)
+    except Exception as e:
+        given_up = mark_failed(ids, str(e))
+        msg = f"Feedback-Training fehlgeschlagen für {username}: {e}"
+        msg += f" – {given_up} Einträge aufgegeben" if given_up else " – neuer Versuch folgt"
+        logger.error(msg)
+        log_per_account(user_id, rows, f"❌ {msg}")
+        metrics.incr("feedback_retried", len(ids) - given_up)
+        metrics.incr("feedback_failed", given_up)
+        return 0
+
+    if result is None:
+        log_per_account(user_id, rows, "❌ Kein Vektorizer vorhanden – Training abgebrochen.")
+        mark_processed(ids, error="kein Modell")
+        return 0
+
+    prev_counts, new_counts = result
+    mark_processed(ids)
+    metrics.incr("feedback_trained", len(ids))
+
+    by_account = defaultdict(list)
+    for row in rows:
+        by_account[row["account_username"]].append(row)
+    for account_name, account_rows in by_account.items():
+        if not account_name:
+            continue
+        spam = sum(1 for row in account_rows if row["label"] == 1)
+        write_train_log(user_id, account_name, (
+            f"✅ Training (Feedback): {len(account_rows) - spam} Ham, {spam} Spam – "
+            f"Klassen: [0, 1], Counts vorher: {prev_counts}, nachher: {new_counts}"
+        ))
+    logger.info(f"Feedback für {username}: {len(ids)} Einträge trainiert")
+    return len(ids)
+
+
+def run_once(force=False):
+    """Trainiert alle fälligen Benutzer (mit force=True: alle mit anstehenden Einträgen)."""
+    pending = pending_by_user()
+    if not pending:
+        return 0
+    usernames = load_usernames()
+    trained = 0
+    for user_id, (count, age) in pending.items():
+        if not (force or count >= FEEDBACK_BATCH_SIZE or age >= FEEDBACK_MAX_DELAY):
+            continue
+        username = usernames.get(user_id)
+        if not username:
+            mark_processed([row["id"] for row in load_pending(user_id)], error="Benutzer fehlt")
+            continue
+        trained += train_user(user_id, username)
+    return trained
+
+
+def acquire_lock(path=FEEDBACK_LOCK_FILE):
+    """Lock-Datei für den Einzelbetrieb; liefert das offene File-Objekt oder None."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock = open(path, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    lock.write(str(os.getpid()))
+    lock.flush()
+    return lock
+
+
+def run():
+    logger.info("Feedback-Trainer gestartet")
+    last_purge = 0.0
+    while True:
+        try:
+            run_once()
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                purge_processed(FEEDBACK_RETENTION_DAYS)
+                purge_features(FEATURE_CACHE_DAYS)
+                purge_reputation()
+                last_purge = time.monotonic()
+        except Exception as e:
+            logger.error(f"Fehler im Feedback-Trainer: {e}")
+        time.sleep(FEEDBACK_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hintergrund-Training aus der Feedback-Queue")
+    parser.add_argument("--once", action="store_true", help="alles Anstehende verarbeiten und beenden")
+    args = parser.parse_args()
+
+    lock = acquire_lock()
+    if lock is None:
+        print("Feedback-Trainer läuft bereits.")
+        sys.exit(1)
+    if args.once:
+        print(f"{run_once(force=True)} Einträge trainiert.")
+    else:
+        run()
@@ -1,25 +1,35 @@
 # idle_mail_watcher.py
+# Schwere, selten gebrauchte Abhängigkeiten (BeautifulSoup, requests) werden erst bei
+# der ersten Verwendung importiert; der Supervisor lädt dieses Modul nur in den Workern.
 
 import threading
 import time
-import requests, os, joblib
-import socketio as client_socketio
-from bs4 import BeautifulSoup
-from core.config import MODEL_BASE
+from contextlib import nullcontext
+from core.campaigns import CampaignIndex, simhash
+from core.config import (ACCOUNT_REFRESH_INTERVAL, CAMPAIGN_DETECTION, FETCH_BATCH_SIZE, HEADER_TRIAGE,
+                         IDLE_STOP_CHECK_INTERVAL, REPUTATION_FAST_PATH, SERVER_SIDE_FILTERS,
+                         VERDICT_CACHE)
 from core.crypto import decrypt
+from core.corpus import add_samples
+from core.features import delete_features, save_features
 from core.database import get_db_connection
-from core.logger import setup_main_logger, write_error_log, write_mail_log
+from core.feedback import LABEL_SPAM, enqueue_feedback
+from core import metrics
+from core.startup_scheduler import StartupScheduler, warmup_priorities
+from core.filters import (NEEDS_BODY, count_usage, filter_target, load_active_filters,
+                          match_filter, move_uids, run_server_filters, split_server_rules)
+from core.header_rules import HeaderRules, sender_authenticated
+from core.logger import setup_main_logger, write_error_log, write_mail_log, write_system_log
+from core.reputation import ReputationCache
 from core.utils import safe_decode_header, get_header_case_insensitive
+from core.verdict_cache import VerdictCache, content_key
 from email import message_from_bytes
-from email.header import decode_header
-from email.utils import parseaddr, parsedate_to_datetime
-from flask_socketio import SocketIO
+from email.utils import parsedate_to_datetime
 from imapclient import IMAPClient
-from imap_tools import MailBox, AND
+from imap_tools import MailBox
+from core.model_store import mail_text
+from core.inference import classify_with_features
 from spam_filter import is_whitelisted, get_header_value
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
-from urllib.parse import unquote
 
 setup_main_logger()
 
@@ -27,21 +37,14 @@ CHECK_TIMEOUT = 300  # alle 5 Minuten IDLE erneuern
 NOTIFY_ENDPOINT = 'http://localhost/notify'  # WebSocket-Post-Endpoint
 DEBUG = False
 
-def is_spam(user_object, subject, body):
-    username = user_object["username"]
-    model_dir = os.path.join(MODEL_BASE, username)
-    model_path = os.path.join(model_dir, "spam_model.pkl")
-    vectorizer_path = os.path.join(model_dir, "spam_vectorizer.pkl")
-
-    try:
-        model = joblib.load(model_path)
-        vectorizer = joblib.load(vectorizer_path)
-        features = vectorizer.transform([subject + "\n" + body])
-        prediction = model.predict(features)[0]
-        return prediction == 1
-    except Exception as e:
-        if DEBUG: print(f"[!] Fehler bei Klassifikation für {username}: {e}")
-        return False
+# Fingerabdrücke der zuletzt vom Modell bewerteten Mails (für alle IDLE-Threads des Prozesses)
+campaign_index = CampaignIndex()
+# Absender-Reputation je Benutzer (Dict-Zugriff vor dem Modell)
+reputation_cache = ReputationCache()
+# Header-Regeln aus core/config.py, einmal kompiliert
+header_rules = HeaderRules()
+# Aufbereitung und Modellurteil bereits gesehener Mails (Mehrfachzustellung an mehrere Konten)
+verdict_cache = VerdictCache()
 
 def safe_parse_date(date_str):
     try:
@@ -59,79 +62,119 @@ def safe_parse_date(date_str):
 def decode_subject(value):
     return safe_decode_header(value)
 
-def fetch_unseen_mails(account):
+def parse_mail_body(mime_msg):
+    """Liefert (text_body, html_body, html_raw) einer geparsten Mail."""
+    html_body = ""
+    html_raw = ""
+    text_body = ""
+    if mime_msg.is_multipart():
+        for part in mime_msg.walk():
+            ctype = part.get_content_type()
+            disp = str(part.get("Content-Disposition"))
+            try:
+                content = part.get_payload(decode=True).decode(
+                    part.get_content_charset() or 'utf-8',
+                    errors='replace'
+                )
+            except Exception:
+                continue
+
+            if ctype == 'text/plain' and 'attachment' not in disp:
+                text_body = content
+            elif ctype == 'text/html' and 'attachment' not in disp:
+                html_raw = content
+                html_body = clean_html(content)
+    else:
+        ctype = mime_msg.get_content_type()
+        try:
+            content = mime_msg.get_payload(decode=True).decode(
+                mime_msg.get_content_charset() or 'utf-8',
+                errors='replace'
+            )
+            if ctype == 'text/plain':
+                text_body = content
+            elif ctype == 'text/html':
+                html_raw = content
+                html_body = clean_html(content)
+        except Exception:
+            pass
+    return text_body, html_body, html_raw
+
+def build_msg(uid, raw, body_loaded=True, user_id=None):
+    """
+    Baut das Mail-Objekt für die Verarbeitung. Mit body_loaded=False enthält raw
+    nur den Header (BODY.PEEK[HEADER]) – Textteile bleiben leer, bis load_bodies() sie nachlädt.
+    Mit user_id werden die Textteile einer schon einmal zugestellten Mail aus dem Urteils-Cache übernommen.
+    """
+    mime_msg = message_from_bytes(raw)
+
+    msg = type("Msg", (), {})()
+    msg.uid = uid
+    msg.subject = decode_subject(mime_msg.get("Subject", ""))
+    msg.from_ = safe_decode_header(mime_msg.get("From", ""))
+    msg.headers = dict(mime_msg.items())
+    msg.date = safe_parse_date(mime_msg.get("Date")) if mime_msg.get("Date") else None
+    msg.body_loaded = body_loaded
+    msg.content_key = None
+    msg.text, msg.html_body, msg.html_raw = "", "", ""
+    if body_loaded:
+        if VERDICT_CACHE and user_id is not None:
+            msg.content_key = content_key(mime_msg.get("Message-ID"), raw)
+        parsed = verdict_cache.parsed(user_id, msg.content_key)
+        if parsed is None:
+            parsed = parse_mail_body(mime_msg)
+            verdict_cache.add_parsed(user_id, msg.content_key, parsed)
+        msg.text, msg.html_body, msg.html_raw = parsed
+    msg.obj = mime_msg
+    return msg
+
+def _fetch_chunks(client, uids, items):
+    for i in range(0, len(uids), FETCH_BATCH_SIZE):
+        chunk = uids[i:i + FETCH_BATCH_SIZE]
+        yield client.fetch(chunk, items)
+
+def fetch_unseen_mails(account, client, headers_only=False):
+    """
+    Holt alle ungelesenen Mails der INBOX über die bestehende Sitzung.
+    headers_only=True lädt nur die Header (Triage) – die Bodies folgen bei Bedarf per load_bodies().
+    """
     unseen_messages = []
     try:
-        if DEBUG: print(f"[DEBUG] Verbinde zu {account['email']} via IMAPClient")
-        with IMAPClient(account['server'], ssl=True) as client:
-            client.login(account['username'], decrypt(account['password_enc']))
-            client.select_folder('INBOX')
-            uids = client.search(['UNSEEN'])
-            if DEBUG: print(f"[DEBUG] {len(uids)} ungelesene UIDs für {account['email']}")
-            for uid in uids:
+        uids = client.search(['UNSEEN'])
+        if DEBUG: print(f"[DEBUG] {len(uids)} ungelesene UIDs für {account['email']}")
+        items = ['BODY.PEEK[HEADER]'] if headers_only else ['BODY.PEEK[]']
+        key = b'BODY[HEADER]' if headers_only else b'BODY[]'
+        for msg_data in _fetch_chunks(client, uids, items):
+            for uid, data in msg_data.items():
                 try:
-                    msg_data = client.fetch([uid], ['BODY.PEEK[]'])
-                    raw_msg = msg_data[uid][b'BODY[]']
-                    mime_msg = message_from_bytes(raw_msg)
-                    subject = decode_subject(mime_msg.get("Subject", ""))
-                    sender = safe_decode_header(mime_msg.get("From", ""))
-                    msg_id = mime_msg.get("Message-ID", None)
-                    date = safe_parse_date(mime_msg.get("Date")) if mime_msg.get("Date") else None
-                    headers = dict(mime_msg.items())
-
-                    body = ""
-                    html_body = ""
-                    html_raw = ""
-                    text_body = ""
-                    if mime_msg.is_multipart():
-                        for part in mime_msg.walk():
-                            ctype = part.get_content_type()
-                            disp = str(part.get("Content-Disposition"))
-                            try:
-                                content = part.get_payload(decode=True).decode(
-                                    part.get_content_charset() or 'utf-8',
-                                    errors='replace'
-                                )
-                            except Exception:
-                                continue
-
-                            if ctype == 'text/plain' and 'attachment' not in disp:
-                                text_body = content
-                            elif ctype == 'text/html' and 'attachment' not in disp:
-                                html_raw = content
-                                html_body = clean_html(content)
-                    else:
-                        ctype = mime_msg.get_content_type()
-                        try:
-                            content = mime_msg.get_payload(decode=True).decode(
-                                mime_msg.get_content_charset() or 'utf-8',
-                                errors='replace'
-                            )
-                            if ctype == 'text/plain':
-                                text_body = content
-                            elif ctype == 'text/html':
-                                html_raw = content
-                                html_body = clean_html(content)
-                        except Exception:
-                            pass
-
-                    msg = type("Msg", (), {})()
-                    msg.uid = uid
-                    msg.subject = subject
-                    msg.from_ = sender
-                    msg.headers = headers
-                    msg.date = date
-                    msg.text = text_body
-                    msg.html_body = html_body
-                    msg.html_raw = html_raw
-                    msg.obj = mime_msg
-
+                    msg = build_msg(uid, data[key], body_loaded=not headers_only, user_id=account["user_id"])
                     unseen_messages.append(msg)
+                    metrics.incr("bytes_fetched", len(data[key]))
                 except Exception as mail_error:
                     if DEBUG: print(f"[!] Fehler beim Verarbeiten von UID={uid}: {mail_error}")
     except Exception as e:
         if DEBUG: print(f"[!] Fehler beim Abrufen via imapclient: {e}")
-    return unseen_messages
+    return sorted(unseen_messages, key=lambda m: m.uid)
+
+def load_bodies(account, client, msgs):
+    """Lädt die vollständigen Nachrichten für bisher nur per Header bekannte Mails nach."""
+    todo = {m.uid: m for m in msgs if not m.body_loaded}
+    if not todo:
+        return
+    for msg_data in _fetch_chunks(client, list(todo), ['BODY.PEEK[]']):
+        for uid, data in msg_data.items():
+            msg = todo.get(uid)
+            if msg is None or b'BODY[]' not in data:
+                continue
+            try:
+                full = build_msg(uid, data[b'BODY[]'], user_id=account["user_id"])
+                msg.text, msg.html_body, msg.html_raw = full.text, full.html_body, full.html_raw
+                msg.content_key = full.content_key
+                msg.obj = full.obj
+                msg.body_loaded = True
+                metrics.incr("bytes_fetched", len(data[b'BODY[]']))
+            except Exception as mail_error:
+                if DEBUG: print(f"[!] Fehler beim Nachladen von UID={uid}: {mail_error}")
 
 def sync_seen_flags(account):
     """Setzt auf dem IMAP-Server alle Mails als gelesen, die in der DB seen=1 haben."""
@@ -191,77 +234,23 @@ def load_whitelist(user_id):
         cursor.execute("SELECT sender_address FROM whitelist WHERE user_id = ?", (user_id,))
         return [row[0] for row in cursor.fetchall()]
 
-def apply_filters(account, msg):
+def apply_filters(account, msg, filters=None):
     try:
-        with get_db_connection() as conn:
-            cur = conn.cursor()
-            # Reihenfolge stabil halten (ältere Regeln zuerst)
-            cur.execute("""
-                SELECT id, field, mode, value, target_folder, is_read
-                FROM filters
-                WHERE account_id = ? AND user_id = ? AND active = 1
-                ORDER BY created_at ASC, id ASC
-            """, (account["id"], account["user_id"]))
-            filters = cur.fetchall()
-
-            for fid, field, mode, value, target_folder, is_read in filters:
-                # Kandidaten-Text bestimmen
-                if field == "subject":
-                    haystack = msg.subject or ""
-                elif field in ("sender", "from"):
-                    raw = msg.from_ or ""
-                    _, haystack = parseaddr(raw)
-                elif field == "to":
-                    raw = msg.headers.get("To", "") or ""
-                    _, haystack = parseaddr(raw)
-                elif field == "body":
-                    haystack = msg.text or ""
-                elif field == "headers":
-                    haystack = str(msg.headers)
-                else:
-                    continue  # unbekanntes Feld
-
-                match = False
-                if mode == "regex":
-                    import re
-                    try:
-                        match = bool(re.search(value, haystack or "", flags=re.IGNORECASE))
-                    except re.error:
-                        continue  # kaputtes Regex ignorieren
-                else:
-                    needle = (value or "").lower()
-                    hay = (haystack or "").lower()
-                    if mode == "contains":
-                        match = needle in hay
-                    elif mode == "startswith":
-                        match = hay.startswith(needle)
-                    elif mode == "endswith":
-                        match = hay.endswith(needle)
-                    elif mode == "exact":
-                        match = hay == needle
-
-                if match:
-                    # Treffer zählen (ohne zweite DB-Verbindung)
-                    try:
-                        cur.execute("""
-                            UPDATE filters
-                               SET usage_count = COALESCE(usage_count, 0) + 1,
-                                   last_used   = CURRENT_TIMESTAMP
-                             WHERE id = ?
-                        """, (fid,))
-                        conn.commit()
-                    except Exception as stat_err:
-                        if DEBUG: print(f"[!] Konnte usage_count nicht erhöhen (Filter {fid}): {stat_err}")
-
-                    decoded_folder = unquote(target_folder) or "INBOX"
-                    if DEBUG:
-                        print(f"[DEBUG] Filterregel greift für UID={msg.uid} → {field} {mode} {value} → {decoded_folder}, is_read={is_read}")
-                    return {
-                        "target_folder": decoded_folder,
-                        "is_read": bool(is_read)
-                    }
+        if filters is None:
+            filters = load_active_filters(account)
+
+        for f in filters:
+            match = match_filter(f, msg)
+            if match is NEEDS_BODY:
+                return NEEDS_BODY  # Regel braucht den Body – Entscheidung vertagen
+            if match:
+                count_usage(f["id"])
+                target = filter_target(f)
+                if DEBUG:
+                    print(f"[DEBUG] Filterregel greift für UID={msg.uid} → {f['field']} {f['mode']} {f['value']} → {target['target_folder']}, is_read={target['is_read']}")
+                return target
 
-            return None
+        return None
     except Exception as e:
         if DEBUG:
             print(f"[!] Fehler beim Anwenden der Filter für UID={getattr(msg, 'uid', '?')}: {e}")
@@ -324,24 +313,15 @@ def process_flagged_mails(account):
 
         for row in rows:
             subject = row["subject"] or ""
-            body = row["body"] or row["raw"] or ""
             uid = row["uid"]
-            username = account["username"]
-
-            model_dir = os.path.join(MODEL_BASE, username)
-            model_path = os.path.join(model_dir, "spam_model.pkl")
-            vectorizer_path = os.path.join(model_dir, "spam_vectorizer.pkl")
-
-            if os.path.exists(vectorizer_path):
-                vectorizer = joblib.load(vectorizer_path)
-                X = vectorizer.transform([subject + "\n" + body])
-                if os.path.exists(model_path):
-                    model = joblib.load(model_path)
-                else:
-                    model = MultinomialNB()
-                    model.partial_fit(X, [1], classes=[0, 1])
-                model.partial_fit(X, [1])
-                joblib.dump(model, model_path)
+
+            try:
+                # Gleicher Text wie bei der Klassifikation: Textteil, ersatzweise das Original-HTML
+                text = mail_text(subject, row["body"], row["html_raw"])
+                enqueue_feedback(account["user_id"], account["id"], text, LABEL_SPAM,
+                                 "flagged_spam", subject, conn=conn, uid=uid, sender=row["sender"])
+            except Exception as e:
+                write_error_log(account["user_id"], account["username"], f"Training (Spam) fehlgeschlagen UID={uid}: {e}")
 
             try:
                 password = decrypt(account["password_enc"])
@@ -391,146 +371,356 @@ def process_flagged_mails(account):
             cursor.execute("DELETE FROM mails WHERE id = ?", (row["id"],))
         conn.commit()
 
-def idle_monitor(account):
+def get_spam_level(msg):
+    spam_level_raw = get_header_case_insensitive(msg.headers, "X-Spam-Level")
+    spam_level_str = safe_decode_header(spam_level_raw)
+    return spam_level_str.count("*") if spam_level_str else 0
+
+def load_known_uids(account_id):
+    """UIDs, die bereits klassifiziert und in der DB gespeichert sind."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT uid FROM mails WHERE account_id = ?", (account_id,))
+        return {int(row[0]) for row in cursor.fetchall()}
+
+def decide_mail(account, msg, whitelist, known_uids, filters=None):
+    """
+    Entscheidet, was mit einer Mail passiert. Solange nur der Header geladen ist,
+    liefert die Funktion None, sobald für die Entscheidung der Body nötig wäre.
+    Aktionen: filter, spam, store, known (bereits gespeichert – nichts zu tun).
+    "by" nennt bei spam/store die entscheidende Stufe (level, header, reputation, cache, campaign, ml);
+    "error" heißt: Das Modell war nicht verfügbar, die Mail bleibt ohne Urteil in der INBOX.
+    """
+    # 1. Filter
+    target = apply_filters(account, msg, filters)
+    if target is NEEDS_BODY:
+        return None
+    if target:
+        return {"action": "filter", "target": target}
+
+    if int(msg.uid) in known_uids:
+        return {"action": "known"}
+
+    # 2. Whitelist
+    if is_whitelisted(msg.from_, whitelist):
+        # if DEBUG: print(f"[DEBUG] Absender {msg.from_} auf Whitelist – keine Spamprüfung")
+        return {"action": "store"} if msg.body_loaded else None
+
+    # 3. Spamprüfung – erst die Server-Header, dann die Absender-Reputation, dann das ML-Modell
+    spam_level = get_spam_level(msg)
+    x_level = account.get("x_spam_level") or 5
+    if spam_level >= x_level:
+        return {"action": "spam", "spam_level": spam_level, "reason": f"Level {spam_level} ≥ {x_level}", "by": "level"}
+    rule = header_rules.evaluate(msg)
+    if rule is not None:
+        if not rule.is_spam and not msg.body_loaded:
+            return None
+        header_rules.count(rule)
+        if rule.is_spam:
+            return {"action": "spam", "spam_level": spam_level, "reason": f"Header-Regel {rule.name}", "by": "header"}
+        return {"action": "store", "by": "header"}
+    if REPUTATION_FAST_PATH:
+        reputed = reputation_cache.lookup(account["user_id"], msg.from_)
+        if reputed:
+            metrics.incr("reputation_spam")
+            return {"action": "spam", "spam_level": spam_level, "reason": "Absender-Reputation", "by": "reputation"}
+        # Ham nur bei bestätigter From-Domain – den Absender kann sonst jeder fälschen
+        if reputed is False and msg.body_loaded and sender_authenticated(msg, msg.from_):
+            metrics.incr("reputation_ham")
+            return {"action": "store", "by": "reputation"}
+    if not msg.body_loaded:
+        return None
+
+    # Das ML-Urteil fällt gesammelt für alle Mails des Durchlaufs (classify_ml_batch)
+    return {"action": "ml", "spam_level": spam_level}
+
+def classify_ml_batch(account, decided):
+    """Ersetzt alle 'ml'-Entscheidungen durch spam/store – mit einer Batch-Klassifikation."""
+    todo = [(i, msg) for i, (msg, decision) in enumerate(decided)
+            if decision and decision["action"] == "ml"]
+    if not todo:
+        return
+
+    # Mehrfachzustellungen übernehmen das Urteil, das dieselbe Mail auf einem anderen Konto des
+    # Benutzers bekommen hat; Spam-Wellen: nahezu gleiche Mails übernehmen das Urteil einer kürzlich bewerteten Mail
+    texts, fingerprints, remaining = [], [], []
+    for i, msg in todo:
+        cached = verdict_cache.verdict(account["user_id"], msg.content_key)
+        if cached is not None:
+            score, prediction, feature = cached
+            if prediction:
+                if DEBUG: print(f"[DEBUG] 3. Spamprüfung: Mehrfachzustellung → UID={msg.uid} (p={score:.2f})")
+                decided[i] = (msg, {"action": "spam", "spam_level": decided[i][1]["spam_level"], "reason": "ML",
+                                    "by": "cache"})
+            else:
+                decided[i] = (msg, {"action": "store", "features": feature, "by": "cache"})
+            continue
+        text = mail_text(msg.subject, msg.text, msg.html_raw)
+        fingerprint = simhash(text) if CAMPAIGN_DETECTION else None
+        known = campaign_index.lookup(fingerprint, account["user_id"])
+        if known is None:
+            texts.append(text)
+            fingerprints.append(fingerprint)
+            remaining.append((i, msg))
+        elif known:
+            if DEBUG: print(f"[DEBUG] 3. Spamprüfung: Spam-Welle → UID={msg.uid}")
+            decided[i] = (msg, {"action": "spam", "spam_level": decided[i][1]["spam_level"], "reason": "Spam-Welle",
+                                "by": "campaign"})
+        else:
+            decided[i] = (msg, {"action": "store", "by": "campaign"})
+    todo = remaining
+    if not todo:
+        return
+
+    failed = False
+    try:
+        results, features = classify_with_features(account["user"]["username"], texts)
+    except Exception as e:
+        if DEBUG: print(f"[!] Fehler bei Klassifikation für {account['user']['username']}: {e}")
+        metrics.incr("ml_errors", len(todo))
+        results, features = [(0.0, False)] * len(todo), [None] * len(todo)
+        failed = True
+    metrics.incr("ml_calls")
+    metrics.incr("ml_messages", len(todo))
+
+    for (i, msg), (score, prediction), feature, fingerprint in zip(todo, results, features, fingerprints):
+        if failed:
+            # Zustellen, aber nirgends als Ham-Urteil verbuchen (Korpus, Reputation, Feature-Cache) und
+            # nicht merken – Spam-Welle und Mehrfachzustellungen sollen nur echte Modellurteile übernehmen
+            decided[i] = (msg, {"action": "store", "by": "error"})
+            continue
+        campaign_index.add(fingerprint, account["user_id"], prediction)
+        verdict_cache.add_verdict(account["user_id"], msg.content_key, score, prediction, feature)
+        decision = decided[i][1]
+        if prediction:
+            if DEBUG: print(f"[DEBUG] 3. Spamprüfung: Treffer → UID={msg.uid} → ML (p={score:.2f})")
+            decided[i] = (msg, {"action": "spam", "spam_level": decision["spam_level"], "reason": "ML", "by": "ml"})
+        else:
+            decided[i] = (msg, {"action": "store", "features": feature, "by": "ml"})
+
+def move_to_junk(account, password, msg, spam_level, reason):
+    if DEBUG:
+        print(f"[DEBUG] X   Spam erkannt UID={msg.uid} - From={msg.from_} – Verschiebe in Junk ({reason})")
+        print(f"[DEBUG] XX  Zielordner für Junk: {account.get('junk_folder')}")
+    with MailBox(account["server"]).login(account["username"], password) as mailbox:
+        mailbox.folder.set("INBOX")
+        mailbox.flag(str(msg.uid), 'Junk', True)
+        result = mailbox.move(str(msg.uid), account["junk_folder"])
+        if DEBUG: print(f"[DEBUG] XXX Ergebnis von mailbox.move(): {result}")
+    write_mail_log(account["user_id"], account["username"], msg, spam_level, reason)
+    metrics.incr("mails_spam")
+
+def remember_verdicts(account, decided):
+    """Übernimmt die Spam/Ham-Urteile eines Durchlaufs als Beispiele in den lokalen Trainingskorpus."""
+    samples = []
+    for msg, decision in decided:
+        action = decision["action"] if decision else None
+        if action not in ("spam", "store") or not msg.body_loaded or decision.get("by") == "error":
+            continue
+        samples.append({
+            "text": mail_text(msg.subject, msg.text, msg.html_raw),
+            "label": 1 if action == "spam" else 0,
+            "account_id": account["id"],
+            "folder": "INBOX",
+            "uid": int(msg.uid),
+            "msg_id": get_header_case_insensitive(msg.headers, "Message-ID") or None,
+        })
+    try:
+        metrics.incr("corpus_added", add_samples(account["user_id"], samples, "watcher"))
+    except Exception as e:
+        write_error_log(account["user_id"], account["username"], f"Korpus konnte nicht ergänzt werden: {e}")
+
+def remember_senders(account, decided):
+    """
+    Schreibt die Absender-Reputation aus den Urteilen von Server-Headern und Modell fort.
+    Spam-Wellen zählen nicht: Sie übernehmen nur ein Modellurteil, das schon einmal gezählt wurde.
+    """
+    events = [(msg.from_, decision["action"] == "spam", 1.0) for msg, decision in decided
+              if decision and decision.get("by") in ("level", "header", "ml")]
+    if not events:
+        return
+    try:
+        reputation_cache.record(account["user_id"], events)
+    except Exception as e:
+        write_error_log(account["user_id"], account["username"], f"Reputation konnte nicht fortgeschrieben werden: {e}")
+
+def remember_features(account, decided):
+    """Speichert die Wortzählungen behaltener Mails für späteres Ham/Spam-Feedback (Feature-Cache)."""
+    entries = [(msg.uid, *decision["features"]) for msg, decision in decided
+               if decision and decision["action"] == "store" and decision.get("by") != "error"
+               and decision.get("features")]
+    try:
+        metrics.incr("features_cached", save_features(account["id"], entries))
+    except Exception as e:
+        write_error_log(account["user_id"], account["username"], f"Feature-Cache konnte nicht ergänzt werden: {e}")
+
+def store_and_notify(account, msg):
+    # if DEBUG: print(f"[DEBUG] Kein Spam und kein Filter – speichere Mail UID={msg.uid} - Account={account['email']} - FROM={msg.from_}")
+    import requests
+
+    try:
+        save_mail_to_db(account, msg)
+
+        # Nur HTTP-Benachrichtigung senden
+        try:
+            requests.post(NOTIFY_ENDPOINT, json={
+                "account_id": account['id'],
+                "subject": msg.subject[:100],
+                "uid": msg.uid
+            }, timeout=2)
+        except Exception as notify_error:
+            if DEBUG: print(f"[!] Fehler beim HTTP Notify: {notify_error}")
+
+    except Exception as inner_error:
+        write_error_log(account["user_id"], account["username"], f"Mail-Verarbeitung fehlgeschlagen: {inner_error}")
+
+    try:
+        requests.post(NOTIFY_ENDPOINT, json={
+            "user": account["username"],
+            "msg": f"Neue Nachricht bei {account['email']}"
+        })
+    except Exception as ping_error:
+        write_error_log(0, account["username"], f"Fehler beim POST an {NOTIFY_ENDPOINT}: {ping_error}")
+
+def process_new_mails(account, password, client):
+    """
+    Verarbeitet die ungelesenen Mails in zwei Stufen: Mit HEADER_TRIAGE werden zunächst
+    nur Header geladen, Filter/Whitelist/X-Spam-Level entscheiden; die Bodies werden
+    anschließend gesammelt nur für Mails geladen, die noch ML oder Speicherung brauchen.
+    """
+    filters = load_active_filters(account)
+    if SERVER_SIDE_FILTERS and filters:
+        # Einfache Regeln direkt per UID SEARCH auf dem Server ausführen
+        server_rules, filters = split_server_rules(filters)
+        if server_rules:
+            moved, unrun = run_server_filters(client, server_rules)
+            filters = unrun + filters
+            metrics.incr("mails_filtered_server", sum(len(uids) for uids in moved.values()))
+
+    mails = fetch_unseen_mails(account, client, headers_only=HEADER_TRIAGE)
+    if not mails:
+        return
+    whitelist = load_whitelist(account["user_id"])
+    known_uids = load_known_uids(account["id"])
+
+    decided, pending = [], []
+    for msg in mails:
+        metrics.incr("mails_processed")
+        try:
+            decision = decide_mail(account, msg, whitelist, known_uids, filters)
+            if decision is None:
+                pending.append(msg)
+            else:
+                decided.append((msg, decision))
+        except Exception as inner:
+            write_error_log(0, account["username"], f"Fehler bei Mail-Verarbeitung: {inner}")
+
+    if pending:
+        metrics.incr("bodies_fetched", len(pending))
+        load_bodies(account, client, pending)
+        for msg in pending:
+            try:
+                decided.append((msg, decide_mail(account, msg, whitelist, known_uids, filters)))
+            except Exception as inner:
+                write_error_log(0, account["username"], f"Fehler bei Mail-Verarbeitung: {inner}")
+    if HEADER_TRIAGE:
+        metrics.incr("bodies_skipped", len(mails) - len(pending))
+    classify_ml_batch(account, decided)
+
+    filter_moves = {}
+    for msg, decision in decided:
+        try:
+            action = decision["action"] if decision else None
+            if action == "filter":
+                target = decision["target"]
+                filter_moves.setdefault((target["target_folder"], target["is_read"]), []).append(msg.uid)
+            elif action == "spam":
+                move_to_junk(account, password, msg, decision["spam_level"], decision["reason"])
+            elif action == "store":
+                store_and_notify(account, msg)
+        except Exception as inner:
+            write_error_log(0, account["username"], f"Fehler bei Mail-Verarbeitung: {inner}")
+    remember_verdicts(account, decided)
+    remember_senders(account, decided)
+    remember_features(account, decided)
+
+    # Lokal gefilterte Mails je Zielordner gesammelt verschieben
+    for (folder_name, is_read), uids in filter_moves.items():
+        if DEBUG: print(f"[DEBUG] Filter aktiv – verschiebe {len(uids)} Mails in {folder_name}")
+        try:
+            move_uids(client, uids, folder_name, is_read)
+            metrics.incr("mails_filtered", len(uids))
+        except Exception as move_error:
+            print(f"[!] Fehler beim Verschieben UIDs={uids} → {folder_name}: {move_error}")
+
+def wait_for_idle_event(client, stop_event=None):
+    """Wartet im IDLE bis zu CHECK_TIMEOUT auf Server-Antworten, reagiert aber zeitnah auf ein Stopp-Signal."""
+    deadline = time.time() + CHECK_TIMEOUT
+    while time.time() < deadline:
+        if stop_event is not None and stop_event.is_set():
+            return []
+        responses = client.idle_check(timeout=min(IDLE_STOP_CHECK_INTERVAL, max(0, deadline - time.time())))
+        if responses:
+            return responses
+    return []
+
+def open_inbox(account, password, scheduler=None, priority=(0,)):
+    """Meldet sich an, wählt INBOX und gleicht UIDVALIDITY über dieselbe Verbindung ab."""
+    gate = scheduler.slot(account["server"], priority) if scheduler else nullcontext()
+    with gate:
+        client = IMAPClient(account["server"], ssl=True)
+        try:
+            client.login(account["username"], password)
+            client.select_folder("INBOX")
+        except Exception:
+            try:
+                client.shutdown()
+            except Exception:
+                pass
+            raise
+    sync_account_uidvalidity(account, client)
+    return client
+
+def idle_monitor(account, stop_event=None, scheduler=None, priority=(0,)):
     email = account['email']
-    server = account['server']
     username = account['username']
-    password = decrypt(account['password_enc'])
-    user = account['user']
+    stop_event = stop_event or threading.Event()
+    warmed_up = scheduler is None
+    try:
+        password = decrypt(account['password_enc'])
+    except Exception as e:
+        # Ohne Passwort kein Login – ein neuer Versuch hilft erst nach Änderung des Kontos (neuer Thread)
+        write_error_log(account["user_id"], username, f"Passwort nicht entschlüsselbar, IDLE-Thread beendet: {e}")
+        if not warmed_up:
+            scheduler.mark_done(account["id"], ok=False)
+        return
 
-    while True:
-        # Trigger Bereinigung beim ersten Ereignis nach Start oder Push-Änderung
-        sync_account_uidvalidity(account)
+    while not stop_event.is_set():
         try:
-            with IMAPClient(server, ssl=True) as client:
-                client.login(username, password)
-                client.select_folder("INBOX")
+            # Bereinigung (UIDVALIDITY) läuft beim Verbindungsaufbau über dieselbe Sitzung
+            with open_inbox(account, password, None if warmed_up else scheduler, priority) as client:
+                if not warmed_up:
+                    scheduler.mark_done(account["id"])
+                    warmed_up = True
                 # if DEBUG: print(f"[DEBUG] IDLE aktiv für {email}")
                 client.idle()
-                responses = client.idle_check(timeout=CHECK_TIMEOUT)
-                sync_account_uidvalidity(account)  # Auch nach IMAP-Push prüfen
+                responses = wait_for_idle_event(client, stop_event)
                 client.idle_done()
+                sync_account_uidvalidity(account, client)  # Auch nach IMAP-Push prüfen
 
-                if not responses:
+                if not responses or stop_event.is_set():
                     continue
 
-            mails = fetch_unseen_mails(account)
-
-            whitelist = load_whitelist(account["user_id"])
-
-            for msg in mails:
-                try:
-                    # if DEBUG: print(f"[DEBUG] Prüfe Mail UID={msg.uid} From={msg.from_}")
-
-                    # 1. Filter
-                    target = apply_filters(account, msg)
-                    if target:
-                        folder_name = target['target_folder']
-                        if DEBUG: print(f"[DEBUG] Filter aktiv – verschiebe UID={msg.uid} in {folder_name}")
-                        with MailBox(server).login(username, password) as mailbox:
-                            mailbox.folder.set("INBOX")
-                            if not target['is_read']:
-                                mailbox.flag(str(msg.uid), ['\\Seen'], value=False)
-                            try:
-                                result = mailbox.move(str(msg.uid), folder_name)
-                                if DEBUG: print(f"[DEBUG] Ergebnis von mailbox.move(): {result}")
-                            except Exception as move_error:
-                                print(f"[!] Fehler beim Verschieben UID={msg.uid} → {folder_name}: {move_error}")
-                        continue
-
-                    # 2. Whitelist
-                    if is_whitelisted(msg.from_, whitelist):
-                        # if DEBUG: print(f"[DEBUG] Absender {msg.from_} auf Whitelist – keine Spamprüfung")
-                        save_mail_to_db(account, msg)
-                        continue
-
-                    # 3. Spamprüfung
-                    spam_level_raw = get_header_case_insensitive(msg.headers, "X-Spam-Level")
-                    spam_level_str = safe_decode_header(spam_level_raw)
-                    spam_level = spam_level_str.count("*") if spam_level_str else 0
-                    prediction = is_spam(user, msg.subject, msg.text or "")
-                    x_level = account.get("x_spam_level") or 5
-
-                    if DEBUG and (prediction or spam_level > 0):
-                        reason = []
-                        if spam_level > 0:
-                            reason.append(f"Level {spam_level}")
-                        if prediction:
-                            reason.append("Machine Learning (ML) Spam Prediction")
-                        print(f"[DEBUG] 3. Spamprüfung: Treffer → UID={msg.uid} → {' + '.join(reason)}")
-
-                    if spam_level >= x_level or prediction:
-                        if DEBUG:
-                            print(f"[DEBUG] X   Spam erkannt UID={msg.uid} - From={msg.from_} – Verschiebe in Junk")
-                            print(f"[DEBUG] XX  Spam-Level: {spam_level}, ML: {prediction}, Schwelle: {x_level}")
-                            print(f"[DEBUG] XXX Zielordner für Junk: {account.get('junk_folder')}")
-                        with MailBox(server).login(username, password) as mailbox:
-                            mailbox.folder.set("INBOX")
-                            mailbox.flag(str(msg.uid), 'Junk', True)
-                            result = mailbox.move(str(msg.uid), account["junk_folder"])
-                            if DEBUG: print(f"[DEBUG] XXXX Ergebnis von mailbox.move(): {result}")
-                            #folders = mailbox.folder.list()
-                            #if DEBUG: print("[DEBUG] Verfügbare Ordner:", [f.name for f in folders])
-                        reason = []
-                        if spam_level >= x_level:
-                            reason.append(f"Level {spam_level} ≥ {x_level}")
-                        if prediction:
-                            reason.append("ML")
-                        write_mail_log(account["user_id"], username, msg, spam_level, ", ".join(reason))
-                        continue
-
-                    # if DEBUG: print(f"[DEBUG] Kein Spam und kein Filter – speichere Mail UID={msg.uid} - Account={account['email']} - FROM={msg.from_}")
-
-                    # 4. Speichern in DB
-                    try:
-                        save_mail_to_db(account, msg)
-                        
-                        # Nur HTTP-Benachrichtigung senden
-                        try:
-                            requests.post(NOTIFY_ENDPOINT, json={
-                                "account_id": account['id'],
-                                "subject": msg.subject[:100],
-                                "uid": msg.uid
-                            }, timeout=2)
-                        except Exception as notify_error:
-                            if DEBUG: print(f"[!] Fehler beim HTTP Notify: {notify_error}")
-
-                            # Fallback: HTTP-Request
-                            requests.post(NOTIFY_ENDPOINT, json={
-                                "account_id": account['id'],
-                                "subject": msg.subject[:100],
-                                "uid": msg.uid
-                            }, timeout=2)
-
-                    except Exception as inner_error:
-                        write_error_log(account["user_id"], account["username"], f"Mail-Verarbeitung fehlgeschlagen: {inner_error}")
-
-                except Exception as inner:
-                    write_error_log(0, username, f"Fehler bei Mail-Verarbeitung: {inner}")
-
-                try:
-                    requests.post(NOTIFY_ENDPOINT, json={
-                        "user": username,
-                        "msg": f"Neue Nachricht bei {email}"
-                    })
-                except Exception as ping_error:
-                    write_error_log(0, username, f"Fehler beim POST an {NOTIFY_ENDPOINT}: {ping_error}")
+                process_new_mails(account, password, client)
 
             process_flagged_mails(account)
             sync_seen_flags(account)
 
         except Exception as e:
             write_error_log(0, username, f"Fehler im IDLE-Thread: {e}")
-            time.sleep(10)
-
-        try:
-            if 'last_sync' not in account:
-                account['last_sync'] = time.time()
-            if time.time() - account['last_sync'] > 300:
-                sync_account_uidvalidity(account)
-                account['last_sync'] = time.time()
-        except:
-            pass
+            if not warmed_up:
+                scheduler.mark_done(account["id"], ok=False)
+            stop_event.wait(10)
 
 def cleanup_inbox_mails(conn, account_id, uids_in_inbox):
     cursor = conn.cursor()
@@ -539,6 +729,7 @@ def cleanup_inbox_mails(conn, account_id, uids_in_inbox):
     uids_missing = uids_in_db - set(int(uid) for uid in uids_in_inbox)
     if uids_missing:
         cursor.executemany("DELETE FROM mails WHERE account_id = ? AND uid = ?", [(account_id, uid) for uid in uids_missing])
+        delete_features(conn, account_id, uids_missing)
         if DEBUG: print(f"[DEBUG] Entferne {len(uids_missing)} Mails aus DB für Konto-ID {account_id} (nicht mehr im Posteingang)")
 
 def clean_html(raw_html):
@@ -549,6 +740,8 @@ def clean_html(raw_html):
     - entfernt background= Attribute (externe Bilder)
     - entfernt background-image in style Attributen
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(raw_html, "lxml")
 
     # Entferne unsichere komplette Tags
@@ -576,21 +769,27 @@ def clean_html(raw_html):
                 del tag.attrs[attr]
     return str(soup)
 
-def sync_account_uidvalidity(account):
+def read_inbox_state(client):
+    folder_info = client.folder_status("INBOX", ["UIDVALIDITY", "UIDNEXT"])
+    # if DEBUG: print(f"[DEBUG] folder_info = {folder_info}")
+    new_uidvalidity = folder_info.get(b"UIDVALIDITY")
+    new_uidnext = folder_info.get(b"UIDNEXT")
+    if new_uidnext is not None:
+        new_last_uid = new_uidnext - 1
+    else:
+        new_last_uid = None
+    return new_uidvalidity, new_last_uid, client.search(["UNSEEN"])
+
+def sync_account_uidvalidity(account, client=None):
+    """Gleicht UIDVALIDITY und DB ab – über eine bestehende Sitzung (INBOX gewählt) oder eine eigene."""
     try:
-        with IMAPClient(account['server'], ssl=True) as client:
-            client.login(account['username'], decrypt(account['password_enc']))
-            client.select_folder("INBOX")
-            folder_info = client.folder_status("INBOX", ["UIDVALIDITY", "UIDNEXT"])
-            # if DEBUG: print(f"[DEBUG] folder_info = {folder_info}")
-            new_uidvalidity = folder_info.get(b"UIDVALIDITY")
-            new_uidnext = folder_info.get(b"UIDNEXT")
-            if new_uidnext is not None:
-                new_last_uid = new_uidnext - 1
-            else:
-                new_last_uid = None
-
-            uids_inbox = client.search(["UNSEEN"])
+        if client is not None:
+            new_uidvalidity, new_last_uid, uids_inbox = read_inbox_state(client)
+        else:
+            with IMAPClient(account['server'], ssl=True) as own_client:
+                own_client.login(account['username'], decrypt(account['password_enc']))
+                own_client.select_folder("INBOX")
+                new_uidvalidity, new_last_uid, uids_inbox = read_inbox_state(own_client)
 
         with get_db_connection() as conn:
             cleanup_inbox_mails(conn, account["id"], uids_inbox)
@@ -603,6 +802,7 @@ def sync_account_uidvalidity(account):
 
                 if old_uidvalidity != new_uidvalidity:
                     cursor.execute("DELETE FROM mails WHERE account_id = ?", (account["id"],))
+                    delete_features(conn, account["id"])
                     # if DEBUG: print(f"[DEBUG] UIDVALIDITY geändert für {account['email']} → Mails gelöscht")
 
                 cursor.execute("""
@@ -614,8 +814,9 @@ def sync_account_uidvalidity(account):
     except Exception as e:
         write_error_log(0, account["username"], f"Fehler bei UIDVALIDITY-Sync: {e}")
 
-def start_all_idles():
-    # if DEBUG: print("[DEBUG] Starte Idle-Threads für alle Accounts ...")
+def load_accounts(account_ids=None):
+    """Lädt alle Konten (inkl. Benutzer) – optional nur die angegebenen IDs."""
+    result = []
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users")
@@ -623,18 +824,94 @@ def start_all_idles():
 
         for user in users:
             cursor.execute("SELECT * FROM accounts WHERE user_id = ?", (user["id"],))
-            accounts = cursor.fetchall()
-            for acc in accounts:
-                if DEBUG: print(f"[DEBUG] Starte Thread für: {acc['email']} ({acc['username']})")
+            for acc in cursor.fetchall():
+                if account_ids is not None and acc["id"] not in account_ids:
+                    continue
                 acc_dict = dict(acc)
-                sync_account_uidvalidity(acc_dict)
                 acc_dict["user"] = dict(user)
-                t = threading.Thread(target=idle_monitor, args=(acc_dict,), daemon=True)
-                t.start()
+                result.append(acc_dict)
+    return result
+
+class AccountRegistry:
+    """
+    Hält die laufenden IDLE-Threads und gleicht sie mit der Tabelle accounts ab.
+    Neue Konten werden gestartet, gelöschte gestoppt und geänderte (config_version)
+    neu gestartet – alle anderen IDLE-Sitzungen bleiben unberührt.
+    """
+
+    def __init__(self, account_filter=None):
+        self.account_filter = account_filter  # optional: callable(account_id) -> bool
+        self.running = {}  # account_id -> {"version", "thread", "stop"}
+        self.lock = threading.Lock()
+        self.scheduler = StartupScheduler()
+
+    def _current_versions(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, COALESCE(config_version, 0) AS version FROM accounts")
+            return {row["id"]: row["version"] for row in cursor.fetchall()
+                    if self.account_filter is None or self.account_filter(row["id"])}
+
+    def start(self, acc_dict, version, priority=(0,)):
+        if DEBUG: print(f"[DEBUG] Starte Thread für: {acc_dict['email']} ({acc_dict['username']})")
+        stop = threading.Event()
+        t = threading.Thread(target=idle_monitor, args=(acc_dict, stop, self.scheduler, priority), daemon=True)
+        t.start()
+        self.running[acc_dict["id"]] = {"version": version, "thread": t, "stop": stop}
+
+    def stop(self, account_id):
+        entry = self.running.pop(account_id, None)
+        if entry:
+            if DEBUG: print(f"[DEBUG] Stoppe Thread für Konto-ID {account_id}")
+            entry["stop"].set()
+
+    def refresh(self):
+        """Startet/stoppt nur die Threads der Konten, die sich geändert haben."""
+        with self.lock:
+            try:
+                versions = self._current_versions()
+            except Exception as e:
+                write_error_log(0, "watcher", f"Kontenliste konnte nicht geladen werden: {e}")
+                return
+
+            removed = [aid for aid in self.running if aid not in versions]
+            changed = [aid for aid, v in versions.items()
+                       if aid in self.running and self.running[aid]["version"] != v]
+            added = [aid for aid in versions if aid not in self.running]
+
+            for aid in removed + changed:
+                self.stop(aid)
+
+            to_start = set(changed + added)
+            if to_start:
+                # Gestaffelter Start: Threads laufen sofort los, die Logins teilt der Scheduler zu
+                accounts = load_accounts(to_start)
+                priorities = warmup_priorities(accounts)
+                accounts.sort(key=lambda a: priorities[a["id"]])
+                self.scheduler.begin_batch([a["id"] for a in accounts])
+                for acc in accounts:
+                    self.start(acc, versions[acc["id"]], priorities[acc["id"]])
+
+            metrics.set_gauge("accounts", len(self.running))
+            if removed or changed or added:
+                write_system_log(f"[Watcher] Konten abgeglichen: +{len(added)} ~{len(changed)} -{len(removed)}")
+
+    def account_ids(self):
+        with self.lock:
+            return sorted(self.running)
+
+def start_all_idles(account_filter=None, block=True):
+    # if DEBUG: print("[DEBUG] Starte Idle-Threads für alle Accounts ...")
+    registry = AccountRegistry(account_filter)
+    registry.refresh()
+
+    if not block:
+        return registry
 
     try:
         while True:
-            time.sleep(1)
+            time.sleep(ACCOUNT_REFRESH_INTERVAL)
+            registry.refresh()
     except KeyboardInterrupt:
         pass
 
@@ -0,0 +1,235 @@
+# inference_server.py
+# Gemeinsamer Inferenz-Dienst für Watcher-Prozesse und spam_filter.py.
+#
+# Hält die Scorer (core/scorer.py) aller Benutzer einmal im Speicher, statt sie in
+# jedem Worker-Prozess einzeln zu laden, und beantwortet Anfragen über einen
+# Unix-Socket (INFERENCE_SOCKET). Protokoll: je Zeile ein JSON-Objekt
+#   {"op": "score", "user": "...", "texts": [...], "features": true}
+#   → {"ok": true, "scores": [...], "features": [[space, indizes, zählungen] | null, ...]}
+#   {"op": "status"} → {"ok": true, "metrics": {...}}
+# Anfragen, die innerhalb von INFERENCE_COALESCE_MS eintreffen, werden je Benutzer
+# zu einem Batch zusammengefasst (ein Scorer-Lookup, eine Klassifikation). Die Batches
+# verschiedener Benutzer laufen parallel in INFERENCE_WORKERS Threads; je Benutzer läuft
+# höchstens einer, weitere Anfragen warten und werden danach gemeinsam bewertet.
+# Hängt die Klassifikation (z. B. beim Laden eines Modells), antwortet der Dienst nach
+# 80 % von INFERENCE_TIMEOUT mit {"ok": false, "busy": true} – der Client klassifiziert dann lokal.
+#
+# Aufruf:
+#   python3 inference_server.py [--socket PFAD]
+#   python3 inference_server.py status
+
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from core import metrics
+from core.config import INFERENCE_COALESCE_MS, INFERENCE_SOCKET, INFERENCE_TIMEOUT, INFERENCE_WORKERS
+from core.inference import request
+from core.logger import get_logger
+from core.scorer import classify_with_features
+
+logger = get_logger("inference_server")
+
+DEFAULT_SOCKET = "/opt/mailfilter-data/inference.sock"
+
+
+class Busy(Exception):
+    """Die Klassifikation ist nicht rechtzeitig fertig geworden."""
+
+
+class Coalescer:
+    """Sammelt Anfragen für ein kurzes Zeitfenster und klassifiziert sie je Benutzer gebündelt."""
+
+    def __init__(self, window_ms=INFERENCE_COALESCE_MS, timeout=INFERENCE_TIMEOUT * 0.8, workers=INFERENCE_WORKERS):
+        self.window = window_ms / 1000.0
+        self.timeout = timeout  # unter dem Zeitlimit des Clients, damit die Antwort noch ankommt
+        self.queue = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="classify")
+        self.lock = threading.Lock()
+        self.waiting = {}  # Benutzer mit laufendem Batch → Anfragen, die danach drankommen
+        threading.Thread(target=self._run, name="coalescer", daemon=True).start()
+
+    def submit(self, username, texts):
+        """Blockiert bis zum Ergebnis (scores, features), höchstens self.timeout Sekunden (sonst Busy)."""
+        item = {"user": username, "texts": texts, "done": threading.Event()}
+        self.queue.put(item)
+        if not item["done"].wait(self.timeout):
+            item["abandoned"] = True
+            metrics.incr("timeouts")
+            raise Busy(f"Klassifikation nach {self.timeout:.1f} s nicht fertig")
+        if "error" in item:
+            raise RuntimeError(item["error"])
+        return item["scores"], item["features"]
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            by_user = defaultdict(list)
+            for item in batch:
+                if item.get("abandoned"):  # Client hat bereits eine Fehlerantwort
+                    item["done"].set()
+                else:
+                    by_user[item["user"]].append(item)
+            metrics.incr("requests", len(batch))
+            for username, items in by_user.items():
+                with self.lock:
+                    if username in self.waiting:  # läuft schon – danach gemeinsam bewerten
+                        self.waiting[username].extend(items)
+                        continue
+                    self.waiting[username] = []
+                self.pool.submit(self._work, username, items)
+
+    def _work(self, username, items):
+        while items:
+            self._classify(username, items)
+            with self.lock:
+                items = self.waiting[username]
+                for item in items:
+                    if item.get("abandoned"):
+                        item["done"].set()
+                items = [item for item in items if not item.get("abandoned")]
+                if items:
+                    self.waiting[username] = []
+                else:
+                    del self.waiting[username]
+
+    def _classify(self, username, items):
+        metrics.incr("batches")
+        texts = [text for item in items for text in item["texts"]]
+        try:
+            results, features = classify_with_features(username, texts)
+        except Exception as e:
+            logger.error(f"Klassifikation fehlgeschlagen ({username}): {e}")
+            for item in items:
+                item["error"] = str(e)
+        else:
+            metrics.incr("messages", len(texts))
+            offset = 0
+            for item in items:
+                n = len(item["texts"])
+                item["scores"] = [score for score, _ in results[offset:offset + n]]
+                item["features"] = features[offset:offset + n]
+                offset += n
+        for item in items:
+            item["done"].set()
+
+
+def encode_features(entry):
+    if entry is None:
+        return None
+    space, indices, counts = entry
+    return [space, indices.tolist(), [int(c) for c in counts]]
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                payload = json.loads(line)
+                op = payload.get("op")
+                if op == "score":
+                    scores, features = self.server.coalescer.submit(payload["user"], payload["texts"])
+                    response = {"ok": True, "scores": scores}
+                    if payload.get("features"):
+                        response["features"] = [encode_features(entry) for entry in features]
+                elif op == "status":
+                    response = {"ok": True, "pid": os.getpid(), "metrics": metrics.snapshot()}
+                else:
+                    response = {"ok": False, "error": f"unbekannte Operation: {op}"}
+            except Busy as e:
+                response = {"ok": False, "busy": True, "error": str(e)}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, coalescer):
+        self.coalescer = coalescer
+        super().__init__(path, Handler)
+
+
+def remove_stale_socket(path):
+    """Entfernt einen verwaisten Socket; False, wenn dort bereits ein Dienst antwortet."""
+    if not os.path.exists(path):
+        return True
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+        return False
+    except OSError:
+        os.unlink(path)
+        return True
+    finally:
+        probe.close()
+
+
+def run(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not remove_stale_socket(path):
+        print(f"Inferenz-Dienst läuft bereits ({path}).")
+        sys.exit(1)
+    server = InferenceServer(path, Coalescer())
+    os.chmod(path, 0o660)
+    # Bei systemctl stop den Socket sauber entfernen
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    logger.info(f"Inferenz-Dienst gestartet auf {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def show_status(path):
+    try:
+        response = request({"op": "status"}, path=path, timeout=2)
+    except OSError as e:
+        print(f"Inferenz-Dienst nicht erreichbar ({path}): {e}")
+        sys.exit(1)
+    snapshot = response["metrics"]
+    counters = snapshot["counters"]
+    requests_total = counters.get("requests", 0)
+    print(f"PID {response['pid']}, Laufzeit {snapshot['uptime']} s")
+    print(f"Anfragen: {requests_total}, Batches: {counters.get('batches', 0)}, Mails: {counters.get('messages', 0)}, "
+          f"Zeitüberschreitungen: {counters.get('timeouts', 0)}")
+    if requests_total:
+        print(f"Zusammengefasst: {requests_total / max(counters.get('batches', 1), 1):.2f} Anfragen pro Batch")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gemeinsamer Inferenz-Dienst (Unix-Socket)")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "status"])
+    parser.add_argument("--socket", default=INFERENCE_SOCKET or DEFAULT_SOCKET, help="Pfad des Unix-Sockets")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        show_status(args.socket)
+    else:
+        run(args.socket)
@@ -1,30 +1,724 @@
 # model_utils.py
+# Laden, Speichern und Aktualisieren der Spam-Modelle pro Benutzer.
+#
+# Featurizer:
+#   "tfidf"   – TfidfFeaturizer (TfidfVectorizer) mit Vokabular je Benutzer (spam_vectorizer.pkl)
+#   "hashing" – HashingVectorizer ohne Vokabular, optional mit Online-IDF;
+#               lernt bei partial_fit auch neue Wörter (featurizer.json + spam_idf.pkl)
+#
+# Ablage (Registry, Pfade in core/model_store.py):
+#   MODEL_BASE/<user>/versions/<version>/   vollständiger Modellstand, wird nie verändert
+#   MODEL_BASE/<user>/current               Name der aktiven Version
+# Ein neuer Stand wird in ein temporäres Verzeichnis geschrieben, umbenannt und erst
+# dann per os.replace() auf "current" veröffentlicht – Leser sehen nie halbe Dateien.
+# Ohne "current" gilt das alte flache Layout direkt in MODEL_BASE/<user>/.
+#
+# Zu jeder Version wird zusätzlich ein Inferenz-Artefakt für MultinomialNB geschrieben
+# (inference.json + .npy), das core/scorer.py ohne scikit-learn auswertet.
+#
+# Geteiltes Layout (MODEL_LAYOUT = "shared"): Featurizer und Basis-Modell werden einmal auf
+# dem Korpus aller Benutzer trainiert (train_shared_base, Name SHARED_MODEL_NAME) und auf
+# SHARED_BASE_PRIOR Mails skaliert. Je Benutzer werden nur die gewichteten Merkmalssummen
+# seiner Beispiele gespeichert (user_counts.npz, dünn besetzt); sein Modell ist Basis +
+# eigene Zählungen. Benutzer ohne eigene Version klassifizieren direkt mit der Basis.
+import copy
+import fcntl
+import hashlib
+import json
 import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
 import joblib
+import numpy as np
+from scipy import sparse
+from scipy.special import logsumexp
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.preprocessing import normalize
+
+from core import metrics
+
+from core.config import (FEATURIZER_MODE, HASHING_N_FEATURES, HASHING_ONLINE_IDF, MODEL_BASE,
+                         MODEL_KEEP_VERSIONS, MODEL_MMAP, SHARED_BASE_MIN_DF, SHARED_BASE_PRIOR,
+                         SPAM_THRESHOLD, TFIDF_STOP_WORDS)
+from core.model_store import (CURRENT_FILE, FEATURIZER_FILE, IDF_FILE, INFERENCE_FILE,
+                              INFERENCE_IDF_FILE, MODEL_FILE, NB_COUNTS_FILE, NB_DELTA_FILE,
+                              SHARED_MODEL_NAME, TOKENS_FILE, USER_COUNTS_FILE, VECTORIZER_FILE,
+                              VERSIONS_DIR, current_model_dir, current_version, mail_text,
+                              model_dir_for, shared_base_dir, uses_shared_base)
+
+TMP_PREFIX = ".tmp-"
+LOCK_FILE = ".train.lock"
+# Verwaiste temporäre Verzeichnisse (abgebrochenes Speichern) nach einer Stunde löschen
+TMP_MAX_AGE = 3600
+# Version des Inferenz-Artefakts; ältere werden von "model_utils.py export" neu geschrieben
+INFERENCE_FORMAT = 2
+
+# Prozessweiter Cache: username -> (dateistand, modell, featurizer)
+_model_cache = {}
+_cache_lock = threading.Lock()
+
+
+class OnlineIdf:
+    """Dokumenthäufigkeiten, die mit jedem Trainingsbeispiel fortgeschrieben werden."""
+
+    def __init__(self, n_features):
+        self.df = np.zeros(n_features, dtype=np.float32)
+        self.n_docs = 0
+
+    def partial_fit(self, X):
+        self.df += np.asarray((X > 0).sum(axis=0), dtype=np.float32).ravel()
+        self.n_docs += X.shape[0]
+        return self
+
+    def idf_vector(self):
+        # Gleiche Glättung wie TfidfTransformer(smooth_idf=True); neu berechnet nur nach partial_fit
+        cached = getattr(self, "_idf", None)
+        if cached is None or cached[0] != self.n_docs:
+            cached = (self.n_docs, (np.log((1.0 + self.n_docs) / (1.0 + self.df)) + 1.0).astype(np.float32))
+            self._idf = cached
+        return cached[1]
+
+    def transform(self, X):
+        X = X.tocsr(copy=True)
+        X.data *= self.idf_vector()[X.indices]
+        return normalize(X, copy=False)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_idf", None)
+        return state
+
+
+class HashingFeaturizer:
+    """Zustandsloser Featurizer: kein Vokabular, neue Tokens landen direkt im Hash-Raum."""
+
+    def __init__(self, n_features=HASHING_N_FEATURES, online_idf=HASHING_ONLINE_IDF,
+                 stop_words=TFIDF_STOP_WORDS):
+        self.n_features = n_features
+        self.stop_words = stop_words
+        # Liefert reine Wortzählungen; IDF und L2-Normierung folgen in weight()
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            alternate_sign=False,  # MultinomialNB braucht nicht-negative Werte
+            norm=None,
+            lowercase=True,
+            stop_words=stop_words,
+        )
+        self.idf = OnlineIdf(n_features) if online_idf else None
+
+    def counts(self, texts):
+        return self.vectorizer.transform(texts)
+
+    def weight(self, X):
+        return self.idf.transform(X) if self.idf is not None else normalize(X)
+
+    def partial_fit_counts(self, X):
+        if self.idf is not None:
+            self.idf.partial_fit(X)
+        return self
+
+    def partial_fit(self, texts):
+        return self.partial_fit_counts(self.counts(texts))
+
+    def fit_transform(self, texts):
+        X = self.counts(texts)
+        self.partial_fit_counts(X)
+        return self.weight(X)
+
+    def transform(self, texts):
+        return self.weight(self.counts(texts))
+
+    def config(self):
+        return {"mode": "hashing", "n_features": self.n_features,
+                "online_idf": self.idf is not None, "stop_words": self.stop_words}
+
+
+class TfidfFeaturizer(TfidfVectorizer):
+    """TfidfVectorizer mit derselben Schnittstelle wie HashingFeaturizer (counts/weight)."""
+
+    def counts(self, texts):
+        """Wortzählungen im Vokabular (vor IDF und Normierung)."""
+        return CountVectorizer.transform(self, texts)
+
+    def weight(self, X):
+        """Zählmatrix → Modelleingabe (IDF und Normierung des gefitteten Vektorizers)."""
+        return self._tfidf.transform(X, copy=False)
+
+
+def new_featurizer(mode=FEATURIZER_MODE, min_df=1):
+    """Frischer, ungefitteter Featurizer für ein komplettes Training (min_df nur für tfidf)."""
+    if mode == "hashing":
+        return HashingFeaturizer()
+    return TfidfFeaturizer(stop_words=TFIDF_STOP_WORDS, lowercase=True, min_df=min_df)
+
+
+def load_featurizer(model_dir, mmap_mode=None):
+    config_path = os.path.join(model_dir, FEATURIZER_FILE)
+    if os.path.exists(config_path):
+        with open(config_path, encoding="utf-8") as f:
+            config = json.load(f)
+        featurizer = HashingFeaturizer(config["n_features"], config.get("online_idf", False),
+                                       config.get("stop_words"))
+        idf_path = os.path.join(model_dir, IDF_FILE)
+        if featurizer.idf is not None and os.path.exists(idf_path):
+            featurizer.idf = joblib.load(idf_path, mmap_mode=mmap_mode)
+        return featurizer
+    # Altes Format: TfidfVectorizer mit Vokabular – gespeichert als reiner TfidfVectorizer
+    featurizer = joblib.load(os.path.join(model_dir, VECTORIZER_FILE), mmap_mode=mmap_mode)
+    if type(featurizer) is TfidfVectorizer:
+        featurizer.__class__ = TfidfFeaturizer  # fügt nur counts()/weight() hinzu
+    return featurizer
+
+
+def save_featurizer(model_dir, featurizer):
+    if isinstance(featurizer, HashingFeaturizer):
+        with open(os.path.join(model_dir, FEATURIZER_FILE), "w", encoding="utf-8") as f:
+            json.dump(featurizer.config(), f)
+        if featurizer.idf is not None:
+            joblib.dump(featurizer.idf, os.path.join(model_dir, IDF_FILE))
+    else:
+        # Auf Platte als TfidfVectorizer: ältere Stände und andere Einstiegspunkte laden ihn ohne TfidfFeaturizer
+        plain = copy.copy(featurizer)
+        plain.__class__ = TfidfVectorizer
+        joblib.dump(plain, os.path.join(model_dir, VECTORIZER_FILE))
+
+
+
+
+def feature_space(featurizer, tokens=None):
+    """
+    Kennung des Merkmalsraums: Gleiche Kennung bedeutet gleiche Spaltenindizes für
+    gleiche Texte (Feature-Cache). Bei tfidf hängt sie am Vokabular, bei hashing nur
+    an den Tokenizer-Einstellungen und n_features.
+    """
+    if isinstance(featurizer, HashingFeaturizer):
+        vectorizer = featurizer.vectorizer
+        parts = ["hashing", str(featurizer.n_features)]
+    else:
+        vectorizer = featurizer
+        if tokens is None:
+            tokens = sorted(featurizer.vocabulary_, key=featurizer.vocabulary_.get)
+        parts = ["tfidf"] + list(tokens)
+    parts += [str(vectorizer.lowercase), vectorizer.token_pattern, *sorted(vectorizer.get_stop_words() or ())]
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def stored_feature_space(model_dir):
+    """feature_space aus dem Inferenz-Artefakt einer Version oder None."""
+    try:
+        with open(os.path.join(model_dir, INFERENCE_FILE), encoding="utf-8") as f:
+            return json.load(f).get("feature_space")
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def export_inference(model_dir, model, featurizer):
+    """
+    Schreibt das Inferenz-Artefakt für core/scorer.py: je Feature die Differenz der
+    Log-Wahrscheinlichkeiten Spam − Ham (float32), den IDF-Vektor und den Token-Index
+    bzw. die Hash-Parameter. Liefert False, wenn Modell oder Featurizer sich nicht
+    abbilden lassen – dann klassifiziert der Scorer weiter über sklearn.
+    """
+    if not isinstance(model, MultinomialNB) or [int(c) for c in model.classes_] != [0, 1]:
+        return False
+    if isinstance(featurizer, HashingFeaturizer):
+        vectorizer = featurizer.vectorizer
+        idf = featurizer.idf.idf_vector() if featurizer.idf is not None else None
+        norm = "l2"  # HashingVectorizer oder OnlineIdf normalisieren immer L2
+        meta = {"mode": "hashing", "n_features": featurizer.n_features}
+        if vectorizer.alternate_sign:
+            return False
+    elif isinstance(featurizer, TfidfVectorizer):
+        vectorizer = featurizer
+        idf = featurizer.idf_ if featurizer.use_idf else None
+        norm = featurizer.norm
+        meta = {"mode": "tfidf"}
+        if featurizer.sublinear_tf:
+            return False
+    else:
+        return False
+    if (vectorizer.analyzer != "word" or tuple(vectorizer.ngram_range) != (1, 1) or vectorizer.binary
+            or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None
+            or vectorizer.strip_accents is not None or norm not in ("l2", None)):
+        return False
+
+    tokens = None
+    if meta["mode"] == "tfidf":
+        tokens = [None] * len(featurizer.vocabulary_)
+        for token, index in featurizer.vocabulary_.items():
+            tokens[int(index)] = token
+    stop_words = vectorizer.get_stop_words()
+    meta.update({
+        "format": INFERENCE_FORMAT,
+        "feature_space": feature_space(featurizer, tokens),
+        "lowercase": bool(vectorizer.lowercase),
+        "token_pattern": vectorizer.token_pattern,
+        "stop_words": sorted(stop_words) if stop_words else None,
+        "norm": norm,
+        "idf": idf is not None,
+        "bias": float(model.class_log_prior_[1] - model.class_log_prior_[0]),
+        # Für Deltas im geteilten Layout (core/scorer.SharedScorer)
+        "nb": {
+            "alpha": float(model.alpha),
+            "class_count": [float(c) for c in model.class_count_],
+            "feature_sums": [float(c) for c in model.feature_count_.sum(axis=1)],
+        },
+    })
+    delta = model.feature_log_prob_[1] - model.feature_log_prob_[0]
+    np.save(os.path.join(model_dir, NB_DELTA_FILE), np.asarray(delta, dtype=np.float32))
+    if idf is not None:
+        np.save(os.path.join(model_dir, INFERENCE_IDF_FILE), np.asarray(idf, dtype=np.float32))
+    if tokens is not None:
+        with open(os.path.join(model_dir, TOKENS_FILE), "w", encoding="utf-8") as f:
+            json.dump(tokens, f, ensure_ascii=False)
+    # inference.json zuletzt – erst damit gilt das Artefakt als vorhanden
+    with open(os.path.join(model_dir, INFERENCE_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return True
+
+
+def has_featurizer(username):
+    if uses_shared_base(username):
+        return True
+    model_dir = current_model_dir(username)
+    return (os.path.exists(os.path.join(model_dir, FEATURIZER_FILE))
+            or os.path.exists(os.path.join(model_dir, VECTORIZER_FILE)))
+
+
+def _model_state(username):
+    """Stand des Modells – ändert er sich, wird neu geladen."""
+    version = current_version(username)
+    if version:
+        return version
+    if uses_shared_base(username):
+        # Noch kein eigenes Modell: neu laden, sobald eine neue Basis veröffentlicht wird
+        return ("shared", current_version(SHARED_MODEL_NAME))
+    # Altes Layout: Änderungszeit und Größe der Dateien
+    model_dir = model_dir_for(username)
+    state = []
+    for name in (MODEL_FILE, VECTORIZER_FILE, FEATURIZER_FILE, IDF_FILE):
+        try:
+            st = os.stat(os.path.join(model_dir, name))
+            state.append((name, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            pass
+    return tuple(state)
+
+
+def get_cached_model(username):
+    """Lädt Modell und Featurizer nur, wenn seit dem letzten Laden eine neue Version veröffentlicht wurde."""
+    state = _model_state(username)
+    with _cache_lock:
+        cached = _model_cache.get(username)
+        if cached and cached[0] == state:
+            return cached[1], cached[2]
+    model, featurizer = load_model(username)
+    with _cache_lock:
+        _model_cache[username] = (state, model, featurizer)
+    return model, featurizer
+
+
+def classify_batch(username, texts, threshold=SPAM_THRESHOLD):
+    """
+    Klassifiziert mehrere Texte eines Benutzers auf einmal: ein transform() für die
+    ganze Liste und ein predict_proba(). Liefert [(spam_wahrscheinlichkeit, ist_spam), ...].
+    """
+    if not texts:
+        return []
+    model, featurizer = get_cached_model(username)
+    X = featurizer.transform(list(texts))
+    spam_col = list(model.classes_).index(1)
+    scores = model.predict_proba(X)[:, spam_col]
+    return [(float(score), bool(score >= threshold)) for score in scores]
 
-MODEL_BASE = "/opt/mailfilter-data/models"
 
 def is_spam(username, subject, body):
-    model_dir = os.path.join(MODEL_BASE, username)
     try:
-        model = joblib.load(os.path.join(model_dir, "spam_model.pkl"))
-        vectorizer = joblib.load(os.path.join(model_dir, "spam_vectorizer.pkl"))
-        text = subject + " " + body
-        X = vectorizer.transform([text])
-        return model.predict(X)[0] == 1
+        return classify_batch(username, [mail_text(subject, body)])[0][1]
     except Exception as e:
         print(f"[!] Fehler bei Klassifikation für {username}: {e}")
         return False
 
-def save_model(username, model, vectorizer):
-    model_dir = os.path.join(MODEL_BASE, username)
-    os.makedirs(model_dir, exist_ok=True)
-    joblib.dump(model, os.path.join(model_dir, "spam_model.pkl"))
-    joblib.dump(vectorizer, os.path.join(model_dir, "spam_vectorizer.pkl"))
+
+# -------------------------------------------------------
+# Registry: Speichern und Laden
+# -------------------------------------------------------
+def _new_version_name():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{os.getpid()}"
+
+
+def _fsync_dir_files(path):
+    for name in os.listdir(path):
+        with open(os.path.join(path, name), "rb") as f:
+            os.fsync(f.fileno())
+
+
+def _write_current(base_dir, version):
+    tmp_path = os.path.join(base_dir, f"{CURRENT_FILE}{TMP_PREFIX}{os.getpid()}-{threading.get_ident()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(base_dir, CURRENT_FILE))
+
+
+def _remove_legacy_files(base_dir):
+    for name in (MODEL_FILE, VECTORIZER_FILE, FEATURIZER_FILE, IDF_FILE):
+        try:
+            os.remove(os.path.join(base_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def prune_versions(username, keep=MODEL_KEEP_VERSIONS):
+    """Löscht alte Versionen (die aktive bleibt immer) und verwaiste Temp-Verzeichnisse."""
+    versions_dir = os.path.join(model_dir_for(username), VERSIONS_DIR)
+    try:
+        entries = sorted(os.listdir(versions_dir))
+    except FileNotFoundError:
+        return
+    current = current_version(username)
+    versions = [e for e in entries if not e.startswith(".")]
+    # Bereits geöffnete/gemappte Dateien bleiben nach dem Löschen für ihre Leser gültig
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != current:
+            shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
+    now = time.time()
+    for entry in entries:
+        path = os.path.join(versions_dir, entry)
+        if entry.startswith(TMP_PREFIX) and now - os.path.getmtime(path) > TMP_MAX_AGE:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _publish(username, write_files):
+    """
+    Legt eine neue Version an: write_files(tmp_dir) schreibt die Dateien, danach wird
+    das Verzeichnis umbenannt und "current" atomar umgeschaltet. Liefert den Versionsnamen.
+    """
+    base_dir = model_dir_for(username)
+    versions_dir = os.path.join(base_dir, VERSIONS_DIR)
+    os.makedirs(versions_dir, exist_ok=True)
+
+    version = _new_version_name()
+    tmp_dir = os.path.join(versions_dir, f"{TMP_PREFIX}{version}")
+    os.makedirs(tmp_dir)
+    try:
+        write_files(tmp_dir)
+        _fsync_dir_files(tmp_dir)
+        os.rename(tmp_dir, os.path.join(versions_dir, version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    legacy = current_version(username) is None
+    _write_current(base_dir, version)
+    if legacy:
+        _remove_legacy_files(base_dir)
+    prune_versions(username)
+    return version
+
+
+def save_model(username, model, featurizer):
+    """
+    Schreibt Modell und Featurizer als neue Version und schaltet "current" atomar um.
+    Liefert den Versionsnamen.
+    """
+    def write_files(tmp_dir):
+        # Unkomprimiert speichern, sonst ist kein mmap_mode beim Laden möglich
+        joblib.dump(model, os.path.join(tmp_dir, MODEL_FILE))
+        save_featurizer(tmp_dir, featurizer)
+        if export_inference(tmp_dir, model, featurizer) and username == SHARED_MODEL_NAME:
+            # Basis-Zählungen für die Deltas der Benutzer (core/scorer.SharedScorer)
+            np.save(os.path.join(tmp_dir, NB_COUNTS_FILE), np.asarray(model.feature_count_, dtype=np.float32))
+
+    return _publish(username, write_files)
+
+
+def _load_from(model_dir, mmap_mode):
+    model = joblib.load(os.path.join(model_dir, MODEL_FILE), mmap_mode=mmap_mode)
+    return model, load_featurizer(model_dir, mmap_mode)
+
+
+def load_model(username, mmap=MODEL_MMAP):
+    """
+    Lädt den aktiven Modellstand. Mit mmap=True werden die Gewichte schreibgeschützt
+    eingeblendet (joblib mmap_mode="r"), sodass sich mehrere Prozesse eine Kopie im
+    Page-Cache teilen. Zum Weitertrainieren (partial_fit) mit mmap=False laden.
+    """
+    mmap_mode = "r" if mmap else None
+    if uses_shared_base(username):
+        return load_shared_model(username, mmap_mode)
+    try:
+        return _load_from(current_model_dir(username), mmap_mode)
+    except FileNotFoundError:
+        # Version wurde zwischen Lesen von "current" und Öffnen entfernt – einmal neu auflösen
+        return _load_from(current_model_dir(username), mmap_mode)
+
+
+@contextmanager
+def training_lock(username):
+    """Prozessübergreifende Sperre für Lesen-Ändern-Speichern eines Benutzermodells."""
+    base_dir = model_dir_for(username)
+    os.makedirs(base_dir, exist_ok=True)
+    with open(os.path.join(base_dir, LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def update_model(username, texts, labels, sample_weight=None, features=None):
+    """
+    Inkrementelles Training (partial_fit) mit bereits beschrifteten Texten (1 = Spam, 0 = Ham).
+    features: optional je Text (feature_space, indizes, häufigkeiten) aus dem Feature-Cache
+    oder None – passende Einträge ersetzen das erneute Tokenisieren.
+    Liefert (counts_vorher, counts_nachher) oder None, wenn noch kein Featurizer existiert.
+    Feedback-Trainer und inkrementelles Training serialisieren sich über training_lock().
+    """
+    if not has_featurizer(username):
+        return None
+    with training_lock(username):
+        if uses_shared_base(username):
+            return _update_shared_locked(username, texts, labels, sample_weight, features)
+        return _update_model_locked(username, texts, labels, sample_weight, features)
+
+
+def _count_matrix(featurizer, model_dir, texts, features=None):
+    """Zählmatrix der Texte; Zeilen mit passendem Cache-Eintrag werden übernommen statt berechnet."""
+    space = None
+    if features and any(features):
+        space = stored_feature_space(model_dir) or feature_space(featurizer)
+    hits = [bool(space) and entry is not None and entry[0] == space for entry in (features or [None] * len(texts))]
+    missing = [i for i, hit in enumerate(hits) if not hit]
+    metrics.incr("feature_cache_hits", len(texts) - len(missing))
+    metrics.incr("feature_cache_misses", len(missing))
+    if not any(hits):
+        return featurizer.counts(texts)
+
+    computed = featurizer.counts([texts[i] for i in missing]) if missing else None
+    n_features = featurizer.n_features if isinstance(featurizer, HashingFeaturizer) else len(featurizer.vocabulary_)
+    rows, next_missing = [], 0
+    for i, hit in enumerate(hits):
+        if hit:
+            _, indices, counts = features[i]
+            rows.append(sparse.csr_matrix((np.asarray(counts, dtype=np.float64), np.asarray(indices), [0, len(indices)]),
+                                          shape=(1, n_features)))
+        else:
+            rows.append(computed[next_missing])
+            next_missing += 1
+    return sparse.vstack(rows, format="csr")
+
+
+def _update_model_locked(username, texts, labels, sample_weight=None, features=None):
+    # Beschreibbar laden: partial_fit ändert die Arrays in place
+    model_dir = current_model_dir(username)
+    featurizer = load_featurizer(model_dir)
+    model_path = os.path.join(model_dir, MODEL_FILE)
+    model = joblib.load(model_path) if os.path.exists(model_path) else MultinomialNB()
+
+    X = _count_matrix(featurizer, model_dir, list(texts), features)
+    if isinstance(featurizer, HashingFeaturizer):
+        featurizer.partial_fit_counts(X)  # neue Wörter fließen in die Online-IDF ein
+    X = featurizer.weight(X)
+
+    prev_counts = [int(c) for c in model.class_count_] if hasattr(model, "class_count_") else [0, 0]
+    model.partial_fit(X, list(labels), classes=[0, 1], sample_weight=sample_weight)
+    save_model(username, model, featurizer)
+    return prev_counts, [int(c) for c in model.class_count_]
+
+
+# -------------------------------------------------------
+# Geteiltes Layout: Basis-Modell und Zählungen je Benutzer
+# -------------------------------------------------------
+def _refresh_log_probs(model):
+    """Log-Wahrscheinlichkeiten aus feature_count_/class_count_ neu berechnen (wie MultinomialNB.fit)."""
+    smoothed = model.feature_count_ + model.alpha
+    model.feature_log_prob_ = np.log(smoothed) - np.log(smoothed.sum(axis=1)).reshape(-1, 1)
+    model.class_log_prior_ = np.log(model.class_count_) - np.log(model.class_count_.sum())
+
+
+def class_counts(X, labels, sample_weight=None):
+    """Gewichtete Merkmalssummen je Klasse (2 × n, sparse) und Klassengewichte – wie in MultinomialNB.partial_fit."""
+    labels = np.asarray(labels, dtype=np.int64)
+    weights = (np.ones(len(labels)) if sample_weight is None
+               else np.asarray(sample_weight, dtype=np.float64))
+    Y = sparse.csr_matrix((weights, (labels, np.arange(len(labels)))), shape=(2, len(labels)))
+    return sparse.csr_matrix(Y @ X), np.asarray(Y.sum(axis=1)).ravel()
+
+
+def train_shared_base(texts, labels, sample_weight=None):
+    """
+    Trainiert Featurizer und Basis-Modell auf dem gemeinsamen Korpus und veröffentlicht
+    beides unter SHARED_MODEL_NAME. Die Zählungen werden auf SHARED_BASE_PRIOR Mails
+    skaliert – so viel wiegt die Basis neben den eigenen Beispielen eines Benutzers.
+    """
+    featurizer = new_featurizer(min_df=SHARED_BASE_MIN_DF)
+    X = featurizer.fit_transform(list(texts))
+    model = MultinomialNB()
+    model.fit(X, list(labels), sample_weight=sample_weight)
+    scale = SHARED_BASE_PRIOR / model.class_count_.sum()
+    model.feature_count_ *= scale
+    model.class_count_ *= scale
+    _refresh_log_probs(model)
+    with training_lock(SHARED_MODEL_NAME):
+        return save_model(SHARED_MODEL_NAME, model, featurizer)
+
+
+def load_user_counts(model_dir, n_features):
+    """(zählungen 2 × n als sparse, klassengewichte) einer Benutzerversion im geteilten Layout."""
+    with np.load(os.path.join(model_dir, USER_COUNTS_FILE)) as data:
+        indices, counts, class_count = data["indices"], data["counts"], data["class_count"]
+    rows = np.repeat([0, 1], len(indices))
+    matrix = sparse.csr_matrix((counts.ravel().astype(np.float64), (rows, np.tile(indices, 2))),
+                               shape=(2, n_features))
+    return matrix, class_count.astype(np.float64)
+
+
+def save_user_counts(username, base_version, counts, class_count):
+    """Veröffentlicht eine Benutzerversion im geteilten Layout: nur die eigenen Zählungen (dünn besetzt)."""
+    coo = sparse.coo_matrix(counts)
+    indices = np.unique(coo.col[coo.data != 0]).astype(np.int32)
+    dense = sparse.csc_matrix(counts)[:, indices].toarray().astype(np.float32)
+    meta = {
+        "format": INFERENCE_FORMAT,
+        "layout": "shared",
+        "base": base_version,
+        "feature_space": stored_feature_space(shared_base_dir(base_version)),
+    }
+
+    def write_files(tmp_dir):
+        np.savez_compressed(os.path.join(tmp_dir, USER_COUNTS_FILE), indices=indices, counts=dense,
+                            class_count=np.asarray(class_count, dtype=np.float64))
+        with open(os.path.join(tmp_dir, INFERENCE_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    return _publish(username, write_files)
+
+
+def _shared_state(username):
+    """
+    (basis_version, basis_verzeichnis, zählungen, klassengewichte) eines Benutzers im geteilten
+    Layout. Ist seine Basis-Version schon gelöscht, gilt die aktive Basis – die eigenen
+    Zählungen nur, wenn der Merkmalsraum gleich geblieben ist.
+    """
+    meta, model_dir = {}, None
+    if current_version(username):
+        model_dir = current_model_dir(username)
+        with open(os.path.join(model_dir, INFERENCE_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+    base_version = meta.get("base")
+    base_dir = shared_base_dir(base_version)
+    if base_dir is None:
+        base_version = current_version(SHARED_MODEL_NAME)
+        base_dir = shared_base_dir(base_version)
+        if base_dir is None:
+            raise FileNotFoundError("Kein Basis-Modell vorhanden (spam_model_trainer.py --base)")
+        if stored_feature_space(base_dir) != meta.get("feature_space"):
+            meta = {}
+    n_features = np.load(os.path.join(base_dir, NB_COUNTS_FILE), mmap_mode="r").shape[1]
+    if meta:
+        counts, class_count = load_user_counts(model_dir, n_features)
+    else:
+        counts, class_count = sparse.csr_matrix((2, n_features)), np.zeros(2)
+    return base_version, base_dir, counts, class_count
+
+
+class SharedModel:
+    """
+    Basis-Modell plus die eigenen Zählungen eines Benutzers, ausgewertet wie core.scorer.SharedScorer:
+    Die Basis bleibt unverändert (auch per mmap), je Klasse kommt eine Konstante für die neuen
+    Summen hinzu und nur für die Spalten des Benutzers eine Korrektur. Bietet classes_,
+    predict_proba und predict – zum Weitertrainieren dient _shared_state.
+    """
+
+    def __init__(self, base, counts, class_count):
+        self.base = base
+        self.classes_ = base.classes_
+        alpha, n = base.alpha, base.feature_count_.shape[1]
+        own = sparse.csc_matrix(counts)
+        self.indices = np.unique(own.nonzero()[1])
+        own_counts = own[:, self.indices].toarray()
+        base_counts = np.asarray(base.feature_count_[:, self.indices])
+        base_sums = np.asarray(base.feature_count_.sum(axis=1))
+        # log P(w|c) = log(n_cw + α) − log(Σ_c + α·n): neue Summen verschieben alle Spalten um eine Konstante
+        self.shift = np.log(base_sums + alpha * n) - np.log(base_sums + own_counts.sum(axis=1) + alpha * n)
+        self.correction = np.log(base_counts + own_counts + alpha) - np.log(base_counts + alpha)
+        classes = base.class_count_ + class_count
+        self.class_log_prior_ = np.log(classes) - np.log(classes.sum())
+
+    def predict_joint_log_proba(self, X):
+        X = sparse.csr_matrix(X)
+        jll = np.asarray(X @ self.base.feature_log_prob_.T)
+        jll += np.asarray(X.sum(axis=1)) * self.shift
+        if len(self.indices):
+            jll += np.asarray(X[:, self.indices] @ self.correction.T)
+        return jll + self.class_log_prior_
+
+    def predict_proba(self, X):
+        jll = self.predict_joint_log_proba(X)
+        return np.exp(jll - logsumexp(jll, axis=1).reshape(-1, 1))
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_joint_log_proba(X), axis=1)]
+
+
+def load_shared_model(username, mmap_mode=None):
+    """Modell eines Benutzers im geteilten Layout: Basis + eigene Zählungen, mit dem Featurizer der Basis."""
+    _, base_dir, counts, class_count = _shared_state(username)
+    featurizer = load_featurizer(base_dir, mmap_mode)
+    base = joblib.load(os.path.join(base_dir, MODEL_FILE), mmap_mode=mmap_mode)
+    if not counts.nnz and not class_count.any():
+        return base, featurizer
+    return SharedModel(base, counts, class_count), featurizer
+
+
+def train_shared_user(username, texts, labels, sample_weight=None):
+    """Vollständiges Training im geteilten Layout: nur die Zählungen des Benutzers auf der aktiven Basis."""
+    base_version = current_version(SHARED_MODEL_NAME)
+    featurizer = load_featurizer(shared_base_dir(base_version))
+    counts, class_count = class_counts(featurizer.transform(list(texts)), labels, sample_weight)
+    with training_lock(username):
+        return save_user_counts(username, base_version, counts, class_count)
+
+
+def _update_shared_locked(username, texts, labels, sample_weight=None, features=None):
+    # Wie partial_fit, aber Vokabular und IDF der Basis bleiben fest
+    base_version, base_dir, counts, class_count = _shared_state(username)
+    featurizer = load_featurizer(base_dir)
+    X = featurizer.weight(_count_matrix(featurizer, base_dir, list(texts), features))
+    added, added_classes = class_counts(X, labels, sample_weight)
+    save_user_counts(username, base_version, counts + added, class_count + added_classes)
+    return [int(c) for c in class_count], [int(c) for c in class_count + added_classes]
+
+
+def export_all():
+    """Veröffentlicht die aktiven Modelle aller Benutzer neu – mit Inferenz-Artefakt."""
+    if not os.path.isdir(MODEL_BASE):
+        return
+    for username in sorted(os.listdir(MODEL_BASE)):
+        # Benutzer im geteilten Layout haben kein eigenes Modell zum Exportieren
+        if uses_shared_base(username) or not has_featurizer(username):
+            continue
+        try:
+            with open(os.path.join(current_model_dir(username), INFERENCE_FILE), encoding="utf-8") as f:
+                if json.load(f).get("format", 1) >= INFERENCE_FORMAT:
+                    continue
+        except (FileNotFoundError, ValueError):
+            pass
+        with training_lock(username):
+            model, featurizer = load_model(username, mmap=False)
+            version = save_model(username, model, featurizer)
+        print(f"{username}: Version {version} mit Inferenz-Artefakt veröffentlicht")
 
 
-def load_model(username):
-    model_dir = os.path.join(MODEL_BASE, username)
-    model = joblib.load(os.path.join(model_dir, "spam_model.pkl"))
-    vectorizer = joblib.load(os.path.join(model_dir, "spam_vectorizer.pkl"))
-    return model, vectorizer
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["export"]:
+        export_all()
+    else:
+        print("Aufruf: python3 model_utils.py export")
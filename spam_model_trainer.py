@@ -1,92 +1,502 @@
 # spam_model_trainer.py (multi-user, refactored)
+# Standard ist das inkrementelle Training: je Konto werden aus Junk und INBOX nur
+# Mails oberhalb des gespeicherten UID-Wasserstands geladen und per partial_fit
+# nachtrainiert. Vollständig neu trainiert (aus dem lokalen Korpus, core/corpus.py)
+# wird mit --full, ohne vorhandenes Modell oder wenn sich UIDVALIDITY geändert hat.
+# Per IMAP wird dabei nur geladen, wenn Beispiele fehlen oder --refresh gesetzt ist.
+# Je Benutzer entsteht ein Modell aus den Mails aller seiner Konten (ein Fit,
+# gewichtet mit accounts.train_weight).
+# Mit MODEL_LAYOUT = "shared" trainiert --base zuerst das gemeinsame Basis-Modell aus dem
+# Korpus aller Benutzer; je Benutzer werden dann nur noch dessen Zählungen gespeichert.
+import argparse
+import multiprocessing
 import os
-import joblib
-from imap_tools import MailBox, AND
-from sklearn.feature_extraction.text import TfidfVectorizer
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from imap_tools import MailBox, AND, U
 from sklearn.naive_bayes import MultinomialNB
 
-from core.config import HAM_MAIL_LIMIT, MODEL_BASE, SPAM_MAIL_LIMIT
+from core.config import (HAM_MAIL_LIMIT, MODEL_LAYOUT, SPAM_MAIL_LIMIT, TRAIN_JOB_BASE_MB,
+                         TRAIN_MB_PER_SAMPLE, TRAIN_MEMORY_BUDGET_MB, TRAIN_WORKERS)
+from core.corpus import (add_samples, corpus_counts, load_corpus, load_watermark, prune_corpus,
+                         save_watermark)
 from core.crypto import decrypt
 from core.database import get_db_connection
 from core.logger import get_logger, write_train_log
+from core.model_store import shared_base_dir
+from model_utils import (has_featurizer, mail_text, model_dir_for, new_featurizer, save_model,
+                         train_shared_base, train_shared_user, training_lock, update_model)
 
 logger = get_logger("trainer")
 
 
-def fetch_texts(mailbox, folder, label, limit=100, only_seen=False):
+def training_folders(account):
+    """(ordner, label, limit) – Junk = Spam, INBOX = Ham."""
+    return ((account["junk_folder"], 1, SPAM_MAIL_LIMIT), ("INBOX", 0, HAM_MAIL_LIMIT))
+
+
+def folder_state(mailbox, folder):
+    """(UIDVALIDITY, höchste vergebene UID) eines Ordners."""
+    status = mailbox.folder.status(folder, ["UIDVALIDITY", "UIDNEXT"])
+    return int(status["UIDVALIDITY"]), int(status["UIDNEXT"]) - 1
+
+
+def fetch_texts(mailbox, folder, label, limit=100, only_seen=False, min_uid=None):
+    """
+    Lädt die neuesten Mails eines Ordners als Korpus-Beispiele (Text, Label, Herkunft).
+    Mit min_uid nur Mails ab dieser UID.
+    """
     mailbox.folder.set(folder)
-    if only_seen:
-        messages = list(mailbox.fetch(AND(seen=True), limit=limit, reverse=True, mark_seen=False))
-    else:
-        messages = list(mailbox.fetch(limit=limit, reverse=True, mark_seen=False))
-    return [(msg.subject + "\n" + msg.text, label) for msg in messages if msg.text]
+    criteria = AND(seen=True) if only_seen else AND(all=True)
+    if min_uid is not None:
+        criteria = AND(criteria, uid=U(min_uid, "*"))
+    messages = list(mailbox.fetch(criteria, limit=limit, reverse=True, mark_seen=False))
+    if min_uid is not None:
+        # "n:*" liefert immer mindestens die letzte Mail, auch wenn deren UID kleiner ist
+        messages = [msg for msg in messages if msg.uid and int(msg.uid) >= min_uid]
+    return [{
+        "text": mail_text(msg.subject, msg.text, msg.html),
+        "label": label,
+        "folder": folder,
+        "uid": int(msg.uid) if msg.uid else None,
+        "msg_id": (msg.headers.get("message-id") or [None])[0],
+    } for msg in messages if msg.text or msg.html]
 
 
-def train_model_for_account(account, username):
-    try:
-        password = decrypt(account["password_enc"])
-    except Exception as e:
-        msg = f"Passwort konnte nicht entschlüsselt werden für {account['username']}: {e}"
-        logger.error(msg)
-        write_train_log(account["user_id"], account["username"], f"❌ {msg}")
-        return
+def import_from_imap(account):
+    """
+    Füllt den Korpus eines Kontos mit den neuesten Mails aus Junk (Spam) und INBOX (Ham)
+    und setzt die Wasserstände auf den aktuellen Ordnerstand. Liefert die Anzahl neuer Beispiele.
+    """
+    password = decrypt(account["password_enc"])
+    samples, marks = [], []
+    with MailBox(account['server']).login(account['username'], password) as mailbox:
+        for folder, label, limit in training_folders(account):
+            uid_validity, last_uid = folder_state(mailbox, folder)
+            samples += fetch_texts(mailbox, folder, label, limit=limit, only_seen=False)
+            marks.append((folder, uid_validity, last_uid))
+    added = add_samples(account["user_id"], [dict(sample, account_id=account["id"]) for sample in samples], "imap")
+    for folder, uid_validity, last_uid in marks:
+        save_watermark(account["id"], folder, uid_validity, last_uid)
+    return added
+
+
+def fetch_new_samples(account):
+    """
+    Lädt je Ordner nur Mails oberhalb des Wasserstands. Liefert (beispiele, wasserstände)
+    oder None, wenn ein Wasserstand fehlt oder sich UIDVALIDITY geändert hat.
+    """
+    password = decrypt(account["password_enc"])
+    samples, marks = [], []
+    with MailBox(account['server']).login(account['username'], password) as mailbox:
+        for folder, label, limit in training_folders(account):
+            uid_validity, last_uid = folder_state(mailbox, folder)
+            watermark = load_watermark(account["id"], folder)
+            if watermark is None or watermark[0] != uid_validity:
+                return None
+            if last_uid > watermark[1]:
+                samples += fetch_texts(mailbox, folder, label, limit=limit, min_uid=watermark[1] + 1)
+            marks.append((folder, uid_validity, max(last_uid, watermark[1])))
+    return [dict(sample, account_id=account["id"]) for sample in samples], marks
+
 
-    logger.info(f"🔄 Trainiere Modell für {account['username']} ({username})")
-    write_train_log(account["user_id"], account["username"], "🔄 Training gestartet")
+def account_weight(account):
+    """Trainingsgewicht eines Kontos (accounts.train_weight, Standard 1.0; 0 = nicht trainieren)."""
+    weight = account.get("train_weight")
+    return 1.0 if weight is None else max(float(weight), 0.0)
 
+
+def log_accounts(accounts, message):
+    for account in accounts:
+        write_train_log(account["user_id"], account["username"], message)
+
+
+def ensure_corpus(account, refresh=False):
+    """Lädt per IMAP nach, wenn dem Konto Spam- oder Ham-Beispiele fehlen (oder refresh). False bei Fehler."""
+    counts = corpus_counts(account["user_id"], [account["id"]])
+    if not refresh and counts[0] and counts[1]:
+        return True
     try:
-        with MailBox(account['server']).login(account['username'], password) as mailbox:
-            # Trainingsdaten abrufen: Junk = Spam, INBOX = Ham
-            spam_data = fetch_texts(mailbox, account['junk_folder'], 1, limit=SPAM_MAIL_LIMIT, only_seen=False)
-            ham_data = fetch_texts(mailbox, "INBOX", 0, limit=HAM_MAIL_LIMIT, only_seen=False)
+        added = import_from_imap(account)
     except Exception as e:
         msg = f"Fehler beim Zugriff auf IMAP-Postfach von {account['username']}: {e}"
         logger.error(msg)
         write_train_log(account["user_id"], account["username"], f"❌ {msg}")
-        return
+        return False
+    write_train_log(account["user_id"], account["username"], f"📥 {added} neue Beispiele per IMAP übernommen")
+    return True
 
-    data = spam_data + ham_data
-    if not data:
-        msg = f"Keine Trainingsdaten für {account['username']}"
+
+def load_user_corpus(user_id, accounts):
+    """Texte, Labels und Gewichte aller Konten eines Benutzers (je Konto die neuesten Beispiele)."""
+    texts, labels, weights = [], [], []
+    for account in accounts:
+        account_texts, account_labels = load_corpus(user_id, [account["id"]])
+        texts += account_texts
+        labels += account_labels
+        weights += [account_weight(account)] * len(account_texts)
+    return texts, labels, weights
+
+
+def train_full_for_user(user_id, username, accounts, refresh_ids=()):
+    """
+    Ein gemeinsamer Fit über die Korpora aller Konten des Benutzers, gewichtet mit
+    accounts.train_weight. Konten in refresh_ids werden vorher per IMAP aufgefrischt;
+    schlägt das fehl, fließt ihr vorhandener Korpus trotzdem ein.
+    Liefert die Anzahl erfolgreich berücksichtigter Konten (Gewicht 0 zählt als erledigt).
+    """
+    active = [account for account in accounts if account_weight(account) > 0]
+    skipped = len(accounts) - len(active)
+    logger.info(f"🔄 Trainiere Modell für {username} ({len(active)} Konten)")
+    log_accounts(active, "🔄 Training gestartet")
+
+    ok = sum(ensure_corpus(account, account["id"] in refresh_ids) for account in active)
+    prune_corpus(user_id)
+
+    texts, labels, weights = load_user_corpus(user_id, active)
+    if not texts:
+        msg = f"Keine Trainingsdaten für {username}"
         logger.warning(msg)
-        write_train_log(account["user_id"], account["username"], f"⚠️ {msg}")
-        return
+        log_accounts(active, f"⚠️ {msg}")
+        return skipped
 
     try:
-        texts, labels = zip(*data)
-        vectorizer = TfidfVectorizer(stop_words='english', lowercase=True)
-        X = vectorizer.fit_transform(texts)
-        model = MultinomialNB()
-        model.fit(X, labels)
+        if MODEL_LAYOUT == "shared" and shared_base_dir():
+            # Nur die eigenen Zählungen auf dem gemeinsamen Basis-Vokabular
+            version = train_shared_user(username, texts, labels, weights)
+        else:
+            vectorizer = new_featurizer()
+            X = vectorizer.fit_transform(texts)
+            model = MultinomialNB()
+            model.fit(X, labels, sample_weight=weights)
+
+            with training_lock(username):
+                version = save_model(username, model, vectorizer)
+    except Exception as e:
+        msg = f"Fehler beim Modelltraining oder Speichern: {e}"
+        logger.error(msg)
+        log_accounts(active, f"❌ {msg}")
+        return 0
+
+    spam = sum(labels)
+    msg = (f"✅ Modell gespeichert in {model_dir_for(username)} (Version {version}) – "
+           f"{spam} Spam / {len(labels) - spam} Ham aus {len(active)} Konten")
+    logger.info(msg)
+    log_accounts(active, msg)
+    return ok + skipped
+
+
+def train_incremental_for_user(user_id, username, accounts):
+    """
+    Trainiert die seit dem letzten Lauf neuen Mails aller Konten mit einem partial_fit nach.
+    Fehlt ein Wasserstand oder hat sich UIDVALIDITY geändert, wird vollständig trainiert.
+    """
+    if not has_featurizer(username):
+        return train_full_for_user(user_id, username, accounts)
+
+    active = [account for account in accounts if account_weight(account) > 0]
+    skipped = len(accounts) - len(active)
+    samples, weights, marks, reset, failed = [], [], [], [], 0
+    for account in active:
+        try:
+            result = fetch_new_samples(account)
+        except Exception as e:
+            msg = f"Fehler beim Zugriff auf IMAP-Postfach von {account['username']}: {e}"
+            logger.error(msg)
+            write_train_log(account["user_id"], account["username"], f"❌ {msg}")
+            failed += 1
+            continue
+        if result is None:
+            reset.append(account)
+            continue
+        new_samples, account_marks = result
+        samples += new_samples
+        weights += [account_weight(account)] * len(new_samples)
+        marks += [(account["id"], *mark) for mark in account_marks]
+
+    if samples:
+        add_samples(user_id, samples, "imap")
+        prune_corpus(user_id)
+
+    if reset:
+        # Die neuen Mails der übrigen Konten liegen bereits im Korpus und fließen in den Fit ein
+        log_accounts(reset, "🔁 Kein Wasserstand oder UIDVALIDITY geändert – vollständiges Training")
+        for mark in marks:
+            save_watermark(*mark)
+        return train_full_for_user(user_id, username, accounts, {account["id"] for account in reset})
+
+    if samples:
+        try:
+            counts = update_model(username, [sample["text"] for sample in samples],
+                                  [sample["label"] for sample in samples], sample_weight=weights)
+        except Exception as e:
+            msg = f"Fehler beim inkrementellen Training: {e}"
+            logger.error(msg)
+            log_accounts(active, f"❌ {msg}")
+            return 0
+        if counts is None:
+            return train_full_for_user(user_id, username, accounts)
 
-        model_dir = os.path.join(MODEL_BASE, username)
-        os.makedirs(model_dir, exist_ok=True)
-        joblib.dump(model, os.path.join(model_dir, "spam_model.pkl"))
-        joblib.dump(vectorizer, os.path.join(model_dir, "spam_vectorizer.pkl"))
+    for account in active:
+        account_samples = [sample for sample in samples if sample["account_id"] == account["id"]]
+        if not account_samples:
+            continue
+        spam = sum(sample["label"] for sample in account_samples)
+        write_train_log(account["user_id"], account["username"], (
+            f"✅ Inkrementell trainiert: {spam} Spam / {len(account_samples) - spam} Ham neu – "
+            f"Counts vorher: {counts[0]}, nachher: {counts[1]}"
+        ))
+    if not samples:
+        log_accounts(active, "✅ Keine neuen Mails seit dem letzten Training")
 
-        msg = f"✅ Modell gespeichert in {model_dir}"
-        logger.info(msg)
-        write_train_log(account["user_id"], account["username"], msg)
+    for mark in marks:
+        save_watermark(*mark)
+    return len(active) - failed + skipped
 
+
+# -------------------------------------------------------
+# Gemeinsames Basis-Modell (MODEL_LAYOUT = "shared")
+# -------------------------------------------------------
+def train_base():
+    """
+    Trainiert Basis-Vokabular, IDF und Basis-Modell aus dem Korpus aller Benutzer
+    (je Benutzer die neuesten Beispiele wie beim eigenen Training). Liefert die Version oder None.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users ORDER BY id")
+        user_ids = [row["id"] for row in cursor.fetchall()]
+
+    texts, labels = [], []
+    for user_id in user_ids:
+        user_texts, user_labels = load_corpus(user_id)
+        texts += user_texts
+        labels += user_labels
+    if len(set(labels)) < 2:
+        logger.warning("Basis-Modell: Korpus enthält nicht Spam und Ham – kein Training")
+        return None
+
+    started = time.monotonic()
+    version = train_shared_base(texts, labels)
+    spam = sum(labels)
+    logger.info(f"✅ Basis-Modell {version}: {spam} Spam / {len(labels) - spam} Ham aus "
+                f"{len(user_ids)} Benutzern, {time.monotonic() - started:.1f}s")
+    return version
+
+
+# -------------------------------------------------------
+# Training aller Benutzer (seriell oder im Prozess-Pool)
+# -------------------------------------------------------
+def load_accounts_for_user(user_id):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM accounts WHERE user_id = ? ORDER BY id", (user_id,))
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def train_user(user_id, username, refresh=False, full=False):
+    """
+    Job-Einheit für train_all: ein Fit je Benutzer über alle seine Konten (sie teilen
+    sich ein Modell). Ein fehlerhaftes Konto bricht die übrigen nicht ab.
+    Liefert (erfolgreiche_konten, konten_gesamt, sekunden).
+    """
+    started = time.monotonic()
+    accounts = load_accounts_for_user(user_id)
+    try:
+        if full or refresh:
+            refresh_ids = {account["id"] for account in accounts} if refresh else ()
+            ok = train_full_for_user(user_id, username, accounts, refresh_ids)
+        else:
+            ok = train_incremental_for_user(user_id, username, accounts)
     except Exception as e:
-        msg = f"Fehler beim Modelltraining oder Speichern: {e}"
+        msg = f"Unerwarteter Fehler beim Training von {username}: {e}"
         logger.error(msg)
-        write_train_log(account["user_id"], account["username"], f"❌ {msg}")
+        log_accounts(accounts, f"❌ {msg}")
+        ok = 0
+    return ok, len(accounts), time.monotonic() - started
+
 
-def train_all():
+def load_train_jobs(refresh=False):
+    """
+    Liefert die Jobs [{user_id, username, accounts, samples}] – größte zuerst.
+    samples schätzt die Korpusgröße; Konten, die erst per IMAP geladen werden, zählen voll.
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute("""
+            SELECT u.id AS user_id, u.username, a.id AS account_id, a.username AS account_username,
+                   (SELECT COUNT(*) FROM training_corpus c WHERE c.account_id = a.id AND c.label = 1) AS spam,
+                   (SELECT COUNT(*) FROM training_corpus c WHERE c.account_id = a.id AND c.label = 0) AS ham
+            FROM users u
+            JOIN accounts a ON a.user_id = u.id
+        """)
+        rows = cursor.fetchall()
+
+    jobs = {}
+    for row in rows:
+        job = jobs.setdefault(row["user_id"], {
+            "user_id": row["user_id"], "username": row["username"], "accounts": [], "samples": 0,
+        })
+        job["accounts"].append(row["account_username"])
+        if refresh or not row["spam"] or not row["ham"]:
+            job["samples"] += SPAM_MAIL_LIMIT + HAM_MAIL_LIMIT
+        else:
+            job["samples"] += min(row["spam"], SPAM_MAIL_LIMIT) + min(row["ham"], HAM_MAIL_LIMIT)
+    return sorted(jobs.values(), key=lambda job: job["samples"], reverse=True)
+
 
-        cursor.execute("SELECT * FROM users")
-        users = cursor.fetchall()
+def estimate_job_mb(job):
+    return TRAIN_JOB_BASE_MB + job["samples"] * TRAIN_MB_PER_SAMPLE
+
+
+def memory_budget_mb():
+    if TRAIN_MEMORY_BUDGET_MB:
+        return TRAIN_MEMORY_BUDGET_MB
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024 * 0.8
+    except OSError:
+        pass
+    return float("inf")
+
+
+def report_progress(job, done, total, result=None, error=None):
+    if error is None:
+        ok, count, seconds = result
+        status = "✅" if ok == count else "⚠️"
+        msg = f"{status} Benutzer {job['username']}: {ok}/{count} Konten trainiert in {seconds:.1f}s"
+    else:
+        msg = f"❌ Benutzer {job['username']}: Training abgebrochen: {error}"
+    line = f"[{done}/{total}] {msg}"
+    (logger.info if error is None else logger.error)(line)
+    for account_name in job["accounts"]:
+        write_train_log(job["user_id"], account_name, line)
+
+
+def _next_fitting(pending, used_mb, budget_mb, running):
+    """Größter wartender Job, der noch ins Speicherbudget passt (ohne laufende Jobs: immer der größte)."""
+    if not running:
+        return pending[0]
+    for job in pending:
+        if used_mb + estimate_job_mb(job) <= budget_mb:
+            return job
+    return None
+
+
+def train_parallel(jobs, workers, refresh=False, full=False):
+    """
+    Verteilt die Benutzer-Jobs auf einen Prozess-Pool. Ein abgestürzter Prozess
+    (z. B. OOM-Kill) zerstört den Pool – dann wird er neu aufgebaut und die
+    unterbrochenen Jobs werden einmal wiederholt.
+    """
+    total = len(jobs)
+    budget_mb = memory_budget_mb()
+    pending = list(jobs)
+    attempts = {job["user_id"]: 0 for job in jobs}
+    done = failed = 0
+    ctx = multiprocessing.get_context("spawn")
+
+    while pending:
+        running = {}
+        used_mb = 0.0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            while pending or running:
+                while pending and len(running) < workers:
+                    job = _next_fitting(pending, used_mb, budget_mb, running)
+                    if job is None:
+                        break
+                    pending.remove(job)
+                    attempts[job["user_id"]] += 1
+                    running[pool.submit(train_user, job["user_id"], job["username"], refresh, full)] = job
+                    used_mb += estimate_job_mb(job)
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    job = running.pop(future)
+                    used_mb -= estimate_job_mb(job)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        if attempts[job["user_id"]] < 2:
+                            pending.append(job)
+                            continue
+                        done += 1
+                        failed += 1
+                        report_progress(job, done, total, error="Prozess abgestürzt")
+                        continue
+                    except Exception as e:
+                        done += 1
+                        failed += 1
+                        report_progress(job, done, total, error=e)
+                        continue
+                    done += 1
+                    report_progress(job, done, total, result)
+                if broken:
+                    # Alle übrigen Futures des Pools sind ebenfalls verloren
+                    for future, job in running.items():
+                        if attempts[job["user_id"]] < 2:
+                            pending.append(job)
+                        else:
+                            done += 1
+                            failed += 1
+                            report_progress(job, done, total, error="Prozess abgestürzt")
+                    running.clear()
+                    pending.sort(key=lambda job: job["samples"], reverse=True)
+                    break
+    return done - failed, failed
+
+
+def train_all(refresh=False, workers=TRAIN_WORKERS, full=False):
+    """
+    Trainiert alle Benutzer – inkrementell, mit full=True vollständig neu.
+    Mit workers > 1 parallel in einem Prozess-Pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = load_train_jobs(refresh)
+    if not jobs:
+        return
+    started = time.monotonic()
+    logger.info(f"🔄 Training für {len(jobs)} Benutzer gestartet ({min(workers, len(jobs))} Prozesse)")
+
+    if workers <= 1 or len(jobs) == 1:
+        failed = 0
+        for done, job in enumerate(jobs, start=1):
+            try:
+                report_progress(job, done, len(jobs), train_user(job["user_id"], job["username"], refresh, full))
+            except Exception as e:
+                failed += 1
+                report_progress(job, done, len(jobs), error=e)
+        ok = len(jobs) - failed
+    else:
+        ok, failed = train_parallel(jobs, min(workers, len(jobs)), refresh, full)
 
-        for user in users:
-            cursor.execute("SELECT * FROM accounts WHERE user_id = ?", (user["id"],))
-            accounts = cursor.fetchall()
-            for account in accounts:
-                train_model_for_account(account, user["username"])
-    conn.close()
+    logger.info(f"🏁 Training beendet: {ok} Benutzer erfolgreich, {failed} fehlgeschlagen, "
+                f"{time.monotonic() - started:.1f}s")
 
 
 if __name__ == "__main__":
-    train_all()
+    parser = argparse.ArgumentParser(description="Spam-Modelle aller Benutzer neu trainieren")
+    parser.add_argument("--full", action="store_true",
+                        help="vollständig neu trainieren statt nur neue Mails nachzutrainieren")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Korpus vor dem Training per IMAP auffrischen (impliziert --full)")
+    parser.add_argument("--workers", type=int, default=TRAIN_WORKERS,
+                        help="Anzahl paralleler Prozesse (1 = seriell, 0 = alle CPU-Kerne)")
+    parser.add_argument("--base", action="store_true",
+                        help='gemeinsames Basis-Modell neu trainieren (MODEL_LAYOUT = "shared"), '
+                             'danach alle Benutzer vollständig darauf')
+    args = parser.parse_args()
+    if args.base:
+        if MODEL_LAYOUT != "shared":
+            parser.error('--base setzt MODEL_LAYOUT = "shared" in core/config.py voraus')
+        if train_base() is None:
+            raise SystemExit(1)
+        # Die Benutzer-Zählungen gehören zum Vokabular der alten Basis – neu aus dem Korpus
+        args.full = True
+    train_all(refresh=args.refresh, workers=args.workers, full=args.full)
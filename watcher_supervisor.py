@@ -0,0 +1,257 @@
+# watcher_supervisor.py
+# Startet den IDLE-Watcher in mehreren Worker-Prozessen.
+# Die Konten werden per konsistentem Hashing auf die Worker verteilt und
+# abgestürzte oder hängende Worker (keine Statusmeldung mehr) werden neu gestartet. Jeder Worker gleicht seinen Anteil
+# selbst mit der Tabelle accounts ab (AccountRegistry) – neue, geänderte oder
+# gelöschte Konten betreffen nur den IDLE-Thread des jeweiligen Kontos.
+#
+# Aufruf:
+#   python3 watcher_supervisor.py [run] [--workers N]
+#   python3 watcher_supervisor.py status
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+from core.config import (ACCOUNT_REFRESH_INTERVAL, WATCHER_HANG_INTERVALS, WATCHER_HEARTBEAT_INTERVAL,
+                         WATCHER_REBALANCE_INTERVAL, WATCHER_STATUS_FILE,
+                         WATCHER_WORKERS)
+from core.database import get_db_connection
+from core.logger import write_system_log
+from core.sharding import HashRing
+
+DEBUG = False
+
+
+def worker_main(worker_id, worker_ids, status_queue):
+    """Einstiegspunkt eines Worker-Prozesses: betreibt die IDLE-Threads seiner Konten."""
+    from core import metrics
+    import idle_mail_watcher
+
+    ring = HashRing(worker_ids)
+    registry = idle_mail_watcher.start_all_idles(lambda aid: ring.owner(aid) == worker_id, block=False)
+
+    last_refresh = last_heartbeat = 0.0
+    while True:
+        now = time.time()
+        if now - last_refresh >= ACCOUNT_REFRESH_INTERVAL:
+            registry.refresh()
+            last_refresh = now
+        if now - last_heartbeat >= WATCHER_HEARTBEAT_INTERVAL:
+            try:
+                status_queue.put({
+                    "worker": worker_id,
+                    "pid": os.getpid(),
+                    "ts": now,
+                    "accounts": registry.account_ids(),
+                    "cpu_seconds": round(time.process_time(), 2),
+                    "metrics": metrics.snapshot(),
+                })
+            except Exception:
+                pass
+            last_heartbeat = now
+        time.sleep(1)
+
+
+def load_account_index():
+    """Liefert {account_id: "email (benutzer)"} für alle Konten."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT a.id, a.email, u.username
+            FROM accounts a
+            JOIN users u ON a.user_id = u.id
+        """)
+        return {row["id"]: f"{row['email']} ({row['username']})" for row in cursor.fetchall()}
+
+
+class WatcherSupervisor:
+    def __init__(self, num_workers=WATCHER_WORKERS):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.status_queue = self.ctx.Queue()
+        self.worker_ids = [f"worker-{i}" for i in range(num_workers)]
+        self.ring = HashRing(self.worker_ids)
+        self.workers = {
+            wid: {"process": None, "accounts": [], "restarts": 0,
+                  "next_start": 0.0, "started": 0.0, "heartbeat": None}
+            for wid in self.worker_ids
+        }
+        self.account_index = {}
+
+    # -------------------------------------------------------
+    # Worker-Verwaltung
+    # -------------------------------------------------------
+    def start_worker(self, wid):
+        w = self.workers[wid]
+        p = self.ctx.Process(target=worker_main, name=wid,
+                             args=(wid, self.worker_ids, self.status_queue), daemon=True)
+        p.start()
+        w["process"] = p
+        w["started"] = time.time()
+        w["heartbeat"] = None
+        if DEBUG: print(f"[DEBUG] {wid} gestartet (PID {p.pid}, {len(w['accounts'])} Konten)")
+
+    def stop_worker(self, wid):
+        p = self.workers[wid]["process"]
+        if p and p.is_alive():
+            p.terminate()
+            p.join(timeout=10)
+            if p.is_alive():
+                p.kill()
+        self.workers[wid]["process"] = None
+
+    def rebalance(self):
+        """
+        Berechnet die Soll-Zuordnung für die Statusanzeige. Die Worker übernehmen
+        neue bzw. geben gelöschte Konten selbst ab – ein Neustart ist nicht nötig.
+        """
+        try:
+            self.account_index = load_account_index()
+        except Exception as e:
+            write_system_log(f"[Supervisor] Kontenliste konnte nicht geladen werden: {e}")
+            return
+
+        assignment = self.ring.assign(sorted(self.account_index))
+        for wid in self.worker_ids:
+            new_accounts = sorted(assignment.get(wid, []))
+            w = self.workers[wid]
+            if new_accounts != w["accounts"]:
+                write_system_log(f"[Supervisor] {wid}: Konten {len(w['accounts'])} → {len(new_accounts)}")
+                w["accounts"] = new_accounts
+
+    def silence(self, w, now):
+        """Sekunden seit der letzten Statusmeldung eines Workers (bzw. seit seinem Start)."""
+        return now - max((w["heartbeat"] or {}).get("ts") or 0.0, w["started"])
+
+    def check_workers(self):
+        """Startet abgestürzte und hängende Worker mit exponentiellem Backoff neu."""
+        now = time.time()
+        hang_after = WATCHER_HANG_INTERVALS * WATCHER_HEARTBEAT_INTERVAL
+        for wid, w in self.workers.items():
+            p = w["process"]
+            if p and p.is_alive():
+                silent = self.silence(w, now)
+                if silent <= hang_after:
+                    continue
+                # Prozess lebt, meldet sich aber nicht mehr (z. B. hängender Import oder Deadlock)
+                write_system_log(f"[Supervisor] {wid} hängt (PID {p.pid}, seit {silent:.0f}s keine Statusmeldung) – wird beendet")
+                self.stop_worker(wid)
+            if p is not None:
+                write_system_log(f"[Supervisor] {wid} beendet (Exitcode {p.exitcode}) – Neustart geplant")
+                w["process"] = None
+                w["restarts"] += 1
+                w["next_start"] = now + min(60, 2 ** w["restarts"])
+            if now >= w["next_start"]:
+                self.start_worker(wid)
+
+    def drain_heartbeats(self):
+        while True:
+            try:
+                hb = self.status_queue.get_nowait()
+            except queue.Empty:
+                break
+            if hb.get("worker") in self.workers:
+                self.workers[hb["worker"]]["heartbeat"] = hb
+
+    def write_status(self):
+        status = {"updated": time.time(), "supervisor_pid": os.getpid(), "workers": []}
+        for wid, w in self.workers.items():
+            p = w["process"]
+            hb = w["heartbeat"] or {}
+            counters = (hb.get("metrics") or {}).get("counters", {})
+            status["workers"].append({
+                "worker": wid,
+                "pid": p.pid if p else None,
+                "alive": bool(p and p.is_alive()),
+                "restarts": w["restarts"],
+                "accounts": [{"id": a, "name": self.account_index.get(a, "?")} for a in w["accounts"]],
+                "accounts_running": len(hb.get("accounts", [])),
+                "last_heartbeat": hb.get("ts"),
+                "cpu_seconds": hb.get("cpu_seconds"),
+                "mails_processed": counters.get("mails_processed", 0),
+                "ml_calls": counters.get("ml_calls", 0),
+                "campaign_hits": counters.get("campaign_hits", 0),
+                "campaign_misses": counters.get("campaign_misses", 0),
+                "verdict_cache_hits": counters.get("verdict_cache_hits", 0),
+                "verdict_cache_misses": counters.get("verdict_cache_misses", 0),
+                "parse_cache_hits": counters.get("parse_cache_hits", 0),
+                "header_rules": {name.split(":", 1)[1]: n for name, n in counters.items()
+                                 if name.startswith("header_rule:")},
+            })
+        tmp_path = WATCHER_STATUS_FILE + ".tmp"
+        os.makedirs(os.path.dirname(WATCHER_STATUS_FILE), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(status, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, WATCHER_STATUS_FILE)
+
+    def run(self):
+        write_system_log(f"[Supervisor] Start mit {len(self.worker_ids)} Workern")
+        self.rebalance()
+        for wid in self.worker_ids:
+            self.start_worker(wid)
+        last_rebalance = time.time()
+        try:
+            while True:
+                self.drain_heartbeats()
+                self.check_workers()
+                if time.time() - last_rebalance >= WATCHER_REBALANCE_INTERVAL:
+                    self.rebalance()
+                    last_rebalance = time.time()
+                try:
+                    self.write_status()
+                except Exception as e:
+                    if DEBUG: print(f"[!] Status konnte nicht geschrieben werden: {e}")
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for wid in self.worker_ids:
+                self.stop_worker(wid)
+            write_system_log("[Supervisor] Beendet")
+
+
+def print_status():
+    try:
+        with open(WATCHER_STATUS_FILE, encoding="utf-8") as f:
+            status = json.load(f)
+    except FileNotFoundError:
+        print("[!] Kein Status vorhanden – läuft der Supervisor?")
+        return 1
+
+    age = time.time() - status.get("updated", 0)
+    print(f"Supervisor PID {status.get('supervisor_pid')} – Stand vor {age:.0f}s")
+    for w in status["workers"]:
+        state = "läuft" if w["alive"] else "gestoppt"
+        cpu = w["cpu_seconds"] if w["cpu_seconds"] is not None else "-"
+        print(f"\n{w['worker']} (PID {w['pid'] or '-'}, {state}, Neustarts: {w['restarts']})")
+        print(f"  Konten: {len(w['accounts'])} (aktiv: {w.get('accounts_running', 0)}), Mails: {w['mails_processed']}, "
+              f"ML-Aufrufe: {w['ml_calls']}, CPU: {cpu}s")
+        lookups = w.get("campaign_hits", 0) + w.get("campaign_misses", 0)
+        if lookups:
+            print(f"  Spam-Wellen: {w['campaign_hits']} Treffer / {lookups} Prüfungen "
+                  f"({w['campaign_hits'] / lookups:.0%})")
+        lookups = w.get("verdict_cache_hits", 0) + w.get("verdict_cache_misses", 0)
+        if lookups:
+            print(f"  Mehrfachzustellungen: {w['verdict_cache_hits']} Urteile / {lookups} Prüfungen "
+                  f"({w['verdict_cache_hits'] / lookups:.0%}), {w.get('parse_cache_hits', 0)} Mails nicht neu aufbereitet")
+        if w.get("header_rules"):
+            hits = ", ".join(f"{name}: {n}" for name, n in sorted(w["header_rules"].items(), key=lambda x: -x[1]))
+            print(f"  Header-Regeln: {hits}")
+        for acc in w["accounts"]:
+            print(f"    - [{acc['id']}] {acc['name']}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mehrprozess-Supervisor für den IDLE-Watcher")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "status"])
+    parser.add_argument("--workers", type=int, default=WATCHER_WORKERS)
+    args = parser.parse_args()
+
+    if args.command == "status":
+        sys.exit(print_status())
+    WatcherSupervisor(args.workers).run()